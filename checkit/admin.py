@@ -1,12 +1,53 @@
 """
 This file specifies how the default Django
 admin pages will look.
+
+The tables can be large, so every changelist joins its foreign keys in
+the same query, picks related objects by id instead of listing every
+row in a dropdown, only searches indexed prefixes, and skips counting
+the whole table.
 """
 
 from django.contrib import admin
 from .models import Check, Account, Company
 
-# Register our models to the admin pages
-admin.site.register(Check)
-admin.site.register(Account)
-admin.site.register(Company)
\ No newline at end of file
+
+@admin.register(Check)
+class CheckAdmin(admin.ModelAdmin):
+    list_display = ('number', 'account', 'user', 'amount', 'amount_paid', 'paid', 'date', 'date_created')
+    list_select_related = ('account', 'user')
+    list_filter = ('paid',)
+    raw_id_fields = ('account', 'user')
+    search_fields = ('^account__name',)  # Uses the UPPER(name) prefix index on accounts
+    date_hierarchy = 'date_created'
+    show_full_result_count = False
+
+
+@admin.register(Account)
+class AccountAdmin(admin.ModelAdmin):
+    list_display = ('name', 'number', 'route', 'company', 'date_created')
+    list_select_related = ('company',)
+    autocomplete_fields = ('company',)
+    search_fields = ('^name',)
+    date_hierarchy = 'date_created'
+    show_full_result_count = False
+
+    def get_search_results(self, request, queryset, search_term):
+        """
+        Searches name prefixes, and for numbers also account and routing
+        number prefixes. Those are matched case-sensitively, so they can
+        use their varchar_pattern_ops indexes.
+        """
+        results, use_distinct = super().get_search_results(request, queryset, search_term)
+        term = search_term.strip()
+        if term.isdigit():
+            results |= queryset.filter(number__startswith=term) | queryset.filter(route__startswith=term)
+        return results, use_distinct
+
+
+@admin.register(Company)
+class CompanyAdmin(admin.ModelAdmin):
+    list_display = ('name', 'city', 'state', 'wait_period', 'late_fee', 'date_created')
+    search_fields = ('^name',)  # Uses the UPPER(name) prefix index on companies
+    date_hierarchy = 'date_created'
+    show_full_result_count = False
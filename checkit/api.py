@@ -0,0 +1,324 @@
+"""
+The JSON API. Integrations can read and write companies, accounts,
+checks, and payments here instead of scraping the index pages. Users
+see exactly what they would see on the index pages.
+
+Reading (GET) takes these parameters:
+    fields=id,name  Only return these fields (id is always returned)
+    cursor=<id>     Start after this row, from "next_cursor" of the last page
+    limit=<n>       Rows per page, 100 by default and at most 1000
+Rows are read with .values(), so no model objects are created.
+
+Writing takes a JSON body:
+    POST   an object, or a list of objects, to create them in bulk
+    PATCH  a list of objects with an "id" to update them in bulk
+
+Integrations log in with HTTP Basic auth (Authorization: Basic ...) on
+every request. A browser logged in with the session cookie must also send
+the csrftoken cookie in an X-CSRFToken header when writing.
+"""
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.http import JsonResponse
+from django.utils import timezone
+from decimal import Decimal, InvalidOperation
+from . import audit
+from .decorators import api_login_required
+from .models import Check, Account, Company
+from .reports import drop_report_months
+from .views import check_scope, account_scope, company_scope
+import datetime
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 1000
+
+# The fields that can be read and written for each kind of object
+COMPANY_FIELDS = ['id', 'name', 'desc', 'wait_period', 'street', 'city', 'state', 'zip_code', 'late_fee', 'date_created']
+COMPANY_WRITABLE = ['name', 'desc', 'wait_period', 'street', 'city', 'state', 'zip_code', 'late_fee']
+COMPANY_REQUIRED = ['name', 'wait_period', 'street', 'city', 'state', 'zip_code', 'late_fee']
+ACCOUNT_FIELDS = ['id', 'company', 'name', 'number', 'route', 'street', 'city', 'state', 'zip_code', 'date_created']
+ACCOUNT_WRITABLE = ['name', 'number', 'route', 'street', 'city', 'state', 'zip_code']
+ACCOUNT_REQUIRED = ACCOUNT_WRITABLE
+CHECK_FIELDS = ['id', 'user', 'account', 'account__name', 'number', 'amount', 'paid', 'amount_paid', 'date',
+                'date_created', 'letter1_date', 'letter2_date', 'letter3_date', 'paid_date']
+CHECK_WRITABLE = ['number', 'amount', 'date', 'paid']
+CHECK_REQUIRED = ['number', 'amount', 'date']
+PAYMENT_FIELDS = ['id', 'account', 'account__name', 'amount', 'amount_paid', 'paid', 'paid_date']
+
+
+def api_error(message, status=400):
+    """Returns a JSON error response"""
+    return JsonResponse({'error': message}, status=status)
+
+
+def read_body(request):
+    """
+    Reads the JSON body of a request
+    :param request: The request
+    :return: A list of objects (a single object is put in a list)
+    """
+    data = json.loads(request.body.decode('utf-8'))
+    if isinstance(data, dict):
+        data = [data]
+    if not isinstance(data, list) or not all(isinstance(x, dict) for x in data):
+        raise ValueError('Expected an object or a list of objects.')
+    return data
+
+
+def list_response(request, objects, allowed):
+    """
+    Returns one page of objects as JSON
+    :param request: The request, with the fields, cursor, and limit parameters
+    :param objects: The objects the user has access to
+    :param allowed: The fields that may be returned
+    :return: The response
+    """
+    fields = request.GET.get('fields')
+    fields = [x.strip() for x in fields.split(',') if x.strip()] if fields else list(allowed)
+    unknown = [x for x in fields if x not in allowed]
+    if unknown:
+        return api_error('Unknown fields: {}'.format(', '.join(unknown)))
+    if 'id' not in fields:
+        fields.insert(0, 'id')
+
+    try:
+        limit = min(max(int(request.GET.get('limit', DEFAULT_LIMIT)), 1), MAX_LIMIT)
+        cursor = int(request.GET['cursor']) if request.GET.get('cursor') else None
+    except ValueError:
+        return api_error('The limit and cursor must be numbers.')
+
+    # Walk the primary key index, and fetch one extra row to see if there's a next page
+    objects = objects.order_by('pk')
+    if cursor is not None:
+        objects = objects.filter(pk__gt=cursor)
+    rows = list(objects.values(*fields)[:limit + 1])
+    next_cursor = rows[limit - 1]['id'] if len(rows) > limit else None
+    return JsonResponse({'results': rows[:limit], 'next_cursor': next_cursor})
+
+
+def apply(obj, data, writable):
+    """
+    Sets fields on an object from request data and validates them
+    :param obj: The object to change
+    :param data: The request data
+    :param writable: The fields that may be written
+    :return: The names of the fields that were set
+    """
+    unknown = [x for x in data if x not in writable]
+    if unknown:
+        raise ValidationError({x: 'This field cannot be written.' for x in unknown})
+    for field, value in data.items():
+        setattr(obj, field, value)
+    obj.full_clean(exclude=[f.name for f in obj._meta.fields if f.name not in data], validate_unique=False)
+    return list(data)
+
+
+def build(model, data, writable, required, **extra):
+    """
+    Makes a new, validated object that hasn't been saved yet
+    :param model: The model of the object
+    :param data: The request data
+    :param writable: The fields that may be written
+    :param required: The fields that must be given
+    :param extra: Fields that are set by the server, such as the user
+    :return: The object
+    """
+    missing = [x for x in required if data.get(x) in (None, '')]
+    if missing:
+        raise ValidationError({x: 'This field is required.' for x in missing})
+    obj = model(**extra)
+    apply(obj, data, writable)
+    return obj
+
+
+def error_dict(error):
+    """Turns a validation error into something JSON can show"""
+    return error.message_dict if hasattr(error, 'error_dict') else {'__all__': error.messages}
+
+
+def create_response(request, model, prepare):
+    """
+    Creates objects in bulk from the request body
+    :param request: The request
+    :param model: The model of the objects
+    :param prepare: A function that makes a validated object from request data
+    :return: The response with the new ids
+    """
+    try:
+        items = read_body(request)
+    except ValueError as e:
+        return api_error(str(e))
+
+    objects, errors = [], {}
+    for i, data in enumerate(items):
+        try:
+            objects.append(prepare(data))
+        except ValidationError as e:
+            errors[i] = error_dict(e)
+    if errors:
+        return JsonResponse({'errors': errors}, status=400)
+
+    created = model.objects.bulk_create(objects)
+    for obj in created:
+        audit.saved(obj, created=True)  # bulk_create doesn't send signals
+    logger.info('API created %s %s objects', len(created), model.__name__)
+    return JsonResponse({'created': [x.pk for x in created]}, status=201)
+
+
+def update_response(request, objects, writable, changed=None):
+    """
+    Updates objects in bulk from the request body
+    :param request: The request
+    :param objects: The objects the user has access to
+    :param writable: The fields that may be written
+    :param changed: An optional function called with (object, old values, fields)
+                    that returns any other fields it changed
+    :return: The response with the updated ids
+    """
+    try:
+        items = read_body(request)
+        ids = [int(x.pop('id')) for x in items]
+    except (KeyError, TypeError, ValueError):
+        return api_error('Expected a list of objects, each with an id.')
+
+    found = objects.in_bulk(ids)
+    missing = [x for x in ids if x not in found]
+    if missing:
+        return api_error('Not found: {}'.format(', '.join(str(x) for x in missing)), 404)
+
+    fields, errors = set(), {}
+    for pk, data in zip(ids, items):
+        obj = found[pk]
+        old = {x: getattr(obj, x) for x in data if hasattr(obj, x)}
+        try:
+            set_fields = apply(obj, data, writable)
+        except ValidationError as e:
+            errors[pk] = error_dict(e)
+            continue
+        fields.update(set_fields)
+        if changed:
+            fields.update(changed(obj, old, set_fields))
+    if errors:
+        return JsonResponse({'errors': errors}, status=400)
+
+    if fields:
+        # bulk_update skips auto_now, so date_updated is set by hand
+        now = timezone.now()
+        for obj in found.values():
+            obj.date_updated = now
+        objects.model.objects.bulk_update(found.values(), list(fields) + ['date_updated'])
+        for obj in found.values():
+            audit.saved(obj)  # bulk_update doesn't send signals
+            if isinstance(obj, Check):
+                drop_report_months(Check, obj)
+    logger.info('API updated %s %s objects', len(found), objects.model.__name__)
+    return JsonResponse({'updated': ids})
+
+
+def check_paid_changed(check, old, fields):
+    """Keeps the paid date in line with the paid flag, like the check edit page"""
+    if 'paid' in fields and check.paid != old['paid']:
+        check.paid_date = datetime.datetime.now().date() if check.paid else None
+        return ['paid_date']
+    return []
+
+
+@api_login_required
+def company_list(request):
+    """Reads companies. Admins can also create and update them."""
+    if request.method == 'GET':
+        return list_response(request, company_scope(request.user), COMPANY_FIELDS)
+    if not request.user.profile.admin():
+        return api_error('You do not have permission to change companies.', 403)
+    if request.method == 'POST':
+        return create_response(request, Company, lambda data: build(Company, data, COMPANY_WRITABLE, COMPANY_REQUIRED))
+    if request.method == 'PATCH':
+        return update_response(request, Company.objects.all(), COMPANY_WRITABLE)
+    return api_error('Method not allowed.', 405)
+
+
+@api_login_required
+def account_list(request):
+    """Reads, creates, and updates the accounts a user has access to."""
+    if request.method == 'GET':
+        return list_response(request, account_scope(request.user), ACCOUNT_FIELDS)
+    if request.method == 'POST':
+        companies = company_scope(request.user)
+        admin = request.user.profile.admin_not_simulating()
+
+        def prepare(data):
+            # Admins see every company, so they must say which one the account is under
+            data = dict(data)
+            company = request.user.profile.company
+            if admin:
+                company = companies.filter(pk=data.pop('company', None)).first()
+                if company is None:
+                    raise ValidationError({'company': 'Company not found.'})
+            return build(Account, data, ACCOUNT_WRITABLE, ACCOUNT_REQUIRED, company=company)
+
+        return create_response(request, Account, prepare)
+    if request.method == 'PATCH':
+        return update_response(request, account_scope(request.user), ACCOUNT_WRITABLE)
+    return api_error('Method not allowed.', 405)
+
+
+@api_login_required
+def check_list(request):
+    """Reads, creates, and updates the checks a user has access to."""
+    if request.method == 'GET':
+        return list_response(request, check_scope(request.user), CHECK_FIELDS)
+    if request.method == 'POST':
+        accounts = account_scope(request.user)
+
+        def prepare(data):
+            # The check goes under one of the user's accounts
+            data = dict(data)
+            account = accounts.filter(pk=data.pop('account', None)).first()
+            if account is None:
+                raise ValidationError({'account': 'Account not found.'})
+            check = build(Check, data, CHECK_WRITABLE, CHECK_REQUIRED, user=request.user, account=account)
+            # A new check starts out unpaid, so one posted as paid gets today's paid date
+            check_paid_changed(check, {'paid': False}, data)
+            return check
+
+        return create_response(request, Check, prepare)
+    if request.method == 'PATCH':
+        return update_response(request, check_scope(request.user), CHECK_WRITABLE, check_paid_changed)
+    return api_error('Method not allowed.', 405)
+
+
+@api_login_required
+def payment_list(request):
+    """
+    Reads the checks that have payments on them, and posts payments.
+    Payments are a list of objects like {"check": 1, "amount": "10.00"}.
+    """
+    if request.method == 'GET':
+        return list_response(request, check_scope(request.user).filter(amount_paid__gt=0), PAYMENT_FIELDS)
+    if request.method != 'POST':
+        return api_error('Method not allowed.', 405)
+
+    try:
+        items = read_body(request)
+        payments = [(int(x['check']), Decimal(str(x['amount']))) for x in items]
+    except (KeyError, TypeError, ValueError, InvalidOperation):
+        return api_error('Expected a list of objects, each with a check and an amount.')
+    # NaN can't be compared and Infinity can't be saved, so both are turned away with the rest
+    if any(not amount.is_finite() or amount <= 0 for pk, amount in payments):
+        return api_error('Payment amounts must be positive.')
+
+    with transaction.atomic():
+        # Lock the checks so two payments on the same check can't overwrite each other
+        checks = check_scope(request.user).select_related('account__company').select_for_update(of=('self',))
+        checks = checks.in_bulk([pk for pk, amount in payments])
+        missing = [pk for pk, amount in payments if pk not in checks]
+        if missing:
+            return api_error('Not found: {}'.format(', '.join(str(x) for x in missing)), 404)
+        results = [{'check': pk, 'message': checks[pk].pay(amount)} for pk, amount in payments]
+    logger.info('API posted %s payments', len(results))
+    return JsonResponse({'results': results})
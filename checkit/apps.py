@@ -10,3 +10,12 @@ In this case, it's just checkit.
 """
 class CheckitConfig(AppConfig):
     name = 'checkit'
+
+    def ready(self):
+        """Connects the signal receivers, once the models are loaded"""
+        from . import audit, reports, snapshots, typeahead
+        audit.connect()
+        reports.connect()
+        typeahead.connect()
+        # Last, so the receivers above see the values from before each save
+        snapshots.connect(audit.AUDITED)
@@ -0,0 +1,124 @@
+"""
+The audit log. Every change to a check, account, company, or profile is
+kept as an AuditEvent. Saves are picked up by signals, comparing the
+fields against their values when the object was loaded (see snapshots). Bulk updates,
+deletes, and API writes don't send signals, so the views record those
+themselves with record().
+
+During a request, events are kept in memory and written with a single
+bulk_create once the response is ready (see AuditMiddleware), so auditing
+costs one insert per request no matter how much was changed. If the view
+raises, its changes were rolled back, and so are its events. Outside a
+request, such as in a management command, events are written right away.
+"""
+
+from django.db.models.signals import post_save
+from .models import AuditEvent, Check, Account, Company, Profile
+from . import snapshots
+import json
+import threading
+
+# The models that are audited
+AUDITED = (Check, Account, Company, Profile)
+
+# Fields that change on every save and aren't worth recording
+IGNORED = {'date_created', 'date_updated'}
+
+# The events of the request being handled on this thread
+_buffer = threading.local()
+
+
+def begin(request):
+    """Starts keeping the events of a request in memory"""
+    _buffer.request = request
+    _buffer.events = []
+
+
+def flush():
+    """
+    Writes the events of the request, with the user who made the request
+    :return: The number of events written
+    """
+    events, request = getattr(_buffer, 'events', None), getattr(_buffer, 'request', None)
+    _buffer.events = _buffer.request = None
+    if not events:
+        return 0
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_authenticated:
+        for event in events:
+            event.user_id = event.user_id or user.pk
+    AuditEvent.objects.bulk_create(events)
+    return len(events)
+
+
+def event(action, model, object_id, changes=None, user=None):
+    """Makes an unsaved event, see record()"""
+    return AuditEvent(user=user, action=action, model=model.__name__, object_id=object_id,
+                      changes=json.dumps(changes, default=str) if changes else '')
+
+
+def record(action, model, object_id, changes=None, user=None):
+    """
+    Records a change
+    :param action: 'create', 'update', 'delete', or 'pay'
+    :param model: The model of the object that changed
+    :param object_id: The id of the object
+    :param changes: A dict of the changed fields and their new values
+    :param user: Who made the change, by default the user of the request
+    """
+    record_many(action, model, [object_id], changes, user)
+
+
+def record_many(action, model, ids, changes=None, user=None):
+    """
+    Records the same change to many objects, for bulk updates and deletes,
+    which don't send signals. Outside a request, they are written with one insert.
+    :param ids: The ids of the objects
+    See record() for the other parameters.
+    """
+    new = [event(action, model, pk, changes, user) for pk in ids]
+    events = getattr(_buffer, 'events', None)
+    if events is None:
+        AuditEvent.objects.bulk_create(new)
+    else:
+        events.extend(new)
+
+
+def fields(instance):
+    """The loaded field values of an object, without the ignored ones"""
+    return {k: v for k, v in snapshots.fields(instance).items() if k not in IGNORED}
+
+
+def changed_fields(instance):
+    """The fields of an object that changed since it was loaded or last saved, with their new values"""
+    old = snapshots.loaded(instance)
+    return {k: v for k, v in fields(instance).items() if k not in old or old[k] != v}
+
+
+def saved(instance, created=False):
+    """
+    Records the save of an object, if any of its fields changed
+    :param instance: The object that was saved
+    :param created: Whether or not the object is new
+    """
+    changes = fields(instance) if created else changed_fields(instance)
+    if changes:
+        record('create' if created else 'update', type(instance), instance.pk, changes)
+
+
+def audit_save(sender, instance, created, raw=False, **kwargs):
+    """Records a save"""
+    if not raw:  # Not while loading fixtures
+        saved(instance, created)
+
+
+def discard():
+    """Drops the events of the request, whose changes were rolled back"""
+    if getattr(_buffer, 'events', None):
+        _buffer.events = []
+
+
+def connect():
+    """Connects the signal receivers, from CheckitConfig.ready()"""
+    for model in AUDITED:
+        post_save.connect(audit_save, sender=model, dispatch_uid='audit_save')
@@ -5,7 +5,15 @@ as admin, supervisor, and login access.
 """
 
 from django.contrib import messages
+from django.contrib.auth import authenticate
+from django.http import JsonResponse
 from django.shortcuts import redirect
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.middleware.csrf import CsrfViewMiddleware
+from django.utils.http import quote_etag
+from django.views.decorators.csrf import csrf_exempt
+import base64
+import binascii
 
 
 def logout_required(function):
@@ -59,4 +67,87 @@ def supervisor_required(function):
 
     wrap.__doc__ = function.__doc__
     wrap.__name__ = function.__name__
-    return wrap
\ No newline at end of file
+    return wrap
+
+
+def basic_auth_user(request):
+    """
+    The user logging in with HTTP Basic auth on a request
+    :param request: The request, with an Authorization header
+    :return: The user, or None if the username or password is wrong
+    """
+    method, _, credentials = request.META['HTTP_AUTHORIZATION'].partition(' ')
+    if method.lower() != 'basic':
+        return None
+    try:
+        username, _, password = base64.b64decode(credentials.strip()).decode('utf-8').partition(':')
+    except (binascii.Error, UnicodeDecodeError):
+        return None
+    return authenticate(request, username=username, password=password)
+
+
+def api_login_required(function):
+    """
+    The user must be logged in for an API request to be processed.
+    Unlike login_required, it answers with a JSON error instead of a redirect.
+    Integrations log in with HTTP Basic auth on every request. Another site
+    can't make a browser send those credentials, so those requests skip the
+    CSRF check. Requests logged in with the session cookie must send the
+    csrftoken cookie back in an X-CSRFToken header, like the pages do.
+    :param function: The view function
+    :return: A 401 or 403 response or the function return value
+    """
+    @csrf_exempt
+    def wrap(request, *args, **kwargs):
+        if 'HTTP_AUTHORIZATION' in request.META:
+            user = basic_auth_user(request)
+            if user is None:
+                response = JsonResponse({'error': 'Invalid username or password.'}, status=401)
+                response['WWW-Authenticate'] = 'Basic realm="api"'
+                return response
+            request.user = user
+        elif not request.user.is_authenticated:
+            return JsonResponse({'error': 'Authentication required.'}, status=401)
+        elif CsrfViewMiddleware().process_view(request, None, (), {}) is not None:
+            return JsonResponse({'error': 'CSRF check failed. Send the csrftoken cookie in an X-CSRFToken header, '
+                                          'or use HTTP Basic auth.'}, status=403)
+        return function(request, *args, **kwargs)
+
+    wrap.__doc__ = function.__doc__
+    wrap.__name__ = function.__name__
+    return wrap
+
+
+def conditional(stamp):
+    """
+    Answers conditional GET requests (If-None-Match) with a 304 when the
+    data behind a page hasn't changed, before the view runs. There is no
+    Last-Modified, since a page can change without any row being updated
+    (a delete, a different query string, or a new day).
+    :param stamp: A function called with the view's arguments that returns the
+                  ETag of the data, or None to skip
+    :return: The decorator
+    """
+    def decorator(function):
+        def wrap(request, *args, **kwargs):
+            # Pages with flash messages waiting must render to show them
+            if request.method not in ('GET', 'HEAD') or len(messages.get_messages(request)):
+                return function(request, *args, **kwargs)
+
+            etag = stamp(request, *args, **kwargs)
+            if etag is not None:
+                response = get_conditional_response(request, etag=quote_etag(etag))
+                if response is not None:
+                    return response
+
+            response = function(request, *args, **kwargs)
+            if etag is not None and response.status_code == 200 and not response.streaming:
+                # Stamp again, since the view may have changed the data (letters save their dates)
+                response['ETag'] = quote_etag(stamp(request, *args, **kwargs))
+                patch_cache_control(response, private=True, no_cache=True)
+            return response
+
+        wrap.__doc__ = function.__doc__
+        wrap.__name__ = function.__name__
+        return wrap
+    return decorator
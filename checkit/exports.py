@@ -0,0 +1,137 @@
+"""
+The mail-merge export for the print house. Instead of rendering PDFs,
+every letter that is due becomes one record with the addresses, the
+amounts, and the letter stage, and the print house merges them into
+its own letter templates. See manage.py export_letters.
+
+The records are written as JSON Lines or CSV into a folder of the outbox,
+split into files of a fixed number of records. The manifest.json is
+written last, so a folder with a manifest is complete.
+"""
+
+from django.utils import timezone
+from . import audit
+from .models import Check
+import csv
+import datetime
+import hashlib
+import json
+import os
+
+# The fields of every record, in CSV column order
+FIELDS = ['check_id', 'letter', 'check_number', 'check_date', 'amount', 'late_fee', 'amount_paid', 'amount_due',
+          'account_name', 'account_street', 'account_city', 'account_state', 'account_zip_code',
+          'company_name', 'company_street', 'company_city', 'company_state', 'company_zip_code']
+
+
+def due_letters(checks):
+    """
+    The letters due for some checks, one record per letter. The database
+    only returns the checks letter_due_sql picks, and current_letter has
+    the final say, so the export matches the PDFs exactly.
+    :param checks: The checks to export letters for
+    :return: A generator of (check, record) pairs
+    """
+    checks = checks.filter(Check.letter_due_sql()).select_related('account__company').order_by('pk')
+    for check in checks.iterator(chunk_size=2000):
+        letter = check.current_letter()
+        if letter < 1:
+            continue
+        account, company = check.account, check.account.company
+        yield check, {
+            'check_id': check.pk,
+            'letter': letter,
+            'check_number': check.number,
+            'check_date': check.date.isoformat() if check.date else None,
+            'amount': str(check.amount),
+            'late_fee': str(company.late_fee),
+            'amount_paid': str(check.amount_paid),
+            'amount_due': str(check.amount_due()),
+            'account_name': account.name,
+            'account_street': account.street,
+            'account_city': account.city,
+            'account_state': account.state,
+            'account_zip_code': account.zip_code,
+            'company_name': company.name,
+            'company_street': company.street,
+            'company_city': company.city,
+            'company_state': company.state,
+            'company_zip_code': company.zip_code,
+        }
+
+
+class OutboxWriter:
+    """
+    Writes records into numbered files of at most per_file records each,
+    and a manifest of the files once it is closed
+    """
+
+    def __init__(self, directory, fmt='jsonl', per_file=10000):
+        self.directory = directory
+        self.fmt = fmt
+        self.per_file = per_file
+        self.files = []
+        self.file = None
+        os.makedirs(directory)
+
+    def write(self, record):
+        """Writes one record, starting a new file when the current one is full"""
+        if self.file is None or self.count == self.per_file:
+            self.next_file()
+        if self.fmt == 'csv':
+            self.writer.writerow([record[x] if record[x] is not None else '' for x in FIELDS])
+        else:
+            self.file.write(json.dumps(record) + '\n')
+        self.count += 1
+
+    def next_file(self):
+        """Closes the current file and starts the next one"""
+        self.close_file()
+        self.name = 'letters-{:04d}.{}'.format(len(self.files) + 1, self.fmt)
+        self.file = open(os.path.join(self.directory, self.name + '.tmp'), 'w', newline='')
+        self.count = 0
+        if self.fmt == 'csv':
+            self.writer = csv.writer(self.file)
+            self.writer.writerow(FIELDS)
+
+    def close_file(self):
+        """Closes the current file, and renames it once it is complete"""
+        if self.file is None:
+            return
+        self.file.close()
+        path = os.path.join(self.directory, self.name)
+        os.rename(path + '.tmp', path)
+        with open(path, 'rb') as f:
+            digest = hashlib.sha256(f.read()).hexdigest()
+        self.files.append({'name': self.name, 'records': self.count, 'bytes': os.path.getsize(path), 'sha256': digest})
+        self.file = None
+
+    def close(self):
+        """
+        Closes the last file and writes the manifest
+        :return: The manifest
+        """
+        self.close_file()
+        manifest = {
+            'created': timezone.now().isoformat(),
+            'format': self.fmt,
+            'fields': FIELDS,
+            'records': sum(x['records'] for x in self.files),
+            'files': self.files,
+        }
+        with open(os.path.join(self.directory, 'manifest.json'), 'w') as f:
+            json.dump(manifest, f, indent=2)
+        return manifest
+
+
+def mark_sent(letters):
+    """
+    Sets the letter dates of exported letters, like generating their PDFs does
+    :param letters: A dict of letter number to the ids of the checks it was sent for
+    """
+    today = datetime.datetime.now().date()
+    for letter, ids in letters.items():
+        changes = {'letter{}_date'.format(letter): today}
+        for start in range(0, len(ids), 1000):
+            Check.objects.filter(pk__in=ids[start:start + 1000]).update(date_updated=timezone.now(), **changes)
+            audit.record_many('update', Check, ids[start:start + 1000], changes)  # update() doesn't send signals
@@ -163,10 +163,18 @@ class CompanyForm(forms.ModelForm):
     zip_code = forms.CharField(label='Zip Code', help_text='Enter zip code')
     wait_period = forms.CharField(label='Wait Period', initial='10', help_text='Enter wait period between letters')
     late_fee = forms.CharField(label='Late Fee', initial='50', help_text='Enter the late fee for bounced checks')
+    retention_days = forms.IntegerField(label='Retention Days', required=False, min_value=1,
+                                        help_text='Purge checks paid more than this many days ago (blank keeps them)')
+    retention_action = forms.ChoiceField(choices=Company.RETENTION_ACTIONS, initial='delete', required=False)
 
     class Meta:
         model = Company
-        fields = ['name', 'desc', 'street', 'city', 'state', 'zip_code', 'wait_period', 'late_fee']
+        fields = ['name', 'desc', 'street', 'city', 'state', 'zip_code', 'wait_period', 'late_fee',
+                  'retention_days', 'retention_action']
+
+    def clean_retention_action(self):
+        """Purged checks are deleted unless the company asks for them to be anonymized"""
+        return self.cleaned_data['retention_action'] or 'delete'
 
 
 class ReportForm(forms.Form):
@@ -179,4 +187,27 @@ class ReportForm(forms.Form):
                                  widget=forms.DateInput(format='%m/%d/%Y', attrs={'class': 'date-field'}))
     end_date = forms.DateField(initial=datetime.datetime.now().date(),
                                input_formats=['%m/%d/%Y'],
-                               widget=forms.DateInput(format='%m/%d/%Y', attrs={'class': 'date-field'}))
\ No newline at end of file
+                               widget=forms.DateInput(format='%m/%d/%Y', attrs={'class': 'date-field'}))
+
+
+class BulkActionForm(forms.Form):
+    """
+    The action to run on the rows selected on a check or account index
+    page. The amount is only used when posting a payment.
+    """
+    ACTIONS = (('paid', 'Mark Paid'),
+               ('unpaid', 'Mark Unpaid'),
+               ('pay', 'Post Payment'),
+               ('letters', 'Generate Letters'),
+               ('letters_zip', 'Generate Letters (ZIP)'),
+               ('delete', 'Delete'))
+
+    action = forms.ChoiceField(choices=ACTIONS)
+    amount = forms.DecimalField(required=False, min_value=0.01, decimal_places=2, max_digits=10,
+                                help_text='Enter the amount paid on each check')
+
+    def clean(self):
+        cleaned_data = super().clean()
+        if cleaned_data.get('action') == 'pay' and not cleaned_data.get('amount'):
+            self.add_error('amount', 'Enter the amount to pay on each check.')
+        return cleaned_data
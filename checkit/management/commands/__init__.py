@@ -0,0 +1,3 @@
+"""
+This file is required per Python package requirements.
+"""
@@ -0,0 +1,43 @@
+"""
+Moves settled checks out of the check table. To archive the checks that
+were paid more than CHECK_ARCHIVE_DAYS days ago, run
+
+    python manage.py archive_checks
+
+It is safe to run on a schedule (e.g. daily with Heroku Scheduler). Checks
+are moved in batches, each in its own short transaction, and rows locked
+by another request are skipped until the next run. Archived checks can
+still be searched from the check index page.
+"""
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from checkit.models import ArchivedCheck
+import datetime
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Moves settled checks into the archive'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=settings.CHECK_ARCHIVE_DAYS,
+                            help='Archive checks paid more than this many days ago')
+        parser.add_argument('--batch-size', type=int, default=500, help='Checks moved per transaction')
+        parser.add_argument('--pause', type=float, default=0.1, help='Seconds to wait between batches')
+
+    def handle(self, *args, **options):
+        before = datetime.datetime.now().date() - datetime.timedelta(days=options['days'])
+        total = 0
+        while True:
+            moved = ArchivedCheck.archive(before, options['batch_size'])
+            if not moved:
+                break
+            total += moved
+            if options['pause']:
+                time.sleep(options['pause'])
+        logger.info('Archived %s checks paid before %s', total, before)
+        self.stdout.write('Archived {} checks paid before {}'.format(total, before))
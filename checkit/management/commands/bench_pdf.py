@@ -0,0 +1,81 @@
+"""
+Benchmarks the size and throughput of letter PDFs, both normal
+and compact. To run the benchmark, run
+
+    python manage.py bench_pdf --letters 50 --rounds 5
+
+The sample company, user, account, and checks are created in a
+transaction that is rolled back, so nothing is left in the database.
+"""
+
+from django.core.management.base import BaseCommand
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.template.loader import get_template
+from checkit.models import Check, Account, Company
+from checkit.views import render_pdf, zip_letters
+import datetime
+import time
+
+
+class Command(BaseCommand):
+    help = 'Benchmarks letter PDF size and throughput for normal and compact output'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--letters', type=int, default=50, help='Number of letters in the batch')
+        parser.add_argument('--rounds', type=int, default=5, help='Number of times to render the batch')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            checks, company, user = self.sample(options['letters'])
+            html = get_template('letters/letters.html').render({'checks': checks, 'company': company, 'user': user})
+
+            def render_zip(compact):
+                # Generating letters marks them as sent, so reset them first
+                Check.objects.filter(pk__in=[c.pk for c in checks]).update(letter1_date=None)
+                return b''.join(zip_letters(Check.objects.filter(pk__in=[c.pk for c in checks]), company, user, compact))
+
+            self.stdout.write('{:<14}{:>12}{:>12}{:>14}'.format('mode', 'bytes', 'sec/batch', 'letters/sec'))
+            for compact in (False, True):
+                size, seconds = self.bench(options['rounds'], lambda: render_pdf(html, compact))
+                self.report('pdf' + (' compact' if compact else ''), size, seconds, options['letters'])
+            for compact in (False, True):
+                size, seconds = self.bench(options['rounds'], lambda: render_zip(compact))
+                self.report('zip' + (' compact' if compact else ''), size, seconds, options['letters'])
+            transaction.set_rollback(True)
+
+    def sample(self, count):
+        """
+        Creates the sample data for the benchmark
+        :param count: The number of checks to create
+        :return: The checks, company, and user
+        """
+        company = Company.objects.create(name='Benchmark Company', street='123 Company Way',
+                                         city='Greenville', state='SC', zip_code='29614')
+        user = User.objects.create_user(username='bench_pdf_user', first_name='Bench', last_name='User')
+        user.profile.company = company
+        user.save()
+        account = Account.objects.create(name='Benchmark Account', company=company, street='123 Account Way',
+                                         city='Greenville', state='SC', zip_code='29614')
+        checks = Check.objects.bulk_create([
+            Check(user=user, account=account, number=i, amount=100 + i, date=datetime.date.today())
+            for i in range(count)
+        ])
+        return list(Check.objects.filter(pk__in=[c.pk for c in checks]).select_related('account__company')), company, user
+
+    def bench(self, rounds, render):
+        """
+        Renders a batch a number of times
+        :param rounds: The number of times to render
+        :param render: The function that renders the batch
+        :return: The output size and the average seconds per batch
+        """
+        size = 0
+        start = time.perf_counter()
+        for i in range(rounds):
+            size = len(render())
+        return size, (time.perf_counter() - start) / rounds
+
+    def report(self, mode, size, seconds, letters):
+        """Writes one row of the benchmark table"""
+        self.stdout.write('{:<14}{:>12}{:>12.3f}{:>14.1f}'.format(mode, size, seconds, letters / seconds))
@@ -0,0 +1,74 @@
+"""
+Benchmarks how long a new worker takes to start and to get ready for
+its first request. To run the benchmark, run
+
+    python manage.py bench_startup --runs 5
+
+Every run is a fresh Python process, so nothing is cached between runs.
+Three kinds of worker are compared:
+    eager: imports xhtml2pdf, pypdf, and leather at startup,
+           like the views used to
+    lazy: the current views, which import them on first use
+    lazy + warm up: also runs the gunicorn warm up hook before the first
+                    request, like a preloaded gunicorn master does
+"""
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+import statistics
+import subprocess
+import sys
+
+# The script each fresh process runs. It prints the boot time, warm up time,
+# and the time the first check index request spends on urls and templates.
+SCRIPT = '''
+import os, sys, time
+eager, warm = sys.argv[1] == '1', sys.argv[2] == '1'
+start = time.perf_counter()
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'unicoders.settings')
+import django
+django.setup()
+import unicoders.asgi, checkit.views
+if eager:
+    import xhtml2pdf.pisa, pypdf, leather
+boot = time.perf_counter() - start
+
+start = time.perf_counter()
+if warm:
+    from unicoders.warmup import warm_up
+    warm_up()
+warm_time = time.perf_counter() - start
+
+from django.urls import reverse, resolve
+from django.template.loader import get_template
+start = time.perf_counter()
+resolve(reverse('check_index'))
+get_template('checks/index.html')
+first = time.perf_counter() - start
+print(boot, warm_time, first)
+'''
+
+
+class Command(BaseCommand):
+    help = 'Benchmarks worker startup time with eager imports, lazy imports, and warm up'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--runs', type=int, default=5, help='Number of fresh processes per kind of worker')
+
+    def handle(self, *args, **options):
+        self.stdout.write('{:<18}{:>10}{:>12}{:>14}'.format('worker', 'boot ms', 'warm up ms', 'first hit ms'))
+        for name, eager, warm in (('eager', '1', '0'), ('lazy', '0', '0'), ('lazy + warm up', '0', '1')):
+            runs = [self.run(eager, warm) for i in range(options['runs'])]
+            medians = [statistics.median(column) * 1000 for column in zip(*runs)]
+            self.stdout.write('{:<18}{:>10.1f}{:>12.1f}{:>14.1f}'.format(name, *medians))
+
+    def run(self, eager, warm):
+        """
+        Starts one fresh process and times it
+        :param eager: '1' to import the heavy modules at startup
+        :param warm: '1' to run the warm up before the first request
+        :return: The boot, warm up, and first hit times in seconds
+        """
+        output = subprocess.run([sys.executable, '-c', SCRIPT, eager, warm], cwd=settings.BASE_DIR,
+                                stdout=subprocess.PIPE, check=True, universal_newlines=True).stdout
+        return [float(x) for x in output.split()[-3:]]
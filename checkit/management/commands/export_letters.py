@@ -0,0 +1,52 @@
+"""
+Exports the letters that are due as mail-merge data for the print house,
+instead of rendering PDFs. To export every company's due letters, run
+
+    python manage.py export_letters --format csv
+
+Each run writes a new folder in settings.LETTER_OUTBOX, named by the
+time it started, with files of --per-file records each and a
+manifest.json that lists them with their record counts and checksums.
+The letter dates of the exported checks are set, like generating the
+PDFs does, so the next run only exports new letters (unless --no-mark).
+"""
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from checkit.exports import due_letters, OutboxWriter, mark_sent
+from checkit.models import Check
+import logging
+import os
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Exports the due letters as mail-merge files for the print house'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--company', type=int, action='append', help='Only export this company (repeatable)')
+        parser.add_argument('--format', choices=['jsonl', 'csv'], default='jsonl', help='The file format')
+        parser.add_argument('--per-file', type=int, default=10000, help='Records per file')
+        parser.add_argument('--outbox', default=settings.LETTER_OUTBOX, help='The folder to export into')
+        parser.add_argument('--no-mark', action='store_true', help='Leave the letter dates alone')
+
+    def handle(self, *args, **options):
+        checks = Check.objects.all()
+        if options['company']:
+            checks = checks.filter(account__company__in=options['company'])
+
+        directory = os.path.join(options['outbox'], time.strftime('letters-%Y%m%d-%H%M%S'))
+        writer = OutboxWriter(directory, options['format'], options['per_file'])
+        sent = {}
+        for check, record in due_letters(checks):
+            writer.write(record)
+            sent.setdefault(record['letter'], []).append(check.pk)
+        manifest = writer.close()
+
+        if not options['no_mark']:
+            mark_sent(sent)
+        logger.info('Exported %s letters in %s files to %s', manifest['records'], len(manifest['files']), directory)
+        self.stdout.write('Exported {} letters in {} files to {}'.format(
+            manifest['records'], len(manifest['files']), directory))
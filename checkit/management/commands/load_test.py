@@ -0,0 +1,215 @@
+"""
+Load tests a running server with many operators at once. Start the
+server the way it runs in production, on the same database, e.g.
+
+    gunicorn -c python:unicoders.gunicorn_conf unicoders.asgi:application -b 127.0.0.1:8000
+
+and then run
+
+    python manage.py load_test --url http://127.0.0.1:8000 --users 10 --duration 60
+
+A sample company is created with --users regular users and --users
+supervisors (plus a few admins), each with accounts and checks. Every
+user logs in and keeps replaying a mix of requests like an operator
+would: browsing and searching the checks, paying checks, adding checks,
+and opening reports and letters. When the time is up, the latency
+percentiles and throughput of every URL name are printed and the sample
+data is deleted (unless --keep is given).
+"""
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.urls import reverse
+from checkit.models import Check, Account, Company
+from http.client import HTTPException
+from http.cookiejar import CookieJar
+from urllib.error import HTTPError
+from urllib.parse import urlencode
+from urllib.request import build_opener, HTTPCookieProcessor, HTTPRedirectHandler
+import datetime
+import random
+import threading
+import time
+
+PASSWORD = 'load-test-password'
+
+# What each role does, and how often: (weight, action name)
+MIXES = {
+    'user': [(40, 'browse'), (20, 'search'), (15, 'pay'), (15, 'new_check'), (5, 'report'), (5, 'letter')],
+    'supervisor': [(35, 'browse'), (20, 'search'), (10, 'pay'), (10, 'new_check'), (15, 'report'), (10, 'aging')],
+    'admin': [(50, 'browse'), (20, 'search'), (30, 'report')],
+}
+
+
+class NoRedirect(HTTPRedirectHandler):
+    """Stops urllib from following redirects, so each request is timed on its own"""
+
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        return None
+
+
+class Operator:
+    """One synthetic user, with their own session, replaying a mix of requests"""
+
+    def __init__(self, base_url, username, role, checks, accounts):
+        self.base_url = base_url.rstrip('/')
+        self.username = username
+        self.role = role
+        self.checks = checks
+        self.accounts = accounts
+        self.cookies = CookieJar()
+        self.opener = build_opener(HTTPCookieProcessor(self.cookies), NoRedirect())
+        self.results = []  # (url name, seconds, ok)
+
+    def csrf_token(self):
+        """The CSRF cookie, which Django also accepts as the form token"""
+        return next((c.value for c in self.cookies if c.name == 'csrftoken'), '')
+
+    def request(self, name, path, data=None, record=True):
+        """
+        Sends one request and records how long it took
+        :param name: The URL name to report the time under
+        :param path: The path and query string
+        :param data: The form data for a POST, or None for a GET
+        :param record: Whether or not to record the result
+        """
+        body = None
+        if data is not None:
+            body = urlencode(dict(data, csrfmiddlewaretoken=self.csrf_token())).encode('utf-8')
+        start = time.perf_counter()
+        try:
+            with self.opener.open(self.base_url + path, body, timeout=120) as response:
+                response.read()
+            ok = True
+        except HTTPError as e:
+            e.read()
+            ok = e.code < 400  # Redirects aren't followed, but they are fine
+        except (OSError, HTTPException):  # The server couldn't be reached or dropped the connection
+            ok = False
+        if record:
+            self.results.append((name, time.perf_counter() - start, ok))
+
+    def login(self):
+        """Logs the user in"""
+        self.request('login', reverse('login'), record=False)
+        self.request('login', reverse('login'), {'username': self.username, 'password': PASSWORD})
+
+    def act(self, action):
+        """Runs one action of the mix"""
+        if action == 'browse':
+            self.request('check_index', '{}?page={}'.format(reverse('check_index'), random.randint(1, 3)))
+        elif action == 'search':
+            self.request('check_index', '{}?{}'.format(reverse('check_index'), urlencode({'search': 'Load'})))
+        elif action == 'pay':
+            check = random.choice(self.checks)
+            self.request('check_pay', reverse('check_pay', args=[check]), {'amount': '1.00'})
+        elif action == 'new_check':
+            account = random.choice(self.accounts)
+            self.request('account_check_new', reverse('account_check_new', args=[account]), {
+                'number': random.randint(1000, 9999), 'amount': '{}.00'.format(random.randint(10, 500)),
+                'date': datetime.date.today().strftime('%m/%d/%Y'),
+            })
+        elif action == 'report':
+            self.request('report', reverse('report'))
+        elif action == 'letter':
+            self.request('letter', reverse('letter'))
+        elif action == 'aging':
+            self.request('aging', reverse('aging'))
+
+    def run(self, until, think):
+        """Replays the mix until a deadline"""
+        self.login()
+        weights, actions = zip(*MIXES[self.role])
+        while time.monotonic() < until:
+            self.act(random.choices(actions, weights)[0])
+            if think:
+                time.sleep(random.uniform(0, think * 2))
+
+
+class Command(BaseCommand):
+    help = 'Load tests a running server with many concurrent users'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://127.0.0.1:8000', help='The server to test')
+        parser.add_argument('--users', type=int, default=10, help='Regular users and supervisors to simulate, each')
+        parser.add_argument('--admins', type=int, default=2, help='Admins to simulate')
+        parser.add_argument('--duration', type=float, default=60, help='Seconds to run the test for')
+        parser.add_argument('--think', type=float, default=0, help='Average seconds each user waits between requests')
+        parser.add_argument('--checks', type=int, default=50, help='Sample checks per user')
+        parser.add_argument('--keep', action='store_true', help='Keep the sample data afterwards')
+
+    def handle(self, *args, **options):
+        company, operators = self.sample(options)
+        try:
+            self.stdout.write('Running {} users against {} for {:.0f}s'.format(
+                len(operators), options['url'], options['duration']))
+            start = time.monotonic()
+            until = start + options['duration']
+            threads = [threading.Thread(target=x.run, args=(until, options['think'])) for x in operators]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            self.report([r for x in operators for r in x.results], time.monotonic() - start)
+        finally:
+            if not options['keep']:
+                self.clean_up(company)
+
+    def sample(self, options):
+        """
+        Creates the sample company, users, accounts, and checks
+        :return: The company and an operator for every user
+        """
+        company = Company.objects.create(name='Load Test Company', street='123 Company Way', city='Greenville',
+                                         state='SC', zip_code='29614', wait_period=0)
+        accounts = Account.objects.bulk_create([
+            Account(company=company, name='Load Account {}'.format(i), number=str(100000 + i), route='123456789',
+                    street='123 Account Way', city='Greenville', state='SC', zip_code='29614')
+            for i in range(20)
+        ])
+        account_ids = [x.pk for x in accounts]
+
+        operators = []
+        roles = [('user', options['users']), ('supervisor', options['users']), ('admin', options['admins'])]
+        for role, count in roles:
+            for i in range(count):
+                user = User.objects.create_user(username='loadtest_{}_{}'.format(role, i), password=PASSWORD,
+                                                is_superuser=role == 'admin')
+                if role != 'admin':
+                    user.profile.company = company
+                    user.profile.is_supervisor = role == 'supervisor'
+                    user.save()
+                checks = Check.objects.bulk_create([
+                    Check(user=user, account_id=random.choice(account_ids), number=j,
+                          amount=random.randint(10, 500), date=datetime.date.today())
+                    for j in range(options['checks'] if role != 'admin' else 0)
+                ])
+                operators.append(Operator(options['url'], user.username, role, [x.pk for x in checks], account_ids))
+        return company, operators
+
+    def clean_up(self, company):
+        """Deletes the sample data"""
+        users = User.objects.filter(username__startswith='loadtest_')
+        Check.objects.filter(user__in=users).delete()
+        Check.objects.filter(account__company=company).delete()
+        users.delete()
+        company.delete()
+
+    def report(self, results, seconds):
+        """Writes the latency percentiles and throughput of every URL name"""
+        self.stdout.write('{:<20}{:>8}{:>8}{:>10}{:>10}{:>10}{:>10}'.format(
+            'url name', 'count', 'errors', 'p50 ms', 'p95 ms', 'p99 ms', 'req/s'))
+        names = sorted(set(x[0] for x in results))
+        for name in names + ['all']:
+            rows = [x for x in results if name in ('all', x[0])]
+            times = sorted(x[1] for x in rows)
+            self.stdout.write('{:<20}{:>8}{:>8}{:>10.1f}{:>10.1f}{:>10.1f}{:>10.1f}'.format(
+                name, len(rows), len([x for x in rows if not x[2]]), percentile(times, 50) * 1000,
+                percentile(times, 95) * 1000, percentile(times, 99) * 1000, len(rows) / seconds))
+
+
+def percentile(times, percent):
+    """The nearest-rank percentile of a sorted list of times"""
+    if not times:
+        return 0
+    return times[min(len(times) - 1, max(0, int(round(percent / 100 * len(times))) - 1))]
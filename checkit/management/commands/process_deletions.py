@@ -0,0 +1,65 @@
+"""
+The background worker for deleting companies, accounts, and users.
+To start the worker, run
+
+    python manage.py process_deletions
+
+It waits for deletion jobs and runs them one at a time. A job that
+stopped making progress (its worker died) is picked up again and
+carries on from where it was. A job whose batch fails is marked failed,
+and the worker moves on to the next one. Use --once to run the waiting jobs and exit.
+"""
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from checkit.models import DeletionJob
+import datetime
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Runs the background deletions of companies, accounts, and users'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=settings.DELETION_BATCH_SIZE,
+                            help='Rows deleted per transaction')
+        parser.add_argument('--pause', type=float, default=0.1, help='Seconds to wait between batches')
+        parser.add_argument('--poll', type=float, default=5, help='Seconds to wait when there are no jobs')
+        parser.add_argument('--stale', type=int, default=10,
+                            help='Minutes without progress before a running job is picked up again')
+        parser.add_argument('--once', action='store_true', help='Run the waiting jobs and exit')
+
+    def handle(self, *args, **options):
+        while True:
+            job = self.claim(options['stale'])
+            if job:
+                logger.info('Starting job: %s', job)
+                job.run(options['batch_size'], options['pause'])
+                logger.info('%s: %s (%s/%s rows)', job, job.status, job.deleted, job.total)
+            elif options['once']:
+                break
+            else:
+                time.sleep(options['poll'])
+
+    def claim(self, stale):
+        """
+        Claims the next waiting job, or a running job that stopped making progress
+        :param stale: Minutes without progress before a running job is stale
+        :return: The job, or None if there isn't one
+        """
+        cutoff = timezone.now() - datetime.timedelta(minutes=stale)
+        with transaction.atomic():
+            # Skip rows another worker is claiming right now
+            job = DeletionJob.objects.select_for_update(skip_locked=True)\
+                .filter(Q(status='pending') | Q(status='running', date_updated__lt=cutoff))\
+                .order_by('pk').first()
+            if job:
+                job.status = 'running'
+                job.save()
+        return job
@@ -0,0 +1,43 @@
+"""
+The background worker for company-wide letter batches. To start a
+worker, run
+
+    python manage.py process_letters
+
+Each worker renders one shard (the letters of one user or account) at a
+time, so a batch is rendered by as many workers as are running, e.g.
+heroku ps:scale letters=4. The worker that finishes the last shard of a
+batch merges the shards into one PDF. A shard that stopped making
+progress (its worker died) is picked up again, and a shard that raised
+is marked failed. Use --once to render the waiting shards and exit.
+"""
+
+from django.core.management.base import BaseCommand
+from checkit.models import LetterShard
+from checkit.views import render_letter_shard
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Renders the shards of company-wide letter batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--poll', type=float, default=5, help='Seconds to wait when there are no shards')
+        parser.add_argument('--stale', type=int, default=10,
+                            help='Minutes without progress before a running shard is picked up again')
+        parser.add_argument('--once', action='store_true', help='Render the waiting shards and exit')
+
+    def handle(self, *args, **options):
+        while True:
+            shard = LetterShard.claim(options['stale'])
+            if shard:
+                # Heartbeats keep a slow shard from looking stale to the other workers
+                render_letter_shard(shard, options['stale'] * 60 / 3)
+                logger.info('%s: %s (%s letters)', shard, shard.status, shard.letters)
+            elif options['once']:
+                break
+            else:
+                time.sleep(options['poll'])
@@ -0,0 +1,73 @@
+"""
+Removes old settled checks, so the check tables and their indexes stop
+growing forever. Each company's retention policy (set on the company
+edit page) says how many days paid checks are kept, and whether they are
+then deleted or anonymized. To purge checks paid more than two years ago
+at the companies without a policy of their own, run
+
+    python manage.py purge_history --older-than 730
+
+Companies without a policy are skipped when --older-than isn't given.
+Checks are purged in small batches, each in its own short transaction,
+with a pause between batches and a longer wait while the read replicas
+fall behind, so it can run during business hours. Use --dry-run to see
+how many checks would be purged.
+"""
+
+from django.core.management.base import BaseCommand
+from checkit.models import Check, ArchivedCheck, Company
+from checkit.routers import replica_lag
+import datetime
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Deletes or anonymizes old settled checks by each company\'s retention policy'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than', type=int, help='Days paid checks are kept at companies without a policy')
+        parser.add_argument('--batch-size', type=int, default=200, help='Checks purged per transaction')
+        parser.add_argument('--pause', type=float, default=0.5, help='Seconds to wait between batches')
+        parser.add_argument('--max-lag', type=float, default=5, help='Wait while a replica is this many seconds behind')
+        parser.add_argument('--dry-run', action='store_true', help='Only count the checks that would be purged')
+
+    def handle(self, *args, **options):
+        today = datetime.datetime.now().date()
+        total = 0
+        for company in Company.objects.order_by('pk'):
+            days = company.retention_days or options['older_than']
+            if not days:
+                continue
+            before = today - datetime.timedelta(days=days)
+            count = sum(self.purge(model, company, before, options) for model in (Check, ArchivedCheck))
+            if count:
+                verb = 'Would purge' if options['dry_run'] else company.get_retention_action_display() + 'd'
+                logger.info('%s %s checks of %s paid before %s', verb, count, company, before)
+                self.stdout.write('{} {} checks of {} paid before {}'.format(verb, count, company, before))
+            total += count
+        self.stdout.write('{} checks in total'.format(total))
+
+    def purge(self, model, company, before, options):
+        """
+        Purges all of a company's settled checks in one table, batch by batch
+        :return: How many checks were purged
+        """
+        if options['dry_run']:
+            return model.objects.filter(account__company=company, paid=True, paid_date__lt=before).count()
+        count = 0
+        while True:
+            purged = model.purge(company, before, company.retention_action, options['batch_size'])
+            if not purged:
+                return count
+            count += purged
+            self.throttle(options)
+
+    def throttle(self, options):
+        """Waits between batches, and for as long as the replicas are behind"""
+        if options['pause']:
+            time.sleep(options['pause'])
+        while replica_lag() > options['max_lag']:
+            time.sleep(max(options['pause'], 1))
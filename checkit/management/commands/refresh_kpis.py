@@ -0,0 +1,36 @@
+"""
+Recomputes the dashboard numbers of every company. To run it every
+KPI_REFRESH_SECONDS seconds, like the clock process in the Procfile, run
+
+    python manage.py refresh_kpis --loop
+
+Without --loop, it refreshes every company once and exits, e.g. for a
+scheduler. Each company is one aggregate query and one saved row.
+"""
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from checkit.models import Company, CompanyKPI
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Recomputes the dashboard numbers of every company'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', help='Keep refreshing every KPI_REFRESH_SECONDS seconds')
+
+    def handle(self, *args, **options):
+        while True:
+            start = time.monotonic()
+            count = 0
+            for company in Company.objects.all().iterator():
+                CompanyKPI.refresh(company)
+                count += 1
+            logger.info('Refreshed the KPIs of %s companies in %.1fs', count, time.monotonic() - start)
+            if not options['loop']:
+                break
+            time.sleep(max(settings.KPI_REFRESH_SECONDS - (time.monotonic() - start), 0))
@@ -0,0 +1,56 @@
+"""
+Precomputes the monthly report totals that long report ranges are
+drawn from. To recompute the last few finished months, run
+
+    python manage.py rollup_reports
+
+It is meant to run on a schedule (e.g. nightly with Heroku Scheduler), so
+new payments and letters in the last months are picked up. Older months
+whose rollups were dropped because a check in them changed (see
+ReportMonth.drop) are computed again too. Use --all to recompute every
+month since the first payment or letter.
+"""
+
+from django.core.management.base import BaseCommand
+from django.db.models import Min
+from checkit.models import Check, ArchivedCheck, ReportMonth
+from checkit.reports import REPORT_CHARTS, month_end, rollup_month
+import datetime
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Precomputes the monthly report totals'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--months', type=int, default=3, help='How many finished months to recompute')
+        parser.add_argument('--all', action='store_true', help='Recompute every month with data')
+
+    def first_month(self):
+        """The first month any chart has data for, or None if there is none"""
+        fields = set(group for group, aggregate, title, axis in REPORT_CHARTS.values())
+        dates = []
+        for model in (Check, ArchivedCheck):
+            dates += model.objects.aggregate(**{x: Min(x) for x in fields}).values()
+        dates = [x for x in dates if x]
+        return min(dates).replace(day=1) if dates else None
+
+    def handle(self, *args, **options):
+        # Only finished months are rolled up, the current one is always aggregated live
+        this_month = datetime.datetime.now().date().replace(day=1)
+        recent = this_month
+        for i in range(options['months']):
+            recent = (recent - datetime.timedelta(days=1)).replace(day=1)
+        rolled_up = set(ReportMonth.objects.values_list('month', flat=True))
+
+        count = 0
+        month = self.first_month() or this_month
+        while month < this_month:
+            if options['all'] or month >= recent or month not in rolled_up:
+                rollups = rollup_month(month)
+                logger.info('Rolled up %s totals for %s', rollups, month.strftime('%B %Y'))
+                count += 1
+            month = month_end(month) + datetime.timedelta(days=1)
+        self.stdout.write('Rolled up {} months'.format(count))
@@ -0,0 +1,106 @@
+"""
+This file contains the middleware for the system.
+"""
+
+from django.conf import settings
+from django.urls import resolve, Resolver404
+from unicoders.logs import start_request, end_request
+from . import audit
+from .routers import replica_reads, replica_stream
+import logging
+import time
+import uuid
+
+logger = logging.getLogger('checkit.requests')
+
+
+class RequestLogMiddleware:
+    """
+    Gives every request an id, taken from the X-Request-ID header when the
+    router sets one, so its log records can be found together. Each request
+    is logged once it has been handled, with its status and its duration
+    as elapsed_ms.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request_id = request.META.get('HTTP_X_REQUEST_ID') or uuid.uuid4().hex
+        start_request(request_id, request.method, request.path)
+        try:
+            response = self.get_response(request)
+            user = getattr(request, 'user', None)
+            logger.info('%s %s %s', request.method, request.path, response.status_code, extra={
+                'status': response.status_code,
+                'user': user.pk if user is not None and user.is_authenticated else None,
+            })
+            response['X-Request-ID'] = request_id
+            return response
+        finally:
+            end_request()
+
+
+class AuditMiddleware:
+    """
+    Keeps the audit events of a request in memory and writes them all
+    with one insert once the response is ready.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        audit.begin(request)
+        try:
+            return self.get_response(request)
+        finally:
+            audit.flush()
+
+    def process_exception(self, request, exception):
+        """Drops the events of a view that raised, since its transaction was rolled back"""
+        audit.discard()
+
+
+class ReplicaMiddleware:
+    """
+    Sends the reads of the read-only views (settings.REPLICA_VIEWS) to the
+    read replicas. After a user posts a change, their session is pinned to
+    the primary for settings.REPLICA_PIN_SECONDS, so they see their own
+    writes even if the replicas are behind.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if self.use_replica(request):
+            with replica_reads():
+                response = self.get_response(request)
+            if response.streaming:
+                # Streamed rows are read as the response is sent, after the block above
+                response.streaming_content = replica_stream(response.streaming_content)
+            return response
+
+        response = self.get_response(request)
+        # Only pin users with a session, so Basic auth API writes don't each start one
+        if settings.REPLICA_DATABASES and request.method not in ('GET', 'HEAD', 'OPTIONS') \
+                and request.session.session_key:
+            request.session['replica_pin'] = time.time() + settings.REPLICA_PIN_SECONDS
+        return response
+
+    def use_replica(self, request):
+        """
+        Whether or not a request can read from a replica
+        :param request: The request
+        :return: True for GETs to read-only views by users who aren't pinned
+        """
+        if not settings.REPLICA_DATABASES or request.method not in ('GET', 'HEAD'):
+            return False
+        try:
+            if resolve(request.path_info).url_name not in settings.REPLICA_VIEWS:
+                return False
+        except Resolver404:
+            return False
+        # The session is loaded here, so it always comes from the primary
+        return request.session.get('replica_pin', 0) < time.time()
@@ -0,0 +1,40 @@
+# Generated by Django 2.2.28 on 2026-10-19 13:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('checkit', '0019_deletionjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='account',
+            name='date_updated',
+            field=models.DateTimeField(auto_now=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='check',
+            name='date_updated',
+            field=models.DateTimeField(auto_now=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='company',
+            name='date_updated',
+            field=models.DateTimeField(auto_now=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='account',
+            index=models.Index(fields=['date_updated'], name='account_date_updated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='check',
+            index=models.Index(fields=['date_updated'], name='check_date_updated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='company',
+            index=models.Index(fields=['date_updated'], name='company_date_updated_idx'),
+        ),
+    ]
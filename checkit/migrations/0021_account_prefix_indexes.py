@@ -0,0 +1,26 @@
+# Generated by Django 2.2.28 on 2026-10-19 13:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('checkit', '0020_date_updated'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='account',
+            index=models.Index(fields=['number'], name='account_number_prefix_idx', opclasses=['varchar_pattern_ops']),
+        ),
+        migrations.AddIndex(
+            model_name='account',
+            index=models.Index(fields=['route'], name='account_route_prefix_idx', opclasses=['varchar_pattern_ops']),
+        ),
+        # Matches the UPPER(name::text) LIKE UPPER('x%') of name__istartswith
+        migrations.RunSQL(
+            'CREATE INDEX account_name_prefix_idx ON checkit_account (UPPER(name::text) text_pattern_ops)',
+            'DROP INDEX account_name_prefix_idx',
+        ),
+    ]
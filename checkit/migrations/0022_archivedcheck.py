@@ -0,0 +1,44 @@
+# Generated by Django 2.2.28 on 2026-10-19 13:20
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('checkit', '0021_account_prefix_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedCheck',
+            fields=[
+                ('number', models.IntegerField(default=0, null=True)),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=10, null=True)),
+                ('paid', models.BooleanField(default=False)),
+                ('amount_paid', models.DecimalField(decimal_places=2, default=0, max_digits=10, null=True)),
+                ('date', models.DateField(blank=True, null=True)),
+                ('letter1_date', models.DateField(null=True)),
+                ('letter2_date', models.DateField(null=True)),
+                ('letter3_date', models.DateField(null=True)),
+                ('paid_date', models.DateField(null=True)),
+                ('id', models.IntegerField(primary_key=True, serialize=False)),
+                ('date_created', models.DateTimeField(blank=True, null=True)),
+                ('date_updated', models.DateTimeField(blank=True, null=True)),
+                ('date_archived', models.DateTimeField(auto_now_add=True)),
+                ('account', models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, to='checkit.Account')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='archivedcheck',
+            index=models.Index(fields=['date_created'], name='archivedcheck_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='archivedcheck',
+            index=models.Index(fields=['paid_date'], name='archivedcheck_paid_date_idx'),
+        ),
+    ]
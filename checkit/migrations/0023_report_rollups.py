@@ -0,0 +1,38 @@
+# Generated by Django 2.2.28 on 2026-10-19 13:23
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('checkit', '0022_archivedcheck'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReportMonth',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField(unique=True)),
+                ('date_updated', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ReportRollup',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('chart', models.CharField(max_length=20)),
+                ('value', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('month', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rollups', to='checkit.ReportMonth')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='reportrollup',
+            index=models.Index(fields=['chart', 'month'], name='reportrollup_chart_month_idx'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 2.2.28 on 2026-10-19 13:26
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('checkit', '0023_report_rollups'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CompanyKPI',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('open_checks', models.IntegerField(default=0)),
+                ('outstanding', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('collected_month', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('letter1_due', models.IntegerField(default=0)),
+                ('letter2_due', models.IntegerField(default=0)),
+                ('letter3_due', models.IntegerField(default=0)),
+                ('date_updated', models.DateTimeField(auto_now=True)),
+                ('company', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='kpi', to='checkit.Company')),
+            ],
+        ),
+    ]
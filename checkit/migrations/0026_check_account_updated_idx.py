@@ -0,0 +1,17 @@
+# Generated by Django 2.2.28 on 2026-10-19 13:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('checkit', '0025_auditevent'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='check',
+            index=models.Index(fields=['account', 'date_updated'], name='check_account_updated_idx'),
+        ),
+    ]
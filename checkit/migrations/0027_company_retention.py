@@ -0,0 +1,23 @@
+# Generated by Django 2.2.28 on 2026-10-19 13:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('checkit', '0026_check_account_updated_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='company',
+            name='retention_action',
+            field=models.CharField(choices=[('delete', 'Delete'), ('anonymize', 'Anonymize')], default='delete', max_length=10),
+        ),
+        migrations.AddField(
+            model_name='company',
+            name='retention_days',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 2.2.28 on 2026-10-19 13:39
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('checkit', '0027_company_retention'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LetterBatch',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('shard_by', models.CharField(choices=[('user', 'User'), ('account', 'Account')], default='user', max_length=10)),
+                ('compact', models.BooleanField(default=False)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('running', 'Running'), ('done', 'Done'), ('failed', 'Failed')], default='pending', max_length=10)),
+                ('total', models.IntegerField(default=0)),
+                ('done', models.IntegerField(default=0)),
+                ('letters', models.IntegerField(default=0)),
+                ('pdf', models.BinaryField(null=True)),
+                ('error', models.CharField(blank=True, default='', max_length=1000)),
+                ('date_created', models.DateTimeField(auto_now_add=True)),
+                ('date_updated', models.DateTimeField(auto_now=True)),
+                ('company', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='checkit.Company')),
+                ('requested_by', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='LetterShard',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.IntegerField()),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('running', 'Running'), ('done', 'Done'), ('failed', 'Failed')], default='pending', max_length=10)),
+                ('letters', models.IntegerField(default=0)),
+                ('pdf', models.BinaryField(null=True)),
+                ('date_updated', models.DateTimeField(auto_now=True)),
+                ('batch', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='shards', to='checkit.LetterBatch')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='lettershard',
+            index=models.Index(fields=['status'], name='lettershard_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='letterbatch',
+            index=models.Index(fields=['company', 'date_created'], name='letterbatch_company_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 2.2.28 on 2026-10-19 14:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('checkit', '0028_letter_batches'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='lettershard',
+            name='claim_id',
+            field=models.CharField(blank=True, default='', max_length=32),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 2.2.28 on 2026-10-19 14:30
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('checkit', '0029_letter_shard_claim'),
+    ]
+
+    operations = [
+        # Matches the UPPER(name::text) LIKE UPPER('x%') of the admin's ^name search
+        migrations.RunSQL(
+            'CREATE INDEX company_name_prefix_idx ON checkit_company (UPPER(name::text) text_pattern_ops)',
+            'DROP INDEX company_name_prefix_idx',
+        ),
+    ]
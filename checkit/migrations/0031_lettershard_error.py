@@ -0,0 +1,18 @@
+# Generated by Django 2.2.28 on 2026-10-19 14:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('checkit', '0030_company_name_prefix_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='lettershard',
+            name='error',
+            field=models.CharField(blank=True, default='', max_length=1000),
+        ),
+    ]
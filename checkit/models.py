@@ -14,12 +14,19 @@ Models also have helpful fields that may be used in templates, or
 methods that change data on them.
 """
 
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Count, ExpressionWrapper, F, Q, Sum, Value
 from django.contrib.auth.models import User
 from django.db.models.signals import post_save
 from django.dispatch import receiver
+from django.utils import timezone
 from django.core.validators import RegexValidator, MaxValueValidator, MinValueValidator
 import datetime
+import logging
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
 
 
 class Company(models.Model):
@@ -39,7 +46,12 @@ class Company(models.Model):
                        code='invalid_zip_code')
     ])
     late_fee = models.DecimalField(decimal_places=2, max_digits=10, default=50, null=True)
+    # How long settled checks are kept before manage.py purge_history deletes or anonymizes them
+    RETENTION_ACTIONS = [('delete', 'Delete'), ('anonymize', 'Anonymize')]
+    retention_days = models.IntegerField(null=True, blank=True)
+    retention_action = models.CharField(max_length=10, choices=RETENTION_ACTIONS, default='delete')
     date_created = models.DateTimeField(auto_now_add=True, blank=True, null=True)
+    date_updated = models.DateTimeField(auto_now=True, blank=True, null=True)
 
     def __str__(self):
         """Returns a textual representation of the company"""
@@ -48,7 +60,9 @@ class Company(models.Model):
     class Meta:
         indexes = [  # Create indexes on fields that are searched.
             models.Index(fields=['name'], name='company_name_idx'),
-            models.Index(fields=['date_created'], name='company_date_created_idx')
+            models.Index(fields=['date_created'], name='company_date_created_idx'),
+            models.Index(fields=['date_updated'], name='company_date_updated_idx')
+            # The admin searches name prefixes case-insensitively, with the UPPER(name) index in migration 0030
         ]
         verbose_name_plural = 'companies'
 
@@ -80,6 +94,7 @@ class Account(models.Model):
                        code='invalid_zip_code')
     ])
     date_created = models.DateTimeField(auto_now_add=True, blank=True, null=True)
+    date_updated = models.DateTimeField(auto_now=True, blank=True, null=True)
 
     def __str__(self):
         """Return a textual representation of the account - the name"""
@@ -88,24 +103,31 @@ class Account(models.Model):
     class Meta:
         indexes = [  # Create indexes on fields that are searched.
             models.Index(fields=['date_created'], name='account_date_created_idx'),
+            models.Index(fields=['date_updated'], name='account_date_updated_idx'),
             models.Index(fields=['name'], name='account_name_idx'),
             models.Index(fields=['number'], name='account_number_idx'),
             models.Index(fields=['route'], name='account_route_idx'),
-            models.Index(fields=['street'], name='account_street_idx')
+            models.Index(fields=['street'], name='account_street_idx'),
+            # Prefix (LIKE 'x%') indexes for the typeahead. The name is searched case-insensitively,
+            # so its prefix index is on UPPER(name), in migration 0021.
+            models.Index(fields=['number'], name='account_number_prefix_idx', opclasses=['varchar_pattern_ops']),
+            models.Index(fields=['route'], name='account_route_prefix_idx', opclasses=['varchar_pattern_ops'])
         ]
 
 
-class Check(models.Model):
+class CheckBase(models.Model):
     """
-    The check model. It includes a foreign key to the user who created it,
-    a foreign key to the account it's associated with, and all other necessary
-    fields. The standard fields are check number, amount, and date.
+    The fields and methods shared by checks and archived checks. It includes a
+    foreign key to the user who created it, a foreign key to the account it's
+    associated with, and all other necessary fields. The standard fields are
+    check number, amount, and date.
     Other fields:
         paid: Whether or not the check has been paid, manually or actually
         amount_paid: The amount currently paid on the check
         letter1_date: The date that letter 1 was generated
         letter2_date: The date that letter 2 was generated
         letter3_date: The date that letter 3 was generated
+        date_updated: When the check was last changed, for conditional requests
     """
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     account = models.ForeignKey(Account, on_delete=models.CASCADE, null=True)
@@ -115,6 +137,7 @@ class Check(models.Model):
     amount_paid = models.DecimalField(decimal_places=2, max_digits=10, default=0, null=True)
     date = models.DateField(blank=True, null=True)
     date_created = models.DateTimeField(auto_now_add=True, blank=True, null=True)
+    date_updated = models.DateTimeField(auto_now=True, blank=True, null=True)
     letter1_date = models.DateField(null=True)
     letter2_date = models.DateField(null=True)
     letter3_date = models.DateField(null=True)
@@ -122,7 +145,7 @@ class Check(models.Model):
 
     def __str__(self):
         """Returns a textual representation of the check"""
-        return '{}: {}'.format(self.account.name, self.amount)
+        return '{}: {}'.format(self.account.name if self.account_id else 'Anonymized', self.amount)
 
     def current_letter(self):
         """
@@ -134,10 +157,10 @@ class Check(models.Model):
             3 if letter 3
             -1 if no letter needs to be generated
         """
+        if self.paid:
+            return 0  # Anonymized checks are always paid, so they have no account from here on
         delta = (datetime.datetime.now().date() - self.date_created.date()).days
         wait_period = self.account.company.wait_period
-        if self.paid:
-            return 0
         if not self.letter1_date:
             return 1
         elif not self.letter2_date and delta >= wait_period:
@@ -169,9 +192,43 @@ class Check(models.Model):
         if 1 <= letter <= 3:
             return 'row-warning'
 
+    def late_fee(self):
+        """The late fee of the check's company, none once the check is anonymized"""
+        return self.account.company.late_fee if self.account_id else 0
+
     def amount_due(self):
         """How much is due for this check?"""
-        return self.account.company.late_fee + self.amount - self.amount_paid
+        return self.late_fee() + self.amount - self.amount_paid
+
+    @staticmethod
+    def amount_due_sql(prefix=''):
+        """
+        How much is due, as a database expression for aggregating many checks
+        :param prefix: The path to the checks, e.g. 'check__' to aggregate them from users
+        """
+        return ExpressionWrapper(F(prefix + 'account__company__late_fee') + F(prefix + 'amount') -
+                                 F(prefix + 'amount_paid'),
+                                 output_field=models.DecimalField(decimal_places=2, max_digits=12))
+
+    @staticmethod
+    def letter_due_sql(prefix=''):
+        """
+        Whether a letter is due, as a database filter for counting many checks.
+        The same rules as current_letter, with the wait period of each check's company.
+        :param prefix: The path to the checks, e.g. 'check__' to count them from users
+        """
+        today = datetime.datetime.now().date()
+
+        def created_before(wait_periods):
+            # Created at least this many of the company's wait periods ago
+            days = F(prefix + 'account__company__wait_period') * datetime.timedelta(days=wait_periods)
+            return {prefix + 'date_created__date__lte': ExpressionWrapper(Value(today) - days,
+                                                                          output_field=models.DateField())}
+
+        return Q(**{prefix + 'paid': False}) & (
+            Q(**{prefix + 'letter1_date__isnull': True}) |
+            Q(**{prefix + 'letter1_date__isnull': False, prefix + 'letter2_date__isnull': True}, **created_before(1)) |
+            Q(**{prefix + 'letter2_date__isnull': False, prefix + 'letter3_date__isnull': True}, **created_before(2)))
 
     def pay(self, amount):
         """
@@ -181,16 +238,92 @@ class Check(models.Model):
         """
         ret = 'Successfully paid ${:.2f}'.format(amount)
         self.amount_paid += amount
-        if self.amount_paid >= self.account.company.late_fee + self.amount:
+        if self.amount_paid >= self.late_fee() + self.amount:
             self.paid = True
             self.paid_date = datetime.datetime.now().date()
             ret = 'Successfully paid off check!'
         self.save()
         return ret
 
+    @classmethod
+    def purge(cls, company, before, action='delete', batch_size=500):
+        """
+        Deletes or anonymizes one batch of a company's settled checks, in one
+        transaction. Anonymized checks keep their amounts and dates for the
+        reports, but lose their account, check number, and letter dates.
+        :param company: The company whose checks are purged
+        :param before: Checks paid before this date are purged
+        :param action: 'delete' or 'anonymize'
+        :param batch_size: How many checks to purge
+        :return: How many checks were purged
+        """
+        with transaction.atomic():
+            checks = cls.objects.filter(account__company=company, paid=True, paid_date__lt=before).order_by('pk')
+            ids = list(checks.select_for_update(skip_locked=True, of=('self',))
+                       .values_list('pk', flat=True)[:batch_size])
+            if not ids:
+                return 0
+            from . import audit  # audit imports the models
+            if action == 'anonymize':
+                changes = {'account_id': None, 'number': None, 'letter1_date': None, 'letter2_date': None,
+                           'letter3_date': None}
+                cls.objects.filter(pk__in=ids).update(date_updated=timezone.now(), **changes)
+                audit.record_many('update', cls, ids, changes)
+            else:
+                cls.objects.filter(pk__in=ids).delete()
+                audit.record_many('delete', cls, ids)
+        return len(ids)
+
+    class Meta:
+        abstract = True
+
+
+class Check(CheckBase):
+    """
+    The check model. Settled checks are moved to ArchivedCheck once they
+    are old enough, so this table only holds the checks still in use.
+    """
+
+    class Meta:
+        indexes = [  # Create indexes on fields that are searched.
+            models.Index(fields=['date_created'], name='check_date_created_idx'),
+            models.Index(fields=['date_updated'], name='check_date_updated_idx'),
+            models.Index(fields=['account', 'date_updated'], name='check_account_updated_idx')
+        ]
+
+
+class ArchivedCheck(CheckBase):
+    """
+    A settled check that was moved out of the check table by
+    manage.py archive_checks. It keeps the id and dates it had as a check.
+    """
+    id = models.IntegerField(primary_key=True)
+    date_created = models.DateTimeField(blank=True, null=True)
+    date_updated = models.DateTimeField(blank=True, null=True)
+    date_archived = models.DateTimeField(auto_now_add=True)
+
+    @classmethod
+    def archive(cls, before, batch_size=500):
+        """
+        Moves one batch of paid checks into the archive, in one transaction
+        :param before: Checks paid before this date are moved
+        :param batch_size: How many checks to move
+        :return: How many checks were moved
+        """
+        fields = [f.attname for f in cls._meta.concrete_fields if f.attname != 'date_archived']
+        with transaction.atomic():
+            checks = Check.objects.filter(paid=True, paid_date__lt=before).order_by('pk')
+            checks = list(checks.select_for_update(skip_locked=True).values(*fields)[:batch_size])
+            if not checks:
+                return 0
+            cls.objects.bulk_create([cls(**x) for x in checks])
+            Check.objects.filter(pk__in=[x['id'] for x in checks]).delete()
+        return len(checks)
+
     class Meta:
         indexes = [  # Create indexes on fields that are searched.
-            models.Index(fields=['date_created'], name='check_date_created_idx')
+            models.Index(fields=['date_created'], name='archivedcheck_created_idx'),
+            models.Index(fields=['paid_date'], name='archivedcheck_paid_date_idx')
         ]
 
 
@@ -253,6 +386,362 @@ class Profile(models.Model):
         return (not self.admin()) or self.admin_simulating()
 
 
+class DeletionJob(models.Model):
+    """
+    A company, account, or user being deleted in the background. Everything
+    under it is deleted in small batches, each in its own short transaction,
+    so a large delete never locks the tables for long. The progress is saved
+    after every batch, so a job that was interrupted picks up where it left off.
+    """
+    KINDS = (('company', 'Company'), ('account', 'Account'), ('user', 'User'))
+    STATUSES = (('pending', 'Pending'), ('running', 'Running'), ('done', 'Done'), ('failed', 'Failed'))
+
+    kind = models.CharField(max_length=10, choices=KINDS)
+    object_id = models.IntegerField()
+    name = models.CharField(max_length=150)
+    requested_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, related_name='+')
+    status = models.CharField(max_length=10, choices=STATUSES, default='pending')
+    total = models.IntegerField(default=0)
+    deleted = models.IntegerField(default=0)
+    error = models.CharField(max_length=1000, blank=True, default='')
+    date_created = models.DateTimeField(auto_now_add=True)
+    date_updated = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        """Returns a textual representation of the job"""
+        return 'Delete {} "{}"'.format(self.kind, self.name)
+
+    @classmethod
+    def start(cls, obj, user):
+        """
+        Creates a job to delete an object
+        :param obj: The company, account, or user to delete
+        :param user: The user asking for the delete
+        :return: The job, with its total counted (or the job already deleting it)
+        """
+        kind = obj._meta.model_name
+        running = cls.objects.filter(kind=kind, object_id=obj.pk, status__in=['pending', 'running']).first()
+        if running:
+            return running
+        job = cls(kind=kind, object_id=obj.pk, requested_by=user,
+                  name=(obj.get_username() if isinstance(obj, User) else obj.name) or '')
+        job.total = sum(x.count() for x in job.steps())
+        job.save()
+        return job
+
+    def steps(self):
+        """
+        The rows to delete, in the order they need to be deleted: the checks
+        (current and archived) first, then anything else under the object,
+        then the object itself
+        :return: A list of querysets
+        """
+        if self.kind == 'account':
+            return [Check.objects.filter(account_id=self.object_id),
+                    ArchivedCheck.objects.filter(account_id=self.object_id),
+                    Account.objects.filter(pk=self.object_id)]
+        if self.kind == 'user':
+            return [Check.objects.filter(user_id=self.object_id),
+                    ArchivedCheck.objects.filter(user_id=self.object_id),
+                    User.objects.filter(pk=self.object_id)]
+        return [Check.objects.filter(account__company_id=self.object_id),
+                ArchivedCheck.objects.filter(account__company_id=self.object_id),
+                Account.objects.filter(company_id=self.object_id),
+                Company.objects.filter(pk=self.object_id)]
+
+    def progress(self):
+        """How far along the job is, as a percentage"""
+        return 100 if not self.total else min(100, int(100 * self.deleted / self.total))
+
+    def run(self, batch_size=500, pause=0):
+        """
+        Deletes everything for the job in batches
+        :param batch_size: How many rows to delete per transaction
+        :param pause: Seconds to wait between batches, to let other queries through
+        """
+        if self.kind == 'company':
+            # Admins simulating the company stop simulating it, but
+            # the company's users have to be moved or deleted first
+            Profile.objects.filter(company_id=self.object_id, user__is_superuser=True).update(company=None)
+            if Profile.objects.filter(company_id=self.object_id).exists():
+                self.status = 'failed'
+                self.error = 'The company still has users. Delete them first.'
+                self.save()
+                return
+
+        self.status = 'running'
+        self.save()
+        try:
+            for objects in self.steps():
+                while True:
+                    with transaction.atomic():
+                        ids = list(objects.values_list('pk', flat=True)[:batch_size])
+                        if not ids:
+                            break
+                        objects.model.objects.filter(pk__in=ids).delete()
+                        self.deleted += len(ids)
+                        self.save(update_fields=['deleted', 'date_updated'])
+                    if pause:
+                        time.sleep(pause)
+        except Exception as e:
+            # Record the failure, so the job isn't picked up again as stale
+            logger.exception('%s failed', self)
+            self.status = 'failed'
+            self.error = str(e)[:1000]
+            self.save()
+            return
+        self.status = 'done'
+        self.save()
+
+    class Meta:
+        indexes = [  # Create indexes on fields that are searched.
+            models.Index(fields=['status'], name='deletionjob_status_idx')
+        ]
+
+
+class LetterBatch(models.Model):
+    """
+    The letters due for a whole company, generated in the background.
+    The checks are split into shards by user or by account, the shards are
+    rendered in parallel by any number of process_letters workers, and
+    the worker that finishes the last shard merges them into one PDF.
+    """
+    SHARD_BY = (('user', 'User'), ('account', 'Account'))
+    STATUSES = DeletionJob.STATUSES
+
+    company = models.ForeignKey(Company, on_delete=models.CASCADE)
+    requested_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, related_name='+')
+    shard_by = models.CharField(max_length=10, choices=SHARD_BY, default='user')
+    compact = models.BooleanField(default=False)
+    status = models.CharField(max_length=10, choices=STATUSES, default='pending')
+    total = models.IntegerField(default=0)  # Shards
+    done = models.IntegerField(default=0)  # Shards rendered
+    letters = models.IntegerField(default=0)
+    pdf = models.BinaryField(null=True)
+    error = models.CharField(max_length=1000, blank=True, default='')
+    date_created = models.DateTimeField(auto_now_add=True)
+    date_updated = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        """Returns a textual representation of the batch"""
+        return 'Letters for {} by {}'.format(self.company, self.shard_by)
+
+    @classmethod
+    def start(cls, company, user, shard_by='user', compact=False):
+        """
+        Creates a batch, with a shard for every user or account that has letters due
+        :param company: The company to generate letters for
+        :param user: The user asking for the letters
+        :param shard_by: 'user' or 'account'
+        :param compact: Whether or not to compact the PDFs
+        :return: The batch, already done if no letters are due
+        """
+        checks = Check.objects.filter(Check.letter_due_sql(), user__profile__company=company)
+        keys = sorted(set(checks.values_list(shard_by, flat=True)))
+        with transaction.atomic():
+            batch = cls.objects.create(company=company, requested_by=user, shard_by=shard_by, compact=compact,
+                                       total=len(keys), status='pending' if keys else 'done')
+            LetterShard.objects.bulk_create([LetterShard(batch=batch, key=key) for key in keys])
+        return batch
+
+    def checks(self, shard):
+        """The checks of one shard, in the order their letters are printed"""
+        return Check.objects.filter(user__profile__company=self.company_id, **{self.shard_by: shard.key})\
+            .select_related('account__company').order_by('pk')
+
+    def progress(self):
+        """How far along the batch is, as a percentage"""
+        return 100 if not self.total else min(100, int(100 * self.done / self.total))
+
+    class Meta:
+        indexes = [  # Create indexes on fields that are searched.
+            models.Index(fields=['company', 'date_created'], name='letterbatch_company_idx')
+        ]
+
+
+class LetterShard(models.Model):
+    """The letters of one user or account in a LetterBatch"""
+    batch = models.ForeignKey(LetterBatch, on_delete=models.CASCADE, related_name='shards')
+    key = models.IntegerField()  # The id of the user or account
+    status = models.CharField(max_length=10, choices=DeletionJob.STATUSES, default='pending')
+    letters = models.IntegerField(default=0)
+    pdf = models.BinaryField(null=True)
+    error = models.CharField(max_length=1000, blank=True, default='')
+    claim_id = models.CharField(max_length=32, blank=True, default='')  # Set by the worker rendering it
+    date_updated = models.DateTimeField(auto_now=True)  # Kept fresh by the worker while it renders
+
+    def __str__(self):
+        """Returns a textual representation of the shard"""
+        return '{} #{}'.format(self.batch, self.key)
+
+    @classmethod
+    def claim(cls, stale):
+        """
+        Claims the next waiting shard, or a running shard whose worker stopped
+        :param stale: Minutes without progress before a running shard is stale
+        :return: The shard, or None if there isn't one
+        """
+        cutoff = timezone.now() - datetime.timedelta(minutes=stale)
+        with transaction.atomic():
+            # Skip rows another worker is claiming right now
+            shard = cls.objects.select_for_update(skip_locked=True)\
+                .filter(Q(status='pending') | Q(status='running', date_updated__lt=cutoff))\
+                .order_by('pk').first()
+            if shard:
+                shard.status, shard.claim_id = 'running', uuid.uuid4().hex
+                shard.save()
+        return shard
+
+    def owned(self):
+        """The shard, as long as it is still running under this claim (not picked up by another worker)"""
+        return LetterShard.objects.filter(pk=self.pk, status='running', claim_id=self.claim_id)
+
+    def heartbeat(self):
+        """Shows the shard is still being rendered, so it isn't picked up as stale"""
+        self.owned().update(date_updated=timezone.now())
+
+    class Meta:
+        indexes = [  # Create indexes on fields that are searched.
+            models.Index(fields=['status'], name='lettershard_status_idx')
+        ]
+
+
+class CompanyKPI(models.Model):
+    """
+    The headline numbers of a company for the dashboard. They are
+    recomputed for every company by manage.py refresh_kpis, so
+    showing them is a single lookup.
+    """
+    company = models.OneToOneField(Company, on_delete=models.CASCADE, related_name='kpi')
+    open_checks = models.IntegerField(default=0)
+    outstanding = models.DecimalField(decimal_places=2, max_digits=14, default=0)
+    collected_month = models.DecimalField(decimal_places=2, max_digits=14, default=0)
+    letter1_due = models.IntegerField(default=0)
+    letter2_due = models.IntegerField(default=0)
+    letter3_due = models.IntegerField(default=0)
+    date_updated = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        """Returns a textual representation of the numbers"""
+        return 'KPIs for {}'.format(self.company)
+
+    @classmethod
+    def refresh(cls, company):
+        """
+        Recomputes the numbers of a company in one query, with the same
+        rules as Check.current_letter for which letters are due
+        :param company: The company
+        :return: The saved numbers
+        """
+        today = datetime.datetime.now().date()
+        wait = datetime.timedelta(days=company.wait_period)
+        unpaid = Q(paid=False)
+        stats = Check.objects.filter(user__profile__company=company).aggregate(
+            open_checks=Count('pk', filter=unpaid),
+            outstanding=Sum(Check.amount_due_sql(), filter=unpaid),
+            collected_month=Sum('amount_paid', filter=Q(paid_date__gte=today.replace(day=1))),
+            letter1_due=Count('pk', filter=unpaid & Q(letter1_date__isnull=True)),
+            letter2_due=Count('pk', filter=unpaid & Q(letter1_date__isnull=False, letter2_date__isnull=True,
+                                                      date_created__date__lte=today - wait)),
+            letter3_due=Count('pk', filter=unpaid & Q(letter2_date__isnull=False, letter3_date__isnull=True,
+                                                      date_created__date__lte=today - wait * 2)),
+        )
+        stats = {key: value or 0 for key, value in stats.items()}
+        kpi, created = cls.objects.update_or_create(company=company, defaults=stats)
+        return kpi
+
+    @classmethod
+    def get(cls, company):
+        """The numbers of a company, computed now if they never have been"""
+        return cls.objects.filter(company=company).first() or cls.refresh(company)
+
+
+class ReportMonth(models.Model):
+    """
+    A month whose report totals have been precomputed by
+    manage.py rollup_reports. Its totals are the rollups. When a check
+    changes in a month that was rolled up, the month is dropped, so its
+    charts come from the checks again until the next rollup_reports.
+    """
+    # The check fields the report charts count: the dates they are grouped by, and the amount paid
+    FIELDS = ('paid_date', 'letter1_date', 'letter2_date', 'letter3_date', 'amount_paid')
+    DATES = FIELDS[:4]
+
+    month = models.DateField(unique=True)  # The first day of the month
+    date_updated = models.DateTimeField(auto_now=True)  # When the totals were computed
+
+    def __str__(self):
+        """Returns a textual representation of the month"""
+        return self.month.strftime('%B %Y')
+
+    @classmethod
+    def drop(cls, dates):
+        """
+        Drops the rolled up months some check dates are in. The current
+        month is never rolled up, so dates in it cost nothing.
+        :param dates: Report dates of changed checks (None is skipped)
+        """
+        this_month = datetime.datetime.now().date().replace(day=1)
+        months = {x.replace(day=1) for x in dates if x and x < this_month}
+        if months:
+            cls.objects.filter(month__in=months).delete()
+
+    @classmethod
+    def drop_checks(cls, checks):
+        """
+        Drops the rolled up months a set of checks is counted in,
+        before the checks are updated or deleted in bulk
+        :param checks: The checks that are about to change
+        """
+        cls.drop(date for dates in checks.values_list(*cls.DATES) for date in dates)
+
+
+class ReportRollup(models.Model):
+    """
+    The total of one report chart for one user's checks (current and
+    archived) in one month. Long report ranges add these up instead of
+    aggregating every check.
+    """
+    month = models.ForeignKey(ReportMonth, on_delete=models.CASCADE, related_name='rollups')
+    chart = models.CharField(max_length=20)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    value = models.DecimalField(decimal_places=2, max_digits=14, default=0)
+
+    def __str__(self):
+        """Returns a textual representation of the rollup"""
+        return '{} {} {}: {}'.format(self.month, self.chart, self.user_id, self.value)
+
+    class Meta:
+        indexes = [  # Create indexes on fields that are searched.
+            models.Index(fields=['chart', 'month'], name='reportrollup_chart_month_idx')
+        ]
+
+
+class AuditEvent(models.Model):
+    """
+    One change to a check, account, company, or profile: who made it,
+    what it was, and the fields that changed. Events are only added,
+    never changed. See checkit/audit.py for how they are recorded.
+    """
+    ACTIONS = [('create', 'Created'), ('update', 'Updated'), ('delete', 'Deleted'), ('pay', 'Paid')]
+    user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, related_name='+')
+    action = models.CharField(max_length=10, choices=ACTIONS)
+    model = models.CharField(max_length=20)
+    object_id = models.IntegerField()
+    changes = models.TextField(blank=True)  # JSON of the changed fields and their new values
+    date_created = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        """Returns a textual representation of the event"""
+        return '{} {} #{} by {}'.format(self.get_action_display(), self.model, self.object_id, self.user_id)
+
+    class Meta:
+        indexes = [  # Create indexes on fields that are searched.
+            models.Index(fields=['date_created'], name='auditevent_created_idx'),
+            models.Index(fields=['model', 'object_id', 'date_created'], name='auditevent_object_idx')
+        ]
+
+
 @receiver(post_save, sender=User)
 def create_user_profile(sender, instance, created, **kwargs):
     """Creates the user profile whenever a user is created"""
@@ -264,3 +753,4 @@ def create_user_profile(sender, instance, created, **kwargs):
 def save_user_profile(sender, instance, **kwargs):
     """Saves the user profile whenever the user is saved"""
     instance.profile.save()
+
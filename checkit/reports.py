@@ -0,0 +1,179 @@
+"""
+The data behind the report charts. Each chart groups checks by one of
+their dates into day, week, month, or quarter buckets, picked from the
+length of the date range so a chart never has more than a few dozen bars.
+
+Month and quarter charts add up the monthly totals precomputed by
+
+    python manage.py rollup_reports
+
+for every whole month in the range that has been rolled up, and only
+aggregate the checks themselves for the rest of the range. Saving a check
+or changing checks in bulk drops the rolled up months it changes (see
+ReportMonth.drop), so backdated edits show right away. Purged and
+background-deleted checks stay in their months' totals until the
+months are rolled up again.
+"""
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDay, TruncWeek, TruncMonth, TruncQuarter
+from django.db.models.signals import post_save
+from .models import Check, ArchivedCheck, ReportMonth, ReportRollup
+from . import snapshots
+import datetime
+
+# The charts on the reports page: the date to group by, the aggregate, the title, and the axis
+REPORT_CHARTS = {
+    'paid_count': ('paid_date', Count('paid_date'), 'Checks Paid by Date', 'Paid Date'),
+    'paid_total': ('paid_date', Sum('amount_paid'), 'Total Revenue by Date', 'Date'),
+    'letter1': ('letter1_date', Count('letter1_date'), 'Letter 1 Generated by Date', 'Date'),
+    'letter2': ('letter2_date', Count('letter2_date'), 'Letter 2 Generated by Date', 'Date'),
+    'letter3': ('letter3_date', Count('letter3_date'), 'Letter 3 Generated by Date', 'Date'),
+}
+
+# The buckets, and the longest range (in days) each one is used for
+BUCKETS = [('day', 31, TruncDay), ('week', 180, TruncWeek), ('month', 730, TruncMonth), ('quarter', None, TruncQuarter)]
+
+
+def bucket_size(start_date, end_date):
+    """
+    Picks the bucket for a date range
+    :return: 'day', 'week', 'month', or 'quarter'
+    """
+    days = (end_date - start_date).days + 1
+    for name, longest, trunc in BUCKETS:
+        if longest is None or days <= longest:
+            return name
+
+
+def truncate(bucket, field):
+    """Truncates a date field to the start of its bucket"""
+    return next(trunc for name, longest, trunc in BUCKETS if name == bucket)(field)
+
+
+def month_end(month):
+    """The last day of the month a date is in"""
+    return (month.replace(day=28) + datetime.timedelta(days=4)).replace(day=1) - datetime.timedelta(days=1)
+
+
+def chart_series(checks, start_date, end_date, group, aggregate, bucket='day'):
+    """
+    Aggregates checks by a date in the database, for one chart.
+    :param checks: The check objects to filter by
+    :param start_date: The start date range
+    :param end_date: The end date range
+    :param group: The field to group by (a date)
+    :param aggregate: The aggregate, either Sum/Count
+    :param bucket: The bucket to group the dates into
+    :return: A list of (bucket date, value) pairs in date order
+    """
+    return list(checks
+                .filter(**{'{}__range'.format(group): (start_date, end_date)})
+                .annotate(bucket=truncate(bucket, group))
+                .values_list('bucket')
+                .annotate(value=aggregate)
+                .order_by('bucket'))
+
+
+def merge_series(*series):
+    """
+    Adds up chart series that share dates
+    :param series: Lists of (date, value) pairs
+    :return: One list of (date, value) pairs in date order
+    """
+    totals = {}
+    for pairs in series:
+        for date, value in pairs:
+            totals[date] = totals.get(date, 0) + value
+    return sorted(totals.items())
+
+
+def report_series(name, checks, archived, rollups, start_date, end_date):
+    """
+    The data for one report chart
+    :param name: The chart, one of REPORT_CHARTS
+    :param checks: The checks the user sees reports for
+    :param archived: The archived checks the user sees reports for
+    :param rollups: The rollups of the users whose checks are in the report
+    :param start_date: The start date range
+    :param end_date: The end date range
+    :return: The bucket, and a list of (bucket date, value) pairs in date order
+    """
+    group, aggregate, title, axis = REPORT_CHARTS[name]
+    bucket = bucket_size(start_date, end_date)
+
+    # Whole months that have been rolled up are added up from their totals
+    months = []
+    if bucket in ('month', 'quarter'):
+        months = [x for x in ReportMonth.objects.filter(month__range=(start_date, end_date))
+                  .order_by('month').values_list('month', flat=True) if month_end(x) <= end_date]
+    series = []
+    if months:
+        series.append(rollups.filter(chart=name, month__month__in=months)
+                      .annotate(bucket=truncate(bucket, 'month__month'))
+                      .values_list('bucket')
+                      .annotate(total=Sum('value'))
+                      .order_by('bucket'))
+
+    # The rest of the range is aggregated from the checks
+    archive_cutoff = datetime.datetime.now().date() - datetime.timedelta(days=settings.CHECK_ARCHIVE_DAYS)
+    ranges, start = [], start_date
+    for month in months:
+        if month > start:
+            ranges.append((start, month - datetime.timedelta(days=1)))
+        start = month_end(month) + datetime.timedelta(days=1)
+    if start <= end_date:
+        ranges.append((start, end_date))
+    for start, end in ranges:
+        series.append(chart_series(checks, start, end, group, aggregate, bucket))
+        if start < archive_cutoff:
+            # The range goes back far enough to include archived checks
+            series.append(chart_series(archived, start, end, group, aggregate, bucket))
+    return bucket, merge_series(*series)
+
+
+def rollup_month(month):
+    """
+    Precomputes the totals of every chart for every user in one month,
+    replacing any totals computed before
+    :param month: The first day of the month
+    :return: The number of rollups saved
+    """
+    end = month_end(month)
+    totals = {}
+    for name, (group, aggregate, title, axis) in REPORT_CHARTS.items():
+        for model in (Check, ArchivedCheck):
+            rows = (model.objects
+                    .filter(**{'{}__range'.format(group): (month, end)})
+                    .values_list('user_id')
+                    .annotate(value=aggregate)
+                    .order_by())
+            for user_id, value in rows:
+                totals[(name, user_id)] = totals.get((name, user_id), 0) + (value or 0)
+
+    with transaction.atomic():
+        report_month, created = ReportMonth.objects.get_or_create(month=month)
+        report_month.rollups.all().delete()
+        ReportRollup.objects.bulk_create([ReportRollup(month=report_month, chart=name, user_id=user_id, value=value)
+                                          for (name, user_id), value in totals.items() if value])
+        report_month.save()  # Updates date_updated
+    return len([x for x in totals.values() if x])
+
+
+def drop_report_months(sender, instance, raw=False, **kwargs):
+    """
+    Drops the rolled up months whose totals a check save changed, both
+    the months of its old dates and of its new ones. bulk_update doesn't
+    send signals, so it is also called after bulk updates of loaded checks.
+    """
+    old = snapshots.loaded(instance)
+    new = {x: instance.__dict__.get(x) for x in ReportMonth.FIELDS}
+    if not raw and any(old.get(x) != new[x] for x in ReportMonth.FIELDS):
+        ReportMonth.drop([old.get(x) for x in ReportMonth.DATES] + [new[x] for x in ReportMonth.DATES])
+
+
+def connect():
+    """Connects the signal receivers, from CheckitConfig.ready()"""
+    post_save.connect(drop_report_months, sender=Check, dispatch_uid='reports_save')
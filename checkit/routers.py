@@ -0,0 +1,79 @@
+"""
+This file contains the database router. Writes and most reads go to the
+default database. Reads made while replica reads are turned on (by
+ReplicaMiddleware, for the read-only views in settings.REPLICA_VIEWS)
+go to one of the read replicas in settings.REPLICA_DATABASES instead.
+"""
+
+from contextlib import contextmanager
+from django.conf import settings
+from django.db import connections
+import random
+import threading
+
+# Whether or not the current thread reads from a replica
+_state = threading.local()
+
+
+@contextmanager
+def replica_reads():
+    """Sends the reads inside the block to a read replica, if there are any"""
+    previous = getattr(_state, 'replica', False)
+    _state.replica = True
+    try:
+        yield
+    finally:
+        _state.replica = previous
+
+
+def replica_stream(content):
+    """
+    Reads from a replica while a streamed response is sent, which happens
+    after the view (and the replica_reads block around it) has returned
+    :param content: The streaming content of the response
+    :return: The same content
+    """
+    iterator, end = iter(content), object()
+    while True:
+        with replica_reads():
+            chunk = next(iterator, end)
+        if chunk is end:
+            return
+        yield chunk
+
+
+class ReplicaRouter:
+    """Routes reads to the replicas when they are turned on, and everything else to default."""
+
+    def db_for_read(self, model, **hints):
+        """The database to read a model from"""
+        if getattr(_state, 'replica', False) and settings.REPLICA_DATABASES:
+            return random.choice(settings.REPLICA_DATABASES)
+        return 'default'
+
+    def db_for_write(self, model, **hints):
+        """The database to write a model to, always the primary"""
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        """Replicas hold the same rows as default, so objects from any of them can be related"""
+        databases = ['default'] + list(settings.REPLICA_DATABASES)
+        return obj1._state.db in databases and obj2._state.db in databases
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        """Only the primary is migrated, the replicas copy it"""
+        return db not in settings.REPLICA_DATABASES
+
+
+def replica_lag():
+    """
+    How far the read replicas are behind the primary
+    :return: The seconds the furthest behind replica is behind, 0 if they are caught up or there are none
+    """
+    lag = 0
+    for alias in settings.REPLICA_DATABASES:
+        with connections[alias].cursor() as cursor:
+            cursor.execute('SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 '
+                           'ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END')
+            lag = max(lag, cursor.fetchone()[0] or 0)
+    return lag
@@ -0,0 +1,39 @@
+"""
+The row cache of the check index. Each row of checks/index.html is
+rendered once and kept in the 'rows' cache, keyed by the check's id, its
+version, whether the viewer is an admin (only they get the delete
+action), and whether it is an archived check. The version is when the
+check, its account (whose name is in the row), and the account's company
+(whose wait period sets row_status) last changed, plus today's date,
+since row_status moves on as the letters fall due.
+
+The index loads the account and company with every check anyway, so the
+version costs no queries. Any save or bulk update sets date_updated,
+which changes the key, so every worker stops serving a stale row right
+away without any signals. The old rows are never read again, and expire
+after settings.ROW_CACHE_SECONDS (or are culled when the cache is full).
+"""
+
+from django.core.cache import caches
+from django.core.cache.utils import make_template_fragment_key
+import datetime
+
+# The name of the cached fragment in checks/index.html
+FRAGMENT = 'check_row'
+
+cache = caches['rows']
+
+
+def version(check):
+    """
+    The version of a check's row
+    :param check: The check, with its account and company loaded
+    """
+    account = check.account if check.account_id else None  # Anonymized checks have no account
+    updates = [check.date_updated, account and account.date_updated, account and account.company.date_updated]
+    return '-'.join([str(x.timestamp()) if x else '' for x in updates] + [str(datetime.date.today())])
+
+
+def key(check, admin, archived=False):
+    """The cache key of a check's row, as the template tag in checks/index.html makes it"""
+    return make_template_fragment_key(FRAGMENT, [check.id, version(check), admin, archived])
@@ -0,0 +1,43 @@
+"""
+The field values an object was loaded with. The audit log and the
+report rollups both need to know what a save changed, so one post_init
+receiver keeps a single copy of the loaded fields for both of them,
+instead of each taking its own. The copy is refreshed by a
+post_save receiver connected after theirs, so they all see the values
+from before the save.
+"""
+
+from django.db.models.signals import post_init, post_save
+
+
+def fields(instance):
+    """The loaded field values of an object"""
+    return {f.attname: instance.__dict__[f.attname] for f in instance._meta.concrete_fields
+            if f.attname in instance.__dict__}
+
+
+def loaded(instance):
+    """The field values an object was loaded or last saved with, empty for a new object"""
+    return getattr(instance, '_loaded_fields', {})
+
+
+def remember(sender, instance, **kwargs):
+    """Keeps the field values of a loaded object"""
+    if instance.pk is not None:
+        instance._loaded_fields = fields(instance)
+
+
+def refresh(sender, instance, **kwargs):
+    """Keeps the field values of a saved object, once every other receiver has seen the save"""
+    instance._loaded_fields = fields(instance)
+
+
+def connect(models):
+    """
+    Connects the signal receivers, from CheckitConfig.ready(), after
+    the receivers that read the values
+    :param models: The models to keep the values of
+    """
+    for model in models:
+        post_init.connect(remember, sender=model, dispatch_uid='snapshot_init')
+        post_save.connect(refresh, sender=model, dispatch_uid='snapshot_save')
@@ -39,6 +39,42 @@ $(document).ready(() => {
     event.stopPropagation();
   });
 
+  // Select or deselect every row for a bulk action
+  $('.select-all').change(function() {
+    $('.select-row').prop('checked', $(this).prop('checked'));
+  });
+
+  // Make sure bulk deletes are confirmed
+  $('.bulk-form').submit(function() {
+    if($(this).find('select[name="action"]').val() !== 'delete') return true;
+    let count = $(this).find('.select-row:checked').length;
+    return confirm('Are you sure you want to delete ' + count + ' selected items?');
+  });
+
+  // Load the report charts, all at once, after the page has shown
+  $('.chart[data-url]').each((i, chart) => {
+    $.getJSON($(chart).data('url'), (data) => {
+      Highcharts.chart(chart, {
+        chart: { type: 'column' },
+        title: { text: data.title },
+        xAxis: { title: { text: data.axis }, categories: data.categories },
+        yAxis: { title: { text: null } },
+        legend: { enabled: false },
+        series: [{ name: data.title, data: data.values }]
+      });
+    });
+  });
+
+  // Find an account as it's typed, and go to its new check page
+  $('.account-typeahead').each((i, input) => {
+    $(input).autocomplete({
+      source: $(input).data('url'),
+      minLength: 1,
+      delay: 100,
+      select: (event, ui) => { window.location.href = ui.item.url; }
+    });
+  });
+
   // Make the settings icons spin on hover
   $('.fa-cog').hover(function() {
     $(this).toggleClass('fa-spin');
@@ -1,4 +1,5 @@
 from django import template
+from checkit import rows
 
 register = template.Library()
 
@@ -6,3 +7,9 @@ register = template.Library()
 @register.filter
 def sort_to_field(value):
     return value.replace('-', '')
+
+
+@register.filter
+def row_version(check):
+    """The version of a check's row in the row cache"""
+    return rows.version(check)
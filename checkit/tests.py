@@ -4,11 +4,41 @@ Tests include creating, updating, and deleting.
 """
 
 
-from django.test import TestCase, RequestFactory, Client
+from django.http import StreamingHttpResponse
+from django.conf import settings
+from django.test import TestCase, RequestFactory, Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.db import connection, IntegrityError
+from django.core.management import call_command
 from django.contrib.messages.storage.fallback import FallbackStorage
+from django.contrib.sessions.models import Session
 from django.urls import reverse, resolve
+from django.utils import timezone
 from .models import *
-from .views import account_delete
+from django.template.loader import get_template
+from .views import account_delete, render_pdf, render_letter_shard, user_workload, check_totals
+from .middleware import AuditMiddleware, ReplicaMiddleware
+from .routers import ReplicaRouter, replica_reads
+from .typeahead import PrefixCache
+from . import audit, rows
+from .reports import bucket_size, rollup_month
+from pypdf import PdfReader
+from asgiref.sync import async_to_sync
+from asgiref.testing import ApplicationCommunicator
+from unicoders import asgi
+from unicoders.logs import JsonFormatter, QueueStreamHandler, RequestContextFilter, SamplingFilter, start_request, \
+    end_request
+from io import BytesIO, StringIO
+import base64
+import csv
+import datetime
+import json
+import logging
+import os
+import tempfile
+import unittest
+from unittest import mock
+import zipfile
 
 
 class AccountTests(TestCase):
@@ -154,3 +184,1078 @@ class CompanyTests(TestCase):
         # Make sure the company has been deleted
         companies = Company.objects.filter(pk=self.company.id)
         self.assertEqual(companies.count(), 0)
+
+
+class LetterTests(TestCase):
+    """
+    Letter tests for the system. Tests to make sure
+    letters are generated for checks that need them.
+    """
+
+    def setUp(self):
+        """Runs the setup before every other test in the LetterTests"""
+        self.company = Company.objects.create(name='Test Company', street='123 Company Way', city='Greenville', state='SC', zip_code='29614')
+        self.user = User.objects.create_user(username='testuser', email='testuser@gmail.com', password='password')
+        self.user.profile.company = self.company
+        self.user.save()
+        self.client = Client()
+        self.client.login(username=self.user.username, password='password')
+        self.account = Account.objects.create(name='Test Account', company=self.company)
+        self.check = Check.objects.create(number=3232, amount='55.22', date='2018-11-08', account=self.account, user=self.user)
+
+    def test_zip(self):
+        """Tests that the zip output streams one PDF per letter"""
+        Check.objects.create(number=3233, amount='10.00', date='2018-11-08', account=self.account, user=self.user)
+        response = self.client.get(reverse('letter'), {'output': 'zip'})
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'application/zip')
+
+        # Make sure every check got its own letter
+        archive = zipfile.ZipFile(BytesIO(b''.join(response.streaming_content)))
+        self.assertEqual(len(archive.namelist()), 2)
+        self.assertTrue(all(archive.read(name).startswith(b'%PDF') for name in archive.namelist()))
+        self.check.refresh_from_db()
+        self.assertIsNotNone(self.check.letter1_date)
+
+    def test_compact(self):
+        """Tests that compact PDFs keep every page and come out smaller"""
+        html = get_template('letters/letters.html').render({'checks': [self.check], 'company': self.company, 'user': self.user})
+        pdf = render_pdf(html)
+        compact = render_pdf(html, compact=True)
+        self.assertLess(len(compact), len(pdf))
+        self.assertEqual(len(PdfReader(BytesIO(compact)).pages), len(PdfReader(BytesIO(pdf)).pages))
+
+    def test_not_modified(self):
+        """Tests that refreshing the letters sends a 304 until a check changes"""
+        response = self.client.get(reverse('letter'))
+        self.assertEqual(response.status_code, 200)
+        response = self.client.get(reverse('letter'), HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+        url = reverse('check_letter1', args=[self.check.id])
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.check.amount = '60.00'
+        self.check.save()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+        # The letters print the account's address, so editing it changes them too
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.check.account.street = '2 New Street'
+        self.check.account.save()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+        # Only the ETag is compared, since a page can change without a newer row
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE='Sat, 01 Jan 2050 00:00:00 GMT')
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.has_header('Last-Modified'))
+
+
+class AsgiTests(TestCase):
+    """
+    ASGI tests for the system. Tests to make sure requests
+    go to the right thread pool and get a response.
+    """
+
+    def test_heavy(self):
+        """Tests that PDF and report pages go to the heavy pool"""
+        self.assertTrue(asgi.heavy(reverse('letter')))
+        self.assertTrue(asgi.heavy(reverse('report')))
+        self.assertFalse(asgi.heavy(reverse('check_index')))
+        self.assertFalse(asgi.heavy('/not/a/page/'))
+
+    def test_cookie(self):
+        """Tests that cookies are sent without the leading space h11 rejects"""
+        scope = {'type': 'http', 'method': 'GET', 'path': reverse('login'), 'query_string': b'',
+                 'http_version': '1.1', 'headers': []}
+
+        async def request():
+            communicator = ApplicationCommunicator(asgi.application, scope)
+            await communicator.send_input({'type': 'http.request'})
+            return await communicator.receive_output(10)
+
+        # The login page sets the CSRF cookie
+        with self.settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage'):
+            headers = async_to_sync(request)()['headers']
+        cookies = [v for k, v in headers if k.lower() == b'set-cookie']
+        self.assertTrue(cookies)
+        self.assertTrue(all(v == v.strip() for v in cookies))
+
+    def test_request(self):
+        """Tests that a request is answered through the ASGI application"""
+        scope = {'type': 'http', 'method': 'GET', 'path': reverse('check_index'), 'query_string': b'',
+                 'http_version': '1.1', 'headers': []}
+
+        async def request():
+            communicator = ApplicationCommunicator(asgi.application, scope)
+            await communicator.send_input({'type': 'http.request'})
+            return await communicator.receive_output(10)
+
+        # Logged out users get sent to the login page
+        self.assertEqual(async_to_sync(request)()['status'], 302)
+
+
+class ApiTests(TestCase):
+    """
+    API tests for the system. Tests to make sure users only
+    see what they have access to, and that bulk actions work.
+    """
+
+    def setUp(self):
+        """Runs the setup before every other test in the ApiTests"""
+        self.company = Company.objects.create(name='Test Company', late_fee=50)
+        self.other = Company.objects.create(name='Other Company', late_fee=50)
+        self.user = User.objects.create_user(username='testuser', email='testuser@gmail.com', password='password')
+        self.user.profile.company = self.company
+        self.user.save()
+        self.client = Client()
+        self.client.login(username=self.user.username, password='password')
+        self.account = Account.objects.create(name='Test Account', company=self.company)
+        self.other_account = Account.objects.create(name='Other Account', company=self.other)
+        self.checks = [Check.objects.create(number=i, amount='10.00', account=self.account, user=self.user) for i in range(3)]
+
+    def test_login(self):
+        """Tests that logged out users get a JSON error"""
+        response = Client().get(reverse('api_checks'))
+        self.assertEqual(response.status_code, 401)
+
+    def test_list(self):
+        """Tests field selection, cursor pagination, and scoping"""
+        response = self.client.get(reverse('api_accounts'), {'fields': 'name'})
+        self.assertEqual(response.json()['results'], [{'id': self.account.id, 'name': 'Test Account'}])
+
+        response = self.client.get(reverse('api_checks'), {'fields': 'number', 'limit': 2}).json()
+        self.assertEqual([x['number'] for x in response['results']], [0, 1])
+        response = self.client.get(reverse('api_checks'), {'fields': 'number', 'cursor': response['next_cursor']}).json()
+        self.assertEqual([x['number'] for x in response['results']], [2])
+        self.assertIsNone(response['next_cursor'])
+
+        response = self.client.get(reverse('api_checks'), {'fields': 'user__password'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_create(self):
+        """Tests bulk creation of checks, and that other companies' accounts are off limits"""
+        data = [{'account': self.account.id, 'number': 10, 'amount': '5.00', 'date': '2018-11-08'},
+                {'account': self.account.id, 'number': 11, 'amount': '6.00', 'date': '2018-11-09', 'paid': True}]
+        response = self.client.post(reverse('api_checks'), json.dumps(data), content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Check.objects.filter(pk__in=response.json()['created'], user=self.user).count(), 2)
+        self.assertIsNone(Check.objects.get(number=10).paid_date)
+        self.assertIsNotNone(Check.objects.get(number=11).paid_date)
+
+        data = {'account': self.other_account.id, 'number': 12, 'amount': '5.00', 'date': '2018-11-08'}
+        response = self.client.post(reverse('api_checks'), json.dumps(data), content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_update(self):
+        """Tests bulk updates of checks"""
+        data = [{'id': self.checks[0].id, 'paid': True}, {'id': self.checks[1].id, 'amount': '99.99'}]
+        response = self.client.patch(reverse('api_checks'), json.dumps(data), content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.checks[0].refresh_from_db()
+        self.checks[1].refresh_from_db()
+        self.assertTrue(self.checks[0].paid)
+        self.assertIsNotNone(self.checks[0].paid_date)
+        self.assertEqual(str(self.checks[1].amount), '99.99')
+
+    def test_payments(self):
+        """Tests posting payments"""
+        data = [{'check': self.checks[0].id, 'amount': '60.00'}, {'check': self.checks[1].id, 'amount': '5.00'}]
+        response = self.client.post(reverse('api_payments'), json.dumps(data), content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.checks[0].refresh_from_db()
+        self.assertTrue(self.checks[0].paid)
+        response = self.client.get(reverse('api_payments'), {'fields': 'amount_paid'})
+        self.assertEqual(len(response.json()['results']), 2)
+        for amount in ('NaN', 'Infinity'):
+            data = [{'check': self.checks[2].id, 'amount': amount}]
+            response = self.client.post(reverse('api_payments'), json.dumps(data), content_type='application/json')
+            self.assertEqual(response.status_code, 400)
+
+    def test_auth(self):
+        """Tests that session writes need the CSRF header, and Basic auth doesn't"""
+        client = Client(enforce_csrf_checks=True)
+        client.login(username=self.user.username, password='password')
+        data = json.dumps([{'id': self.checks[0].id, 'amount': '20.00'}])
+        response = client.patch(reverse('api_checks'), data, content_type='application/json')
+        self.assertEqual(response.status_code, 403)
+        client.cookies['csrftoken'] = 'a' * 32
+        response = client.patch(reverse('api_checks'), data, content_type='application/json', HTTP_X_CSRFTOKEN='a' * 32)
+        self.assertEqual(response.status_code, 200)
+
+        client = Client(enforce_csrf_checks=True)
+        basic = 'Basic ' + base64.b64encode(b'testuser:password').decode()
+        response = client.patch(reverse('api_checks'), data, content_type='application/json', HTTP_AUTHORIZATION=basic)
+        self.assertEqual(response.status_code, 200)
+        basic = 'Basic ' + base64.b64encode(b'testuser:wrong').decode()
+        response = client.get(reverse('api_checks'), HTTP_AUTHORIZATION=basic)
+        self.assertEqual(response.status_code, 401)
+
+    def test_admin_account(self):
+        """Tests that admins must say which company a new account is under"""
+        self.user.is_superuser = True
+        self.user.profile.company = None
+        self.user.save()
+        data = {'name': 'New', 'number': '1', 'route': '209375993', 'street': 'a', 'city': 'b', 'state': 'c',
+                'zip_code': '12345'}
+        response = self.client.post(reverse('api_accounts'), json.dumps(data), content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        data['company'] = self.other.id
+        response = self.client.post(reverse('api_accounts'), json.dumps(data), content_type='application/json')
+        self.assertEqual(Account.objects.get(pk=response.json()['created'][0]).company, self.other)
+
+
+class BulkTests(TestCase):
+    """
+    Bulk action tests for the system. Tests to make sure
+    actions run on the selected rows, and only if allowed.
+    """
+
+    def setUp(self):
+        """Runs the setup before every other test in the BulkTests"""
+        self.company = Company.objects.create(name='Test Company', late_fee=50)
+        self.user = User.objects.create_user(username='testuser', email='testuser@gmail.com', password='password')
+        self.user.profile.company = self.company
+        self.user.save()
+        self.client = Client()
+        self.client.login(username=self.user.username, password='password')
+        self.account = Account.objects.create(name='Test Account', company=self.company)
+        self.checks = [Check.objects.create(number=i, amount='10.00', account=self.account, user=self.user) for i in range(3)]
+        self.ids = [self.checks[0].id, self.checks[1].id]
+
+    def test_paid(self):
+        """Tests marking checks paid, then unpaid"""
+        self.client.post(reverse('check_bulk'), {'action': 'paid', 'ids': self.ids})
+        self.assertEqual(Check.objects.filter(paid=True, paid_date__isnull=False).count(), 2)
+        self.client.post(reverse('check_bulk'), {'action': 'unpaid', 'ids': self.ids})
+        self.assertEqual(Check.objects.filter(paid=True).count(), 0)
+
+    def test_pay(self):
+        """Tests posting a payment on each selected check"""
+        self.client.post(reverse('check_bulk'), {'action': 'pay', 'amount': '30.00', 'ids': self.ids})
+        self.client.post(reverse('check_bulk'), {'action': 'pay', 'amount': '30.00', 'ids': self.ids[:1]})
+        self.checks[0].refresh_from_db()
+        self.checks[1].refresh_from_db()
+        self.assertTrue(self.checks[0].paid)
+        self.assertEqual(str(self.checks[0].amount_paid), '60.00')
+        self.assertFalse(self.checks[1].paid)
+        self.assertEqual(str(self.checks[1].amount_paid), '30.00')
+
+    def test_delete(self):
+        """Tests that only admins can delete in bulk"""
+        self.client.post(reverse('check_bulk'), {'action': 'delete', 'ids': self.ids})
+        self.assertEqual(Check.objects.count(), 3)
+        self.user.is_superuser = True
+        self.user.save()
+        self.client.post(reverse('check_bulk'), {'action': 'delete', 'ids': self.ids})
+        self.assertEqual(Check.objects.count(), 1)
+
+    def test_account_letters(self):
+        """Tests generating the letters for the checks of the selected accounts"""
+        response = self.client.post(reverse('account_bulk'), {'action': 'letters', 'ids': [self.account.id]})
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+        self.assertEqual(Check.objects.filter(letter1_date__isnull=False).count(), 3)
+
+
+class DeletionTests(TestCase):
+    """
+    Deletion tests for the system. Tests to make sure big deletes
+    are left to the background worker, which deletes everything.
+    """
+
+    def setUp(self):
+        """Runs the setup before every other test in the DeletionTests"""
+        self.user = User.objects.create_user(username='testadmin', email='testadmin@gmail.com', password='password', is_superuser=True)
+        self.client = Client()
+        self.client.login(username=self.user.username, password='password')
+        self.company = Company.objects.create(name='Test Company')
+        self.account = Account.objects.create(name='Test Account', company=self.company)
+        Check.objects.bulk_create([Check(number=i, amount='10.00', account=self.account, user=self.user) for i in range(5)])
+
+    @override_settings(DELETION_BATCH_SIZE=2)
+    def test_background(self):
+        """Tests that a big delete runs in the background, in batches"""
+        self.client.get(reverse('company_delete', args=[self.company.id]))
+        job = DeletionJob.objects.get()
+        self.assertEqual((job.status, job.total), ('pending', 7))
+        self.assertTrue(Company.objects.filter(pk=self.company.id).exists())
+
+        call_command('process_deletions', '--once', '--batch-size', '2', '--pause', '0')
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.deleted), ('done', 7))
+        self.assertFalse(Company.objects.filter(pk=self.company.id).exists())
+        self.assertEqual(Check.objects.count(), 0)
+
+    def test_company_users(self):
+        """Tests that a company with users isn't deleted"""
+        user = User.objects.create_user(username='testuser', password='password')
+        user.profile.company = self.company
+        user.save()
+        self.client.get(reverse('company_delete', args=[self.company.id]))
+        self.assertEqual(DeletionJob.objects.get().status, 'failed')
+        self.assertTrue(Company.objects.filter(pk=self.company.id).exists())
+
+    def test_error(self):
+        """Tests that a batch that fails marks the job failed, inline and in the worker"""
+        fail = mock.patch('django.db.models.query.QuerySet.delete', side_effect=IntegrityError('Broken batch'))
+        with fail:
+            response = self.client.get(reverse('account_delete', args=[self.account.id]))
+        self.assertEqual(response.status_code, 302)
+        job = DeletionJob.objects.get()
+        self.assertEqual((job.status, job.error), ('failed', 'Broken batch'))
+
+        job = DeletionJob.start(self.company, self.user)
+        with fail:
+            call_command('process_deletions', '--once', '--pause', '0')
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.error), ('failed', 'Broken batch'))
+        self.assertTrue(Account.objects.filter(pk=self.account.id).exists())
+
+
+class ReportTests(TestCase):
+    """
+    Report tests for the system. Tests to make sure the chart
+    data is aggregated by date for the checks a user can see.
+    """
+
+    def setUp(self):
+        """Runs the setup before every other test in the ReportTests"""
+        self.company = Company.objects.create(name='Test Company')
+        self.account = Account.objects.create(name='Test Account', company=self.company)
+        self.user = User.objects.create_user(username='testuser', email='testuser@gmail.com', password='password')
+        self.user.profile.company = self.company
+        self.user.save()
+        self.other = User.objects.create_user(username='otheruser', email='otheruser@gmail.com', password='password')
+        self.client = Client()
+        self.client.login(username=self.user.username, password='password')
+        day = datetime.date(2018, 11, 8)
+        Check.objects.create(account=self.account, user=self.user, amount=10, amount_paid=10, paid_date=day)
+        Check.objects.create(account=self.account, user=self.user, amount=10, amount_paid=5, paid_date=day)
+        Check.objects.create(account=self.account, user=self.other, amount=10, amount_paid=10, paid_date=day)
+        self.params = {'start_date': '11/01/2018', 'end_date': '11/30/2018'}
+
+    def test_chart(self):
+        """Tests that a chart is grouped by date, with only the user's checks"""
+        response = self.client.get(reverse('report_chart', args=['paid_total']), self.params)
+        data = json.loads(response.content)
+        self.assertEqual(data['categories'], ['2018-11-08'])
+        self.assertEqual(data['values'], [15.0])
+        response = self.client.get(reverse('report_chart', args=['paid_count']), self.params)
+        self.assertEqual(json.loads(response.content)['values'], [2])
+
+    def test_buckets(self):
+        """Tests that long ranges are grouped into months, from the rollups where there are any"""
+        params = {'start_date': '01/01/2018', 'end_date': '12/31/2018'}
+        response = self.client.get(reverse('report_chart', args=['paid_total']), params)
+        data = json.loads(response.content)
+        self.assertEqual((data['bucket'], data['categories'], data['values']), ('month', ['2018-11-01'], [15.0]))
+
+        # A rolled up month is served from its totals, the checks themselves aren't read again
+        # (a raw update doesn't drop the month, the bulk actions do that with ReportMonth.drop_checks)
+        rollup_month(datetime.date(2018, 11, 1))
+        Check.objects.filter(user=self.user).update(amount_paid=0)
+        response = self.client.get(reverse('report_chart', args=['paid_total']), params)
+        self.assertEqual(json.loads(response.content)['values'], [15.0])
+
+        # Until a check in the month is changed, which drops the month until it is rolled up again
+        check = Check.objects.filter(user=self.user).first()
+        check.amount_paid = 7
+        check.save()
+        self.assertFalse(ReportMonth.objects.exists())
+        response = self.client.get(reverse('report_chart', args=['paid_total']), params)
+        self.assertEqual(json.loads(response.content)['values'], [7.0])
+        call_command('rollup_reports', stdout=StringIO())
+        self.assertTrue(ReportMonth.objects.filter(month=datetime.date(2018, 11, 1)).exists())
+        self.assertEqual(bucket_size(datetime.date(2018, 1, 1), datetime.date(2018, 3, 1)), 'week')
+        self.assertEqual(bucket_size(datetime.date(2016, 1, 1), datetime.date(2018, 3, 1)), 'quarter')
+
+    def test_bad_chart(self):
+        """Tests that unknown charts and bad dates are rejected"""
+        self.assertEqual(self.client.get(reverse('report_chart', args=['nope']), self.params).status_code, 404)
+        self.assertEqual(self.client.get(reverse('report_chart', args=['letter1'])).status_code, 400)
+
+    def test_not_modified(self):
+        """Tests that chart data sends a 304 until a check is added, changed, or deleted"""
+        url = reverse('report_chart', args=['paid_total'])
+        etag = self.client.get(url, self.params)['ETag']
+        self.assertEqual(self.client.get(url, self.params, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        check = Check.objects.create(account=self.account, user=self.user, amount=10)
+        response = self.client.get(url, self.params, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        check.delete()
+        self.assertEqual(self.client.get(url, self.params, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 200)
+
+
+@override_settings(REPLICA_DATABASES=['replica1'])
+class ReplicaTests(TestCase):
+    """
+    Replica tests for the system. Tests to make sure read-only views
+    read from a replica, and users who just posted a change don't.
+    """
+
+    def setUp(self):
+        """Runs the setup before every other test in the ReplicaTests"""
+        self.user = User.objects.create_user(username='testuser', email='testuser@gmail.com', password='password')
+        self.client = Client()
+        self.client.login(username=self.user.username, password='password')
+        self.middleware = ReplicaMiddleware(lambda request: None)
+
+    def test_router(self):
+        """Tests that only reads inside replica_reads go to a replica"""
+        router = ReplicaRouter()
+        self.assertEqual(router.db_for_read(Check), 'default')
+        with replica_reads():
+            self.assertEqual(router.db_for_read(Check), 'replica1')
+            self.assertEqual(router.db_for_write(Check), 'default')
+        self.assertFalse(router.allow_migrate('replica1', 'checkit'))
+
+    def test_pin(self):
+        """Tests that posting a change pins the user to the primary"""
+        request = RequestFactory().get(reverse('check_index'))
+        request.session = self.client.session
+        self.assertTrue(self.middleware.use_replica(request))
+        self.assertFalse(self.middleware.use_replica(RequestFactory().get(reverse('letter'))))
+
+        self.client.post(reverse('check_bulk'))
+        request.session = self.client.session
+        self.assertFalse(self.middleware.use_replica(request))
+
+    def test_no_session(self):
+        """Tests that API writes with Basic auth don't start a session to pin"""
+        sessions = Session.objects.count()
+        basic = 'Basic ' + base64.b64encode(b'testuser:password').decode()
+        response = Client().post(reverse('api_checks'), '[]', content_type='application/json', HTTP_AUTHORIZATION=basic)
+        self.assertEqual(response.status_code, 201)
+        self.assertNotIn(settings.SESSION_COOKIE_NAME, response.cookies)
+        self.assertEqual(Session.objects.count(), sessions)
+
+    def test_stream(self):
+        """Tests that streamed responses keep reading from the replica while they are sent"""
+        router = ReplicaRouter()
+        stream = (router.db_for_read(Check) for i in range(2))
+        middleware = ReplicaMiddleware(lambda request: StreamingHttpResponse(stream))
+        request = RequestFactory().get(reverse('aging'))
+        request.session = self.client.session
+        response = middleware(request)
+        self.assertEqual(b''.join(response.streaming_content), b'replica1replica1')
+        self.assertEqual(router.db_for_read(Check), 'default')
+
+
+class TypeaheadTests(TestCase):
+    """
+    Typeahead tests for the system. Tests to make sure accounts are found
+    by prefix, only in the user's company, and the cache stays fresh.
+    """
+
+    def setUp(self):
+        """Runs the setup before every other test in the TypeaheadTests"""
+        self.company = Company.objects.create(name='Test Company')
+        other = Company.objects.create(name='Other Company')
+        self.user = User.objects.create_user(username='testuser', email='testuser@gmail.com', password='password')
+        self.user.profile.company = self.company
+        self.user.save()
+        self.client = Client()
+        self.client.login(username=self.user.username, password='password')
+        self.account = Account.objects.create(name='Acme', number='12345', route='209375993', company=self.company)
+        Account.objects.create(name='Zed', number='ACME1', route='111111111', company=self.company)
+        Account.objects.create(name='Acme Other', number='12399', route='209375993', company=other)
+
+    def search(self, term):
+        """Returns the names of the accounts found for a term"""
+        response = self.client.get(reverse('account_typeahead'), {'term': term})
+        return [x['name'] for x in json.loads(response.content)]
+
+    def test_prefix(self):
+        """Tests that accounts are found by the start of the name, number, or route"""
+        self.assertEqual(self.search('acm'), ['Acme'])
+        self.assertEqual(self.search('ACM'), ['Acme', 'Zed'])
+        self.assertEqual(self.search('123'), ['Acme'])
+        self.assertEqual(self.search('2093'), ['Acme'])
+        self.assertEqual(self.search('345'), [])
+
+    def test_cache(self):
+        """Tests that changing an account clears the cached results"""
+        self.assertEqual(self.search('Acm'), ['Acme'])
+        self.account.name = 'Beta'
+        self.account.save()
+        self.assertEqual(self.search('Acm'), [])
+        self.assertEqual(self.search('Bet'), ['Beta'])
+
+    def test_no_company(self):
+        """Tests that users without a company aren't served the admins' results"""
+        admin = User.objects.create_user(username='testadmin', password='password', is_superuser=True)
+        self.client.login(username=admin.username, password='password')
+        self.assertEqual(self.search('Acme'), ['Acme', 'Acme Other'])
+        loner = User.objects.create_user(username='testloner', password='password')
+        self.client.login(username=loner.username, password='password')
+        self.assertEqual(self.search('Acme'), [])
+
+    def test_lru(self):
+        """Tests that the least recently used prefix is dropped"""
+        cache = PrefixCache(2, 60)
+        cache.set(1, 'a', ['a'])
+        cache.set(1, 'b', ['b'])
+        cache.get(1, 'a')
+        cache.set(1, 'c', ['c'])
+        self.assertEqual((cache.get(1, 'a'), cache.get(1, 'b'), cache.get(1, 'c')), (['a'], None, ['c']))
+        self.assertIsNone(cache.get(2, 'a'))
+
+
+class ArchiveTests(TestCase):
+    """
+    Archive tests for the system. Tests to make sure old settled checks
+    move to the archive, and can still be found and deleted.
+    """
+
+    def setUp(self):
+        """Runs the setup before every other test in the ArchiveTests"""
+        self.company = Company.objects.create(name='Test Company')
+        self.account = Account.objects.create(name='Test Account', company=self.company)
+        self.user = User.objects.create_user(username='testuser', email='testuser@gmail.com', password='password')
+        self.user.profile.company = self.company
+        self.user.save()
+        old = datetime.date.today() - datetime.timedelta(days=400)
+        self.old = Check.objects.create(account=self.account, user=self.user, amount=10, paid=True, paid_date=old)
+        self.recent = Check.objects.create(account=self.account, user=self.user, amount=10, paid=True,
+                                           paid_date=datetime.date.today())
+        self.unpaid = Check.objects.create(account=self.account, user=self.user, amount=10)
+
+    @override_settings(CHECK_ARCHIVE_DAYS=365)
+    def test_archive(self):
+        """Tests that only old paid checks are moved, keeping their ids and dates"""
+        call_command('archive_checks', '--pause', '0', stdout=StringIO())
+        self.assertEqual(set(Check.objects.values_list('pk', flat=True)), {self.recent.pk, self.unpaid.pk})
+        archived = ArchivedCheck.objects.get()
+        self.assertEqual((archived.pk, archived.date_created), (self.old.pk, self.old.date_created))
+
+        # The archived check still counts in reports that go back far enough
+        client = Client()
+        client.login(username=self.user.username, password='password')
+        start = (datetime.date.today() - datetime.timedelta(days=500)).strftime('%m/%d/%Y')
+        end = datetime.date.today().strftime('%m/%d/%Y')
+        response = client.get(reverse('report_chart', args=['paid_count']), {'start_date': start, 'end_date': end})
+        self.assertEqual(json.loads(response.content)['values'], [1, 1])
+
+    def test_delete(self):
+        """Tests that deleting an account also deletes its archived checks"""
+        ArchivedCheck.archive(datetime.date.today())
+        job = DeletionJob.start(self.account, self.user)
+        job.run()
+        self.assertEqual(job.deleted, 4)
+        self.assertFalse(ArchivedCheck.objects.exists())
+
+
+class AgingTests(TestCase):
+    """
+    Aging report tests for the system. Tests to make sure the amount
+    due is split into the right age buckets for the supervisor's company.
+    """
+
+    def setUp(self):
+        """Runs the setup before every other test in the AgingTests"""
+        self.company = Company.objects.create(name='Test Company', late_fee=5)
+        other = Company.objects.create(name='Other Company', late_fee=5)
+        self.user = User.objects.create_user(username='testsuper', email='testsuper@gmail.com', password='password')
+        self.user.profile.company = self.company
+        self.user.profile.is_supervisor = True
+        self.user.save()
+        self.client = Client()
+        self.client.login(username=self.user.username, password='password')
+        account = Account.objects.create(name='Test Account', number='123', company=self.company)
+        other_account = Account.objects.create(name='Other Account', company=other)
+        today = datetime.date.today()
+        for days, amount in ((10, 10), (45, 20), (75, 30), (120, 40), (200, 50)):
+            Check.objects.create(account=account, user=self.user, amount=amount, date=today - datetime.timedelta(days=days))
+        Check.objects.create(account=account, user=self.user, amount=100, amount_paid=105, paid=True, date=today)
+        other_user = User.objects.create_user(username='otheruser', email='otheruser@gmail.com', password='password')
+        other_user.profile.company = other
+        other_user.save()
+        Check.objects.create(account=other_account, user=other_user, amount=100, date=today)
+
+    def test_csv(self):
+        """Tests that the CSV export has one row per account with the right buckets"""
+        response = self.client.get(reverse('aging'), {'output': 'csv'})
+        self.assertTrue(response.streaming)
+        rows = list(csv.reader(b''.join(response.streaming_content).decode('utf-8').splitlines()))
+        self.assertEqual(rows[0], ['account__name', 'account__number', 'count', 'current', 'days_30', 'days_60', 'days_90', 'total'])
+        self.assertEqual(rows[1:], [['Test Account', '123', '5', '15.00', '25.00', '35.00', '100.00', '175.00']])
+
+        response = self.client.get(reverse('aging'), {'output': 'csv', 'by': 'user', 'search': 'nobody'})
+        self.assertEqual(len(b''.join(response.streaming_content).decode('utf-8').splitlines()), 1)
+
+    @override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+    def test_csv_link(self):
+        """Tests that the CSV link keeps the grouping and the search of the page"""
+        response = self.client.get(reverse('aging'), {'by': 'user', 'search': 'test super'})
+        self.assertContains(response, "href='?output=csv&by=user&search=test%20super'")
+
+    def test_regular_user(self):
+        """Tests that regular users can't see the aging report"""
+        self.user.profile.is_supervisor = False
+        self.user.save()
+        self.assertEqual(self.client.get(reverse('aging')).status_code, 302)
+
+
+class KPITests(TestCase):
+    """
+    Dashboard tests for the system. Tests to make sure the company
+    numbers match what the check pages would show.
+    """
+
+    def setUp(self):
+        """Runs the setup before every other test in the KPITests"""
+        self.company = Company.objects.create(name='Test Company', late_fee=5, wait_period=10)
+        self.user = User.objects.create_user(username='testuser', email='testuser@gmail.com', password='password')
+        self.user.profile.company = self.company
+        self.user.save()
+        account = Account.objects.create(name='Test Account', company=self.company)
+        today = datetime.date.today()
+        Check.objects.create(account=account, user=self.user, amount=10)
+        second = Check.objects.create(account=account, user=self.user, amount=20, amount_paid=5, letter1_date=today)
+        Check.objects.filter(pk=second.pk).update(date_created=timezone.now() - datetime.timedelta(days=15))
+        Check.objects.create(account=account, user=self.user, amount=30, amount_paid=35, paid=True, paid_date=today)
+
+    def test_refresh(self):
+        """Tests that the numbers are computed, and agree with current_letter"""
+        call_command('refresh_kpis')
+        kpi = self.company.kpi
+        self.assertEqual((kpi.open_checks, kpi.outstanding, kpi.collected_month), (2, 35, 35))
+        letters = [c.current_letter() for c in Check.objects.all()]
+        self.assertEqual((kpi.letter1_due, kpi.letter2_due, kpi.letter3_due),
+                         (letters.count(1), letters.count(2), letters.count(3)))
+        self.assertEqual((kpi.letter1_due, kpi.letter2_due), (1, 1))
+
+
+class LoggingTests(TestCase):
+    """
+    Logging tests for the system. Tests to make sure records carry the
+    request they were logged in and can be sampled.
+    """
+
+    def setUp(self):
+        """Runs the setup before every other test in the LoggingTests"""
+        self.user = User.objects.create_user(username='testuser', email='testuser@gmail.com', password='password')
+        self.client = Client()
+        self.client.login(username=self.user.username, password='password')
+
+    def record(self, level=logging.INFO):
+        """Makes a log record"""
+        return logging.getLogger('checkit').makeRecord('checkit', level, __file__, 1, 'Check #%s', (5,), None)
+
+    def test_json(self):
+        """Tests that a record is written as JSON with its request"""
+        start_request('abc123', 'GET', '/checks/')
+        record = self.record()
+        RequestContextFilter().filter(record)
+        end_request()
+        data = json.loads(JsonFormatter().format(record))
+        self.assertEqual(data['message'], 'Check #5')
+        self.assertEqual(data['request_id'], 'abc123')
+        self.assertEqual(data['path'], '/checks/')
+        self.assertIn('elapsed_ms', data)
+
+    def test_request_log(self):
+        """Tests that each request is logged with its id, status, and user"""
+        with self.assertLogs('checkit.requests', 'INFO') as logs:
+            response = self.client.get(reverse('account_typeahead'), {'term': 'a'}, HTTP_X_REQUEST_ID='abc123')
+        self.assertEqual(response['X-Request-ID'], 'abc123')
+        self.assertEqual(logs.records[0].status, 200)
+        self.assertEqual(logs.records[0].user, self.user.pk)
+
+    @unittest.skipUnless(hasattr(os, 'fork'), 'Needs fork')
+    def test_fork(self):
+        """Tests that a forked process (a preloaded gunicorn worker) writes its records"""
+        read, write = os.pipe()
+        handler = QueueStreamHandler(open(write, 'w'))
+        handler.setFormatter(logging.Formatter('%(message)s'))
+        pid = os.fork()
+        if pid == 0:
+            handler.handle(self.record())
+            handler.stop()
+            os._exit(0)
+        os.waitpid(pid, 0)
+        handler.stop()
+        self.assertEqual(os.read(read, 100), b'Check #5\n')
+        os.close(read)
+
+    def test_sampling(self):
+        """Tests that sampling drops info records but keeps warnings"""
+        self.assertFalse(SamplingFilter(0).filter(self.record()))
+        self.assertTrue(SamplingFilter(0).filter(self.record(logging.WARNING)))
+        self.assertTrue(SamplingFilter(1).filter(self.record()))
+
+
+class AuditTests(TestCase):
+    """
+    Audit tests for the system. Tests to make sure changes are recorded
+    with who made them, and written once per request.
+    """
+
+    def setUp(self):
+        """Runs the setup before every other test in the AuditTests"""
+        self.company = Company.objects.create(name='Test Company')
+        self.account = Account.objects.create(name='Test Account', company=self.company)
+        self.user = User.objects.create_user(username='testuser', email='testuser@gmail.com', password='password')
+        self.user.profile.company = self.company
+        self.user.save()
+        self.checks = [Check.objects.create(account=self.account, user=self.user, number=i, amount=10)
+                       for i in range(3)]
+        self.client = Client()
+        self.client.login(username=self.user.username, password='password')
+
+    def test_save(self):
+        """Tests that saves outside a request are recorded right away, with the changed fields"""
+        event = AuditEvent.objects.filter(model='Check', object_id=self.checks[0].pk).get()
+        self.assertEqual((event.action, event.user), ('create', None))
+
+        check = Check.objects.get(pk=self.checks[0].pk)
+        check.amount = 20
+        check.save()
+        check.save()  # Nothing changed, so nothing is recorded
+        event = AuditEvent.objects.filter(model='Check', action='update').get()
+        self.assertEqual(json.loads(event.changes), {'amount': 20})
+
+    def test_request(self):
+        """Tests that the changes of a request are written with one insert, by the user"""
+        AuditEvent.objects.all().delete()
+        with CaptureQueriesContext(connection) as queries:
+            self.client.post(reverse('check_bulk'), {'action': 'paid', 'ids': [x.pk for x in self.checks]})
+        inserts = [x for x in queries.captured_queries if x['sql'].startswith('INSERT INTO "checkit_auditevent"')]
+        self.assertEqual(len(inserts), 1)
+        events = AuditEvent.objects.all()
+        self.assertEqual(len(events), 3)
+        self.assertTrue(all(x.user == self.user and x.action == 'update' for x in events))
+
+    def test_exception(self):
+        """Tests that the events of a view that raised aren't written"""
+        AuditEvent.objects.all().delete()
+        request = RequestFactory().get(reverse('check_index'))
+        request.user = self.user
+        audit.begin(request)
+        audit.record('update', Check, self.checks[0].pk, {'amount': 1})
+        AuditMiddleware(None).process_exception(request, ValueError())
+        self.assertEqual(audit.flush(), 0)
+        self.assertFalse(AuditEvent.objects.exists())
+
+
+class AdminTests(TestCase):
+    """
+    Admin tests for the system. Tests to make sure the changelists don't
+    run a query per row.
+    """
+
+    def setUp(self):
+        """Runs the setup before every other test in the AdminTests"""
+        self.company = Company.objects.create(name='Test Company')
+        self.account = Account.objects.create(name='Test Account', number='123456', company=self.company)
+        self.user = User.objects.create_user(username='testadmin', email='testadmin@gmail.com', password='password',
+                                             is_superuser=True, is_staff=True)
+        self.client = Client()
+        self.client.login(username=self.user.username, password='password')
+
+    def changelist_queries(self, url, params=None):
+        """Counts the queries of a changelist page"""
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_check_changelist(self):
+        """Tests that more checks don't mean more queries"""
+        url = reverse('admin:checkit_check_changelist')
+        Check.objects.create(account=self.account, user=self.user, amount=10)
+        count = self.changelist_queries(url)
+        for i in range(5):
+            Check.objects.create(account=self.account, user=self.user, amount=10)
+        self.assertEqual(self.changelist_queries(url), count)
+
+    def test_account_search(self):
+        """Tests that accounts can be searched by number prefix"""
+        response = self.client.get(reverse('admin:checkit_account_changelist'), {'q': '1234'})
+        self.assertContains(response, 'Test Account')
+        response = self.client.get(reverse('admin:checkit_account_changelist'), {'q': '9999'})
+        self.assertNotContains(response, 'Test Account')
+
+
+class WorkloadTests(TestCase):
+    """
+    Workload tests for the system. Tests to make sure the user index
+    counts checks, balances, and letters due like the checks do.
+    """
+
+    def setUp(self):
+        """Runs the setup before every other test in the WorkloadTests"""
+        self.company = Company.objects.create(name='Test Company', wait_period=10, late_fee=5)
+        self.account = Account.objects.create(name='Test Account', company=self.company)
+        self.user = User.objects.create_user(username='testuser', email='testuser@gmail.com', password='password')
+        self.other = User.objects.create_user(username='otheruser', email='otheruser@gmail.com', password='password')
+        today = datetime.date.today()
+        Check.objects.create(account=self.account, user=self.user, amount=10, paid=True)
+        Check.objects.create(account=self.account, user=self.user, amount=10)
+        Check.objects.create(account=self.account, user=self.user, amount=20, amount_paid=5, letter1_date=today)
+        old = Check.objects.create(account=self.account, user=self.user, amount=30, letter1_date=today)
+        Check.objects.filter(pk=old.pk).update(date_created=timezone.now() - datetime.timedelta(days=15))
+
+    def test_workload(self):
+        """Tests the counts, and that letters due match current_letter"""
+        users = user_workload(User.objects.order_by('username'))
+        other, user = users
+        self.assertEqual((user.check_count, user.open_balance, user.letters_due), (4, 70, 2))
+        self.assertEqual((other.check_count, other.open_balance, other.letters_due), (0, 0, 0))
+        due = [x for x in Check.objects.filter(user=self.user) if 1 <= x.current_letter() <= 3]
+        self.assertEqual(len(due), user.letters_due)
+        get_template('users/index.html')
+
+    def test_totals(self):
+        """Tests the check totals of accounts and companies, sorted by balance"""
+        empty = Account.objects.create(name='Empty Account', company=self.company)
+        accounts = check_totals(Account.objects.all(), 'account').order_by('-open_balance')
+        self.assertEqual([(x.pk, x.check_count, x.open_balance) for x in accounts],
+                         [(self.account.pk, 4, 70), (empty.pk, 0, 0)])
+        last = Check.objects.order_by('-date_updated').first().date_updated
+        self.assertEqual(accounts[0].last_activity, last)
+
+        company = check_totals(Company.objects.all(), 'account__company').get()
+        self.assertEqual((company.check_count, company.open_balance), (4, 70))
+        get_template('accounts/index.html')
+        get_template('companies/index.html')
+
+
+class PurgeTests(TestCase):
+    """
+    Purge tests for the system. Tests to make sure only old settled
+    checks are purged, by each company's retention policy.
+    """
+
+    def setUp(self):
+        """Runs the setup before every other test in the PurgeTests"""
+        self.company = Company.objects.create(name='Test Company', retention_days=30, retention_action='anonymize')
+        self.other = Company.objects.create(name='Other Company')
+        self.account = Account.objects.create(name='Test Account', company=self.company)
+        self.other_account = Account.objects.create(name='Other Account', company=self.other)
+        self.user = User.objects.create_user(username='testuser', email='testuser@gmail.com', password='password')
+        old = datetime.date.today() - datetime.timedelta(days=60)
+        self.old = Check.objects.create(account=self.account, user=self.user, number=5, amount=10, paid=True,
+                                        paid_date=old, letter1_date=old)
+        self.recent = Check.objects.create(account=self.account, user=self.user, number=6, amount=10, paid=True,
+                                           paid_date=datetime.date.today())
+        self.unpaid = Check.objects.create(account=self.account, user=self.user, number=7, amount=10)
+        self.other_old = Check.objects.create(account=self.other_account, user=self.user, amount=10, paid=True,
+                                              paid_date=old)
+
+    def test_policies(self):
+        """Tests anonymizing by a company's policy, and deleting by --older-than elsewhere"""
+        call_command('purge_history', '--pause', '0', '--batch-size', '1', stdout=StringIO())
+        self.assertEqual(Check.objects.count(), 4)  # The other company has no policy
+        old = Check.objects.get(pk=self.old.pk)
+        self.assertEqual((old.account, old.number, old.letter1_date, old.amount), (None, None, None, 10))
+        self.assertEqual(Check.objects.get(pk=self.recent.pk).account, self.account)
+
+        call_command('purge_history', '--older-than', '45', '--pause', '0', stdout=StringIO())
+        self.assertFalse(Check.objects.filter(pk=self.other_old.pk).exists())
+        self.assertEqual(Check.objects.count(), 3)
+
+        # Purges don't send signals, so they record their own audit events
+        events = AuditEvent.objects.filter(model='Check', action__in=['update', 'delete'])
+        self.assertEqual(sorted(events.values_list('action', 'object_id')),
+                         [('delete', self.other_old.pk), ('update', self.old.pk)])
+
+    @override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+    def test_anonymized_pages(self):
+        """Tests that the check index and letters still load once checks are anonymized"""
+        call_command('purge_history', '--pause', '0', stdout=StringIO())
+        old = Check.objects.get(pk=self.old.pk)
+        self.assertEqual((str(old), old.current_letter(), old.amount_due()), ('Anonymized: 10.00', 0, 10))
+        client = Client()
+        client.login(username=self.user.username, password='password')
+        self.assertContains(client.get(reverse('check_index')), 'Anonymized')
+        response = client.get(reverse('letter'))
+        self.assertEqual((response.status_code, response['Content-Type']), (200, 'application/pdf'))
+
+    def test_dry_run(self):
+        """Tests that a dry run only counts"""
+        out = StringIO()
+        call_command('purge_history', '--older-than', '45', '--dry-run', stdout=out)
+        self.assertIn('2 checks in total', out.getvalue())
+        self.assertEqual(Check.objects.count(), 4)
+
+
+class LetterBatchTests(TestCase):
+    """
+    Letter batch tests for the system. Tests to make sure supervisors can
+    generate the letters of the whole company in sharded background batches.
+    """
+
+    def setUp(self):
+        """Runs the setup before every other test in the LetterBatchTests"""
+        self.company = Company.objects.create(name='Test Company', street='123 Company Way', city='Greenville',
+                                              state='SC', zip_code='29614')
+        self.account = Account.objects.create(name='Test Account', company=self.company)
+        self.supervisor = User.objects.create_user(username='testsupervisor', email='testsupervisor@gmail.com',
+                                                   password='password')
+        self.supervisor.profile.company = self.company
+        self.supervisor.profile.is_supervisor = True
+        self.supervisor.save()
+        for i in range(2):
+            user = User.objects.create_user(username='testuser{}'.format(i), email='testuser@gmail.com',
+                                            password='password')
+            user.profile.company = self.company
+            user.save()
+            Check.objects.create(account=self.account, user=user, number=i, amount=10)
+        Check.objects.create(account=self.account, user=self.supervisor, amount=10, paid=True)
+        self.client = Client()
+        self.client.login(username=self.supervisor.username, password='password')
+
+    def test_batch(self):
+        """Tests that a batch is sharded by user, rendered by the worker, and merged"""
+        response = self.client.post(reverse('letter_batch_index'), {'by': 'user'})
+        self.assertRedirects(response, reverse('letter_batch_index'), fetch_redirect_response=False)
+        batch = LetterBatch.objects.get()
+        self.assertEqual((batch.status, batch.total), ('pending', 2))
+
+        call_command('process_letters', '--once')
+        batch.refresh_from_db()
+        self.assertEqual((batch.status, batch.done, batch.letters), ('done', 2, 2))
+        self.assertFalse(LetterShard.objects.filter(pdf__isnull=False).exists())
+        self.assertEqual(Check.objects.filter(letter1_date__isnull=False).count(), 2)
+
+        response = self.client.get(reverse('letter_batch_download', args=[batch.id]))
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+        self.assertEqual(len(PdfReader(BytesIO(response.content)).pages), 2)
+        get_template('letters/batches.html')
+
+    def test_reclaimed(self):
+        """Tests that a worker whose shard was picked up by another worker drops its letters"""
+        batch = LetterBatch.start(self.company, self.supervisor, 'user', False)
+        shard = LetterShard.claim(10)
+        LetterShard.objects.filter(pk=shard.pk).update(date_updated=timezone.now() - datetime.timedelta(minutes=20))
+        shard.heartbeat()
+        self.assertNotEqual(LetterShard.claim(10).pk, shard.pk)  # The heartbeat made it fresh again
+        LetterShard.objects.filter(pk=shard.pk).update(claim_id='another')
+        render_letter_shard(shard)
+        shard.refresh_from_db()
+        batch.refresh_from_db()
+        self.assertEqual((shard.status, shard.pdf, batch.done), ('running', None, 0))
+        self.assertFalse(Check.objects.filter(letter1_date__isnull=False).exists())
+
+    def test_error(self):
+        """Tests that a shard that raises is failed, and its checks aren't marked as sent"""
+        batch = LetterBatch.start(self.company, self.supervisor, 'user', False)
+        with mock.patch('checkit.views.render_pdf', side_effect=MemoryError('Out of memory')):
+            call_command('process_letters', '--once')
+        batch.refresh_from_db()
+        self.assertEqual((batch.status, batch.done), ('failed', 2))
+        self.assertEqual(set(batch.shards.values_list('status', 'error')), {('failed', 'Out of memory')})
+        self.assertFalse(Check.objects.filter(letter1_date__isnull=False).exists())
+
+    def test_regular_user(self):
+        """Tests that regular users can't start batches"""
+        client = Client()
+        client.login(username='testuser0', password='password')
+        client.post(reverse('letter_batch_index'), {'by': 'account'})
+        self.assertFalse(LetterBatch.objects.exists())
+
+
+class ExportTests(TestCase):
+    """
+    Export tests for the system. Tests to make sure the due letters are
+    exported as mail-merge files with a manifest.
+    """
+
+    def setUp(self):
+        """Runs the setup before every other test in the ExportTests"""
+        self.company = Company.objects.create(name='Test Company', street='123 Company Way', late_fee=5)
+        self.account = Account.objects.create(name='Test Account', street='123 Account Way', company=self.company)
+        self.user = User.objects.create_user(username='testuser', email='testuser@gmail.com', password='password')
+        for i in range(3):
+            Check.objects.create(account=self.account, user=self.user, number=i, amount=10)
+        Check.objects.create(account=self.account, user=self.user, amount=10, paid=True)
+        self.outbox = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        """Removes the outbox"""
+        self.outbox.cleanup()
+
+    def export(self, *args):
+        """Runs the export and reads back its manifest"""
+        call_command('export_letters', '--outbox', self.outbox.name, *args, stdout=StringIO())
+        directory = os.path.join(self.outbox.name, sorted(os.listdir(self.outbox.name))[-1])
+        with open(os.path.join(directory, 'manifest.json')) as f:
+            return directory, json.load(f)
+
+    def test_jsonl(self):
+        """Tests fixed-size files, the records, and that exported letters are marked sent"""
+        directory, manifest = self.export('--per-file', '2')
+        self.assertEqual(manifest['records'], 3)
+        self.assertEqual([x['records'] for x in manifest['files']], [2, 1])
+        with open(os.path.join(directory, manifest['files'][0]['name'])) as f:
+            record = json.loads(f.readline())
+        self.assertEqual((record['letter'], record['amount_due'], record['account_street']), (1, '15.00', '123 Account Way'))
+        self.assertEqual(Check.objects.filter(letter1_date__isnull=False).count(), 3)
+        self.assertEqual(AuditEvent.objects.filter(model='Check', action='update').count(), 3)
+
+    def test_csv(self):
+        """Tests the CSV format, and that --no-mark leaves the checks alone"""
+        directory, manifest = self.export('--format', 'csv', '--no-mark')
+        with open(os.path.join(directory, manifest['files'][0]['name'])) as f:
+            rows = list(csv.reader(f))
+        self.assertEqual(len(rows), 4)
+        self.assertEqual(rows[0][:2], ['check_id', 'letter'])
+        self.assertFalse(Check.objects.filter(letter1_date__isnull=False).exists())
+
+
+@override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+class RowCacheTests(TestCase):
+    """
+    Row cache tests for the system. Tests to make sure the rows of the check
+    index are cached, and not served once their check, account, or company changes.
+    """
+
+    def setUp(self):
+        """Runs the setup before every other test in the RowCacheTests"""
+        rows.cache.clear()
+        self.company = Company.objects.create(name='Test Company')
+        self.account = Account.objects.create(name='Test Account', company=self.company)
+        self.user = User.objects.create_user(username='testuser', email='testuser@gmail.com', password='password')
+        self.user.profile.company = self.company
+        self.user.save()
+        self.check = Check.objects.create(account=self.account, user=self.user, number=1, amount=10)
+        self.client = Client()
+        self.client.login(username=self.user.username, password='password')
+
+    def cached(self):
+        """Whether the check's current row is cached, for a user who isn't an admin"""
+        self.check = Check.objects.select_related('account__company').get(pk=self.check.pk)
+        return rows.key(self.check, False) in rows.cache
+
+    def test_rows(self):
+        """Tests that the rows are cached and the page is rendered from them"""
+        self.assertContains(self.client.get(reverse('check_index')), 'Test Account')
+        self.assertTrue(self.cached())
+        rows.cache.set(rows.key(self.check, False), '<tr><td>Cached Row</td></tr>')
+        response = self.client.get(reverse('check_index'))
+        self.assertContains(response, 'Cached Row')
+        self.assertNotContains(response, 'Test Account')
+
+    def test_invalidation(self):
+        """Tests that saving a check, its account, or its company gives it a new row"""
+        self.client.get(reverse('check_index'))
+        Check.objects.get(pk=self.check.pk).save()
+        self.assertFalse(self.cached())
+        self.client.get(reverse('check_index'))
+        self.account.name = 'Renamed Account'
+        self.account.save()
+        self.assertFalse(self.cached())
+        self.assertContains(self.client.get(reverse('check_index')), 'Renamed Account')
+
+        # The company's wait period decides when the row turns into a warning
+        self.company.wait_period = 5
+        self.company.save()
+        self.assertFalse(self.cached())
+
+        # Bulk updates send no signals, like saves in another worker
+        self.client.get(reverse('check_index'))
+        Account.objects.filter(pk=self.account.pk).update(name='Bulk Account', date_updated=timezone.now())
+        self.assertFalse(self.cached())
+        self.assertContains(self.client.get(reverse('check_index')), 'Bulk Account')
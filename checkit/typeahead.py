@@ -0,0 +1,103 @@
+"""
+The account typeahead. Operators find an account by the start of its
+name, number, or routing number while entering checks. The lookups are
+prefix searches (LIKE 'x%'), which the *_prefix_idx indexes on Account
+can answer without scanning the table. The hot prefixes of each company
+are also kept in a small in-process LRU cache, which is cleared when one
+of the company's accounts is saved or deleted, and otherwise expires
+after settings.TYPEAHEAD_CACHE_SECONDS (other workers don't see the
+signals, and bulk API writes don't send them).
+"""
+
+from collections import OrderedDict
+from django.conf import settings
+from django.db.models import Q
+from django.db.models.signals import post_save, post_delete
+from .models import Account
+import threading
+import time
+
+# The number of accounts returned for a prefix
+LIMIT = 10
+
+# The cache key of admins who aren't simulating, who search every company.
+# None is the key of users without a company, who only see accounts without one.
+ALL_COMPANIES = 'all'
+
+
+class PrefixCache:
+    """An LRU cache of typeahead results, one per company"""
+
+    def __init__(self, size, timeout):
+        """
+        :param size: The number of prefixes kept per company
+        :param timeout: Seconds a result is kept
+        """
+        self.size = size
+        self.timeout = timeout
+        self.companies = {}
+        self.lock = threading.Lock()
+
+    def get(self, company_id, prefix):
+        """
+        Gets the cached results for a prefix
+        :return: The results, or None if they aren't cached
+        """
+        with self.lock:
+            entries = self.companies.get(company_id)
+            if entries is None or prefix not in entries:
+                return None
+            expires, results = entries[prefix]
+            if expires < time.monotonic():
+                del entries[prefix]
+                return None
+            entries.move_to_end(prefix)
+            return results
+
+    def set(self, company_id, prefix, results):
+        """Caches the results for a prefix, dropping the least recently used one if full"""
+        with self.lock:
+            entries = self.companies.setdefault(company_id, OrderedDict())
+            entries[prefix] = (time.monotonic() + self.timeout, results)
+            entries.move_to_end(prefix)
+            while len(entries) > self.size:
+                entries.popitem(last=False)
+
+    def clear(self, company_id):
+        """Clears the cache for one company"""
+        with self.lock:
+            self.companies.pop(company_id, None)
+
+
+cache = PrefixCache(settings.TYPEAHEAD_CACHE_SIZE, settings.TYPEAHEAD_CACHE_SECONDS)
+
+
+def search(accounts, company_id, prefix):
+    """
+    Finds the accounts whose name, number, or routing number starts with a prefix
+    :param accounts: The accounts the user has access to
+    :param company_id: The company the accounts belong to (ALL_COMPANIES for all of them)
+    :param prefix: The prefix the user typed
+    :return: A list of dictionaries with the id, name, number, and route
+    """
+    prefix = prefix.strip()[:50]
+    if not prefix:
+        return []
+    results = cache.get(company_id, prefix)
+    if results is None:
+        q = Q(name__istartswith=prefix) | Q(number__startswith=prefix) | Q(route__startswith=prefix)
+        results = list(accounts.filter(q).order_by('name', 'pk').values('id', 'name', 'number', 'route')[:LIMIT])
+        cache.set(company_id, prefix, results)
+    return results
+
+
+def clear_account_cache(sender, instance, **kwargs):
+    """Clears the typeahead cache of a company when one of its accounts changes"""
+    cache.clear(instance.company_id)
+    cache.clear(ALL_COMPANIES)
+
+
+def connect():
+    """Connects the signal receivers, from CheckitConfig.ready()"""
+    post_save.connect(clear_account_cache, sender=Account, dispatch_uid='typeahead_save')
+    post_delete.connect(clear_account_cache, sender=Account, dispatch_uid='typeahead_delete')
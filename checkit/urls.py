@@ -6,7 +6,7 @@ checkit app. All urls go to the views.py file
 from django.urls import path
 from django.contrib.auth import views as auth_views
 
-from . import views
+from . import views, api
 
 # These patterns are checked in order, and a regular
 # expression is applied to each to see if the requested
@@ -17,6 +17,7 @@ urlpatterns = [
     path('login/', auth_views.LoginView.as_view(template_name='registration/login.html'), name='login'),
     path('logout/', views.logout_user, name='logout'),
     path('checks/', views.check_index, name='check_index'),
+    path('checks/bulk/', views.check_bulk, name='check_bulk'),
     path('checks/<int:check_id>/', views.check_edit, name='check_edit'),
     path('checks/<int:check_id>/delete/', views.check_delete, name='check_delete'),
     path('checks/<int:check_id>/letter1/', views.check_letter1, name='check_letter1'),
@@ -25,6 +26,8 @@ urlpatterns = [
     path('checks/<int:check_id>/pay/', views.check_pay, name='check_pay'),
     path('accounts/', views.account_index, name='account_index'),
     path('accounts/new/', views.account_new, name='account_new'),
+    path('accounts/bulk/', views.account_bulk, name='account_bulk'),
+    path('accounts/typeahead/', views.account_typeahead, name='account_typeahead'),
     path('accounts/<int:account_id>/', views.account_edit, name='account_edit'),
     path('accounts/<int:account_id>/delete/', views.account_delete, name='account_delete'),
     path('accounts/<int:account_id>/checks/', views.account_check_index, name='account_check_index'),
@@ -38,10 +41,19 @@ urlpatterns = [
     path('companies/<int:company_id>/simulate/', views.company_simulate, name='simulate'),
     path('companies/stopsimulate/', views.company_stop_simulate, name='stop_simulate'),
     path('letters/', views.letter, name='letter'),
+    path('letters/batches/', views.letter_batch_index, name='letter_batch_index'),
+    path('letters/batches/<int:batch_id>/', views.letter_batch_download, name='letter_batch_download'),
     path('users/', views.user_index, name='user_index'),
     path('users/<int:user_id>/', views.user_edit, name='user_edit'),
     path('users/<int:user_id>/checks/', views.user_check_index, name='user_check_index'),
     path('users/<int:user_id>/delete/', views.user_delete, name='user_delete'),
+    path('deletions/', views.deletion_index, name='deletion_index'),
     path('profile/', views.profile, name='profile'),
-    path('report/', views.report, name='report')
+    path('report/', views.report, name='report'),
+    path('report/aging/', views.aging, name='aging'),
+    path('report/<str:name>/', views.report_chart, name='report_chart'),
+    path('api/companies/', api.company_list, name='api_companies'),
+    path('api/accounts/', api.account_list, name='api_accounts'),
+    path('api/checks/', api.check_list, name='api_checks'),
+    path('api/payments/', api.payment_list, name='api_payments'),
 ]
@@ -6,27 +6,41 @@ requests end up here and logic is handled here.
 from django.contrib.auth import login, logout
 from django.contrib.auth.decorators import login_required
 
-from .decorators import logout_required, admin_required, supervisor_required
+from .decorators import logout_required, admin_required, supervisor_required, conditional
 from django.shortcuts import render, redirect, get_object_or_404
+from django.urls import reverse
 from django.contrib import messages
 from .forms import *
-from .models import Check, Account, Company
+from .models import Check, ArchivedCheck, Account, Company, DeletionJob, CompanyKPI, ReportMonth, ReportRollup, LetterBatch
+from .exports import mark_sent
+from .reports import REPORT_CHARTS, report_series
+from . import audit, typeahead
 from django.core.paginator import Paginator
-from django.db.models import Q, Count, Sum
-from django.http import HttpResponse
-from django.utils.http import urlquote
-
+from django.db import connection, transaction
+from django.db.models import Q, Count, Sum, Max, F, Value, DecimalField, IntegerField, DateTimeField, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Greatest
+from django.http import HttpResponse, StreamingHttpResponse, JsonResponse
+from django.utils.http import urlquote, is_safe_url
+from django.conf import settings
+from django.utils import timezone
+
+from contextlib import contextmanager
 from io import StringIO, BytesIO
-from xhtml2pdf import pisa
+from itertools import chain
+import csv
+import zipfile
 from django.template.loader import get_template
 
 from functools import reduce
+import hashlib
 from operator import ior
-from chartit import DataPool, Chart
 import logging
-import leather
+import threading
 import time
 
+# xhtml2pdf, pypdf, and leather are slow to import, so they are
+# imported inside the functions that use them instead of when a worker starts.
+
 # The logger for printing data to console
 logger = logging.getLogger(__name__)
 
@@ -36,6 +50,79 @@ def get_per(user):
     return user.profile.records_per_page if user.is_authenticated else 10
 
 
+def check_scope(user, model=Check):
+    """
+    The checks a user has access to. Admins see all checks, supervisors
+    see their company's checks, and regular users see their own checks.
+    :param user: The user sending the request
+    :param model: Check, ArchivedCheck, or ReportRollup (anything with a user)
+    :return: The checks
+    """
+    if user.profile.admin_not_simulating():
+        return model.objects.all()
+    elif user.profile.supervisor_up():
+        return model.objects.filter(user__profile__company=user.profile.company)
+    return model.objects.filter(user=user)
+
+
+def account_scope(user):
+    """
+    The accounts a user has access to. Admins see all accounts, and
+    everyone else sees their company's accounts.
+    :param user: The user sending the request
+    :return: The accounts
+    """
+    if user.profile.admin_not_simulating():
+        return Account.objects.all()
+    return Account.objects.filter(company=user.profile.company)
+
+
+def company_scope(user):
+    """
+    The companies a user has access to. Admins see all companies, and
+    everyone else sees their own company.
+    :param user: The user sending the request
+    :return: The companies
+    """
+    if user.profile.admin_not_simulating():
+        return Company.objects.all()
+    return Company.objects.filter(pk=user.profile.company_id)
+
+
+def version_stamp(request, *querysets):
+    """
+    A cheap stamp of the data behind a page: the row count and the last
+    update of each set of objects, plus everything about the request and
+    the user that changes the page. Counting catches deletes, which
+    don't change the last update.
+    :param request: The request for the page
+    :param querysets: The objects the page shows
+    :return: The ETag
+    """
+    profile = request.user.profile
+    parts = [request.get_full_path(), request.user.pk, request.user.username, profile.company_id,
+             profile.is_supervisor, profile.records_per_page, datetime.datetime.now().date()]
+    for objects in querysets:
+        stamp = objects.aggregate(count=Count('pk'), last=Max('date_updated'))
+        parts += [stamp['count'], stamp['last']]
+    return hashlib.md5(repr(parts).encode('utf-8')).hexdigest()
+
+
+def process_search(objects, params, filters):
+    """
+    Filters objects by the search query of an index page, if there is one
+    :param objects: The objects to filter
+    :param params: The custom parameters from the URL
+    :param filters: The filters to search by
+    :return: The filtered objects
+    """
+    if params.get('search'):
+        search = params.get('search')
+        q = reduce(ior, [Q(**{x: search}) for x in filters])
+        objects = objects.filter(q)
+    return objects
+
+
 def process_params(user, objects, params, filters, default_sort='-date_created'):
     """
     This is custom logic that is run for any index page with common functionality
@@ -47,11 +134,7 @@ def process_params(user, objects, params, filters, default_sort='-date_created')
     :param default_sort: The default sort for a list of items
     :return: A paginator object with the needed objects displayed
     """
-    # Filter by the search query
-    if params.get('search'):
-        search = params.get('search')
-        q = reduce(ior, [Q(**{x: search}) for x in filters])
-        objects = objects.filter(q)
+    objects = process_search(objects, params, filters)
 
     # Filter by sort, items per page, and page
     objects = objects.order_by(params.get('sort') if params.get('sort') else default_sort)
@@ -78,6 +161,51 @@ def process_context(request, vars, default_sort='-date_created'):
     return context
 
 
+def pdf_compact(request):
+    """
+    Whether or not the PDFs for a request should be compacted. Uses
+    ?compact=1 or ?compact=0, or the COMPACT_PDF setting if not given.
+    """
+    value = request.GET.get('compact')
+    if value is None:
+        return getattr(settings, 'COMPACT_PDF', False)
+    return value.lower() not in ('', '0', 'false', 'off')
+
+
+def compact_pdf(pdf):
+    """
+    Rewrites a PDF so every content stream is deflated and identical
+    objects, such as fonts and resource dictionaries, are shared by all pages
+    :param pdf: The PDF bytes
+    :return: The compacted PDF bytes
+    """
+    from pypdf import PdfReader, PdfWriter
+    writer = PdfWriter(clone_from=PdfReader(BytesIO(pdf)))
+    for page in writer.pages:
+        page.compress_content_streams()
+    writer.compress_identical_objects()
+    result = BytesIO()
+    writer.write(result)
+    return result.getvalue()
+
+
+def render_pdf(html, compact=False):
+    """
+    Renders an html string into PDF bytes
+    :param html: The html to render
+    :param compact: Whether or not to compact the PDF
+    :return: The PDF bytes, or None if there was an error
+    """
+    from xhtml2pdf import pisa
+    result = BytesIO()
+    pdf = pisa.pisaDocument(StringIO(html), dest=result)
+    if pdf.err:
+        return None
+    if compact:
+        return compact_pdf(result.getvalue())
+    return result.getvalue()
+
+
 def pdf_from_html(request, html, error_redirect, error_args):
     """
     Generates a PDF document from an html string
@@ -87,68 +215,263 @@ def pdf_from_html(request, html, error_redirect, error_args):
     :param error_args: The arguments for an error
     :return: The generated PDF
     """
-    result = BytesIO()
-    pdf = pisa.pisaDocument(StringIO(html), dest=result)
-    if not pdf.err:
+    pdf = render_pdf(html, pdf_compact(request))
+    if pdf is not None:
         logger.info('Letter PDF generated')
-        return HttpResponse(result.getvalue(), content_type='application/pdf')
+        return HttpResponse(pdf, content_type='application/pdf')
     else:
         messages.warning(request, 'Error generating letter PDF.')
         return redirect(error_redirect, **error_args)
 
 
-def generate_chart(checks, start_date, end_date, group, agg_name, aggregate, title, axis):
-    """
-    This function generates a report for the amount/total
-    checks paid during a time period.
-    :param checks: The check objects to filter by
-    :param start_date: The start date range
-    :param end_date: The end date range
-    :param group: The field to group by (a date)
-    :param agg_name: The column name
-    :param aggregate: The aggregate, either Sum/Count
-    :param title: The title of the chart
-    :param axis: The axis of the chart
-    :return: The chart
-    """
-
-    ds = DataPool(
-        series=[{
-            'options': {
-                'source': checks
-                    .filter(**{'{}__range'.format(group): (start_date, end_date)})
-                    .values(group)
-                    .annotate(**{agg_name: aggregate})
-                    .exclude(**{'{}__isnull'.format(group): True})
-                    .order_by(group),
-            },
-            'terms': [group, agg_name]
-        }]
-    )
+class ZipStream:
+    """
+    A write-only file object for zipfile. Whatever the archive writes
+    is held until it is popped, so a generator can hand each chunk to
+    the response as soon as it is written.
+    """
 
-    # Generate and return the chart
-    return Chart(
-        datasource=ds,
-        series_options=[{
-            'options': {
-                'type': 'column',
-                'stacking': False
-            },
-            'terms': {
-                group: [agg_name]
-            }
-        }],
-        chart_options={
-            'title': {
-                'text': title
-            },
-            'xAxis': {
-                'title': {
-                    'text': axis
-                }
-            }
-        }
-    )
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def pop(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def zip_letters(checks, company, user, compact=False):
+    """
+    Renders a PDF for every check that needs a letter and zips them one at a time
+    :param checks: The checks to generate letters for
+    :param company: The company sending the letters
+    :param user: The user sending the letters
+    :param compact: Whether or not to compact each PDF
+    :return: A generator of zip archive chunks
+    """
+    template = get_template('letters/letters.html')
+    stream = ZipStream()
+    with zipfile.ZipFile(stream, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for check in checks:
+            letter = check.current_letter()
+            if letter < 1:
+                continue
+            # Render one letter at a time so only one PDF is ever in memory
+            html = template.render({'checks': [check], 'company': company, 'user': user})
+            pdf = render_pdf(html, compact)
+            if pdf is None:
+                logger.warning('Error generating letter PDF for check #%s', check.number)
+                continue
+            archive.writestr('Letter{}-Check{}-{}.pdf'.format(letter, check.number, check.id), pdf)
+            yield stream.pop()
+    # Closing the archive writes the central directory
+    yield stream.pop()
+
+
+def zip_letters_response(checks, company, user, compact=False):
+    """
+    Streams a zip archive of individual letter PDFs as an attachment
+    :param checks: The checks to generate letters for
+    :param company: The company sending the letters
+    :param user: The user sending the letters
+    :param compact: Whether or not to compact each PDF
+    :return: The streaming response
+    """
+    filename = 'Letters-{}.zip'.format(time.strftime('%Y%m%d-%H%M'))
+    response = StreamingHttpResponse(zip_letters(checks, company, user, compact), content_type='application/zip')
+    response['Content-Disposition'] = 'attachment; filename={}'.format(urlquote(filename))
+    return response
+
+
+@contextmanager
+def heartbeat(shard, seconds):
+    """
+    Keeps a claimed shard from looking stale while the block runs, by
+    touching it from a background thread every few seconds
+    :param shard: The claimed shard
+    :param seconds: Seconds between heartbeats
+    """
+    stop = threading.Event()
+
+    def beat():
+        try:
+            while not stop.wait(seconds):
+                shard.heartbeat()
+        finally:
+            connection.close()  # The thread's own connection
+
+    thread = threading.Thread(target=beat, daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stop.set()
+        thread.join()
+
+
+def render_letter_shard(shard, heartbeat_seconds=60):
+    """
+    Renders the letters of one shard of a company-wide letter batch, and
+    merges the batch if it was the last shard to finish. Rendering has no
+    side effects: the checks are only marked as sent when the PDF is saved,
+    and only if the shard wasn't picked up by another worker meanwhile, so
+    a shard that fails or is dropped can be rendered again.
+    :param shard: The claimed shard
+    :param heartbeat_seconds: Seconds between heartbeats while rendering
+    :return: The shard
+    """
+    batch = shard.batch
+    checks, pdf, error = [], None, ''
+    try:
+        with heartbeat(shard, heartbeat_seconds):
+            # Each check's letter is picked here and passed to the template, since
+            # rendering current_letter_template would mark the check as sent right away
+            checks = [(x, x.current_letter()) for x in batch.checks(shard)]
+            checks = [(x, letter) for x, letter in checks if letter >= 1]
+            if checks:
+                letters = [(x, 'letters/letter{}.html'.format(letter)) for x, letter in checks]
+                template = get_template('letters/letters.html')
+                pdf = render_pdf(template.render({'letters': letters, 'company': batch.company,
+                                                  'user': batch.requested_by}), batch.compact)
+                if pdf is None:
+                    error = 'The letters PDF could not be generated.'
+    except Exception as e:
+        logger.exception('%s could not be rendered', shard)
+        error = str(e)[:1000] or type(e).__name__
+    status = 'failed' if error else 'done'
+    sent = {}
+    for check, letter in checks:
+        sent.setdefault(letter, []).append(check.pk)
+
+    # The batch is locked before the shard is saved, so exactly one worker sees the last shard finish
+    with transaction.atomic():
+        batch = LetterBatch.objects.select_for_update().get(pk=batch.pk)
+        saved = batch.status not in ('done', 'failed') and shard.owned().update(
+            status=status, letters=len(checks), pdf=pdf, error=error, date_updated=timezone.now())
+        if not saved:
+            logger.warning('%s was picked up by another worker, its letters are dropped', shard)
+            return shard
+        if status == 'done':
+            mark_sent(sent)  # In the same transaction as the PDF, so a letter is never marked without one
+        shard.status, shard.letters, shard.error = status, len(checks), error
+        batch.done = batch.shards.filter(status__in=['done', 'failed']).count()
+        batch.letters = batch.shards.aggregate(letters=Sum('letters'))['letters'] or 0
+        if batch.done >= batch.total:
+            merge_letter_batch(batch)
+        else:
+            batch.status = 'running'
+        batch.save()
+    return shard
+
+
+def merge_letter_batch(batch):
+    """
+    Merges the PDFs of every shard into the PDF of the batch
+    :param batch: The locked batch, with all of its shards finished
+    """
+    from pypdf import PdfReader, PdfWriter
+    failed = batch.shards.filter(status='failed').count()
+    pdfs = batch.shards.filter(status='done', pdf__isnull=False).order_by('key').values_list('pdf', flat=True)
+    batch.pdf = None
+    if pdfs:
+        writer = PdfWriter()
+        for pdf in pdfs:
+            writer.append(PdfReader(BytesIO(bytes(pdf))))
+        result = BytesIO()
+        writer.write(result)
+        batch.pdf = result.getvalue()
+    batch.shards.update(pdf=None)  # The merged PDF is all that is needed now
+    batch.status = 'failed' if failed else 'done'
+    batch.error = '{} of {} shards could not be rendered.'.format(failed, batch.total) if failed else ''
+    logger.info('Merged %s letters for %s', batch.letters, batch)
+
+
+def report_scope(user):
+    """
+    The checks a user sees reports for, and the heading for them.
+    :param user: The user sending the request
+    :return: The checks and the heading
+    """
+    if user.profile.admin_not_simulating():
+        return check_scope(user), 'Reports for All Checks'
+    elif user.profile.supervisor_up():
+        return check_scope(user), 'Reports for Company: {}'.format(user.profile.company)
+    return check_scope(user), 'Reports for Your Checks'
+
+
+def letters_response(request, checks, zip_output=False, compact=False):
+    """
+    Generates the letters that are due for some checks
+    :param request: The request to send the letters to
+    :param checks: The checks to generate letters for
+    :param zip_output: Whether to stream a zip of one PDF per letter instead of one PDF
+    :param compact: Whether or not to compact the PDFs
+    :return: The letters, or a redirect if there are no letters to generate
+    """
+    company = request.user.profile.company
+
+    # Make sure there are letters to be generated
+    if not len([x.current_letter() for x in checks if x.current_letter() >= 1]):
+        messages.info(request, 'No letters to generate.')
+        return redirect('check_index')
+
+    if zip_output:
+        logger.info('Streaming letters zip')
+        return zip_letters_response(checks, company, request.user, compact)
+
+    template = get_template('letters/letters.html')
+    context = {'checks': checks, 'company': company, 'user': request.user}
+    html = template.render(context)
+    pdf = render_pdf(html, compact)
+    if pdf is not None:
+        logger.info('Letters generated')
+        filename = 'Letters-{}.pdf'.format(time.strftime('%Y%m%d-%H%M'))
+        response = HttpResponse(pdf, content_type='application/pdf')
+        response['Content-Disposition'] = 'attachment; filename={}'.format(urlquote(filename))
+        return response
+    else:
+        messages.error(request, 'Error generating letters PDF.')
+        return redirect('check_index')
+
+
+def start_deletion(request, obj):
+    """
+    Starts deleting a company, account, or user. Small deletes finish right
+    away, and bigger ones are left to the background worker
+    (python manage.py process_deletions), which deletes them in batches.
+    :param request: The request asking for the delete
+    :param obj: The object to delete
+    :return: The deletion job
+    """
+    job = DeletionJob.start(obj, request.user)
+    audit.record('delete', type(obj), obj.pk)
+    if job.status == 'pending' and job.total <= settings.DELETION_BATCH_SIZE:
+        # Claim the job first, so a process_deletions worker can't run it too
+        claimed = DeletionJob.objects.filter(pk=job.pk, status='pending')\
+            .update(status='running', date_updated=timezone.now())
+        if claimed:
+            job.run(settings.DELETION_BATCH_SIZE)
+        else:
+            job.refresh_from_db()
+
+    kind = obj._meta.verbose_name.capitalize()
+    if job.status == 'done':
+        logger.info('%s "%s" has been deleted.', kind, job.name)
+        messages.success(request, '{} "{}" has been deleted.'.format(kind, job.name))
+    elif job.status == 'failed':
+        logger.warning('%s "%s" could not be deleted: %s', kind, job.name, job.error)
+        messages.error(request, '{} "{}" could not be deleted. {}'.format(kind, job.name, job.error))
+    else:
+        logger.info('%s "%s" is being deleted in the background (%s rows)', kind, job.name, job.total)
+        messages.info(request, '{} "{}" is being deleted in the background.'.format(kind, job.name))
+    return job
 
 
 def handler404(request, exception, template_name='404.html'):
@@ -179,8 +502,14 @@ def handler500(request, template_name='500.html'):
 
 
 def index(request):
-    """The home page"""
-    return render(request, 'index.html')
+    """The home page. Supervisors and admins also see the company dashboard."""
+    context = {}
+    if request.user.is_authenticated and request.user.profile.supervisor_up():
+        if request.user.profile.admin_not_simulating():
+            context['kpis'] = CompanyKPI.objects.select_related('company').order_by('company__name')
+        elif request.user.profile.company:
+            context['kpis'] = [CompanyKPI.get(request.user.profile.company)]
+    return render(request, 'index.html', context)
 
 
 def about(request):
@@ -193,27 +522,41 @@ def logout_user(request):
     """Logs out the currently logged in user"""
     logout(request)
     messages.success(request, 'You have successfully logged out.')
-    logger.info('User {} successfully logged out'.format(request.user))
+    logger.info('User %s successfully logged out', request.user)
     return redirect('index')
 
 
+def check_index_stamp(request):
+    """The version of the check index page, or of the archived checks with ?archived=1"""
+    model = ArchivedCheck if request.GET.get('archived') == '1' else Check
+    return version_stamp(request, check_scope(request.user, model), account_scope(request.user),
+                         company_scope(request.user))
+
+
 @login_required
+@conditional(check_index_stamp)
 def check_index(request):
-    """The check index page. Displays all checks visible to a user"""
+    """
+    The check index page. Displays all checks visible to a user.
+    With ?archived=1, it searches the archived checks instead.
+    """
+    model = ArchivedCheck if request.GET.get('archived') == '1' else Check
     if request.user.profile.admin_not_simulating():
         # Admin should see all checks
-        checks = Check.objects.all()
         heading = 'All Checks'
     elif request.user.profile.supervisor_up():
         # Supervisor sees company checks
-        checks = Check.objects.filter(user__profile__company=request.user.profile.company)
         heading = 'Checks for Company: {}'.format(request.user.profile.company)
     else:
         # Regular user sees their checks
-        checks = Check.objects.filter(user=request.user)
         heading = 'Your Checks'
-    checks = process_params(request.user, checks, request.GET, ['account__name__icontains'])
-    context = process_context(request.GET, {'checks': checks, 'heading': heading})
+    if model is ArchivedCheck:
+        heading = '{} (Archived)'.format(heading)
+    checks = check_scope(request.user, model)
+    checks = process_params(request.user, checks.select_related('account__company'), request.GET,
+                            ['account__name__icontains'])
+    context = process_context(request.GET, {'checks': checks, 'heading': heading, 'archived': model is ArchivedCheck,
+                                            'row_seconds': settings.ROW_CACHE_SECONDS})
     return render(request, 'checks/index.html', context)
 
 
@@ -232,7 +575,7 @@ def check_edit(request, check_id):
                 check.paid_date = datetime.datetime.now().date()
                 check.save()
             form.save()
-            logger.info('Check #{} has been edited'.format(check.number))
+            logger.info('Check #%s has been edited', check.number)
             messages.success(request, 'Check successfully updated!')
             return redirect('check_index')
     else:
@@ -260,15 +603,128 @@ def check_pay(request, check_id):
 def check_delete(request, check_id):
     """The check delete page. Only deletes if admin user."""
     check = get_object_or_404(Check, pk=check_id)
+    ReportMonth.drop(getattr(check, x) for x in ReportMonth.DATES)
     check.delete()
-    logger.info('Check #{} has been deleted'.format(check.number))
+    audit.record('delete', Check, check_id)
+    logger.info('Check #%s has been deleted', check.number)
     messages.success(request, 'Check has been deleted.')
     return redirect('check_index')
 
 
+def selected_ids(request):
+    """The ids of the rows selected on an index page"""
+    return [int(x) for x in request.POST.getlist('ids') if x.isdigit()]
+
+
+def bulk_redirect(request, default):
+    """Redirects back to the index page that a bulk action came from"""
+    url = request.POST.get('next')
+    if url and is_safe_url(url, allowed_hosts={request.get_host()}):
+        return redirect(url)
+    return redirect(default)
+
+
+def audit_bulk(action, objects, changes=None):
+    """
+    Records a bulk change in the audit log, since bulk updates and deletes
+    don't send signals
+    :param action: The action, see AuditEvent.ACTIONS
+    :param objects: The objects about to be changed
+    :param changes: The changed fields and their new values
+    :return: The same objects, by id, so exactly the audited rows are changed
+    """
+    ids = list(objects.values_list('pk', flat=True))
+    audit.record_many(action, objects.model, ids, changes)
+    return objects.model.objects.filter(pk__in=ids)
+
+
+def bulk_check_action(request, checks, form):
+    """
+    Runs a bulk action on some checks. Every action except the letters
+    is a single UPDATE or DELETE on all of the checks at once.
+    :param request: The request running the action
+    :param checks: The checks to run the action on
+    :param form: The valid bulk action form
+    :return: The letters for the letter actions, otherwise None
+    """
+    action = form.cleaned_data['action']
+    today = datetime.datetime.now().date()
+    now = timezone.now()  # update() skips auto_now, so date_updated is set by hand
+    if action == 'paid':
+        changes = {'paid': True, 'paid_date': today}
+        count = audit_bulk('update', checks.filter(paid=False), changes).update(date_updated=now, **changes)
+        logger.info('%s checks marked paid', count)
+        messages.success(request, '{} checks marked paid.'.format(count))
+    elif action == 'unpaid':
+        changes = {'paid': False, 'paid_date': None}
+        ReportMonth.drop_checks(checks.filter(paid=True))
+        count = audit_bulk('update', checks.filter(paid=True), changes).update(date_updated=now, **changes)
+        logger.info('%s checks marked unpaid', count)
+        messages.success(request, '{} checks marked unpaid.'.format(count))
+    elif action == 'pay':
+        # Same rule as Check.pay: paid off once the amount plus the late fee is covered
+        amount = form.cleaned_data['amount']
+        with transaction.atomic():
+            unpaid = audit_bulk('pay', checks.filter(paid=False), {'amount': amount})
+            count = unpaid.update(amount_paid=F('amount_paid') + amount, date_updated=now)
+            changes = {'paid': True, 'paid_date': today}
+            paid_off = unpaid.filter(amount_paid__gte=F('amount') + F('account__company__late_fee'))
+            paid_off = audit_bulk('update', paid_off, changes).update(date_updated=now, **changes)
+        logger.info('Paid $%.2f on %s checks', amount, count)
+        messages.success(request, 'Successfully paid ${:.2f} on {} checks, {} paid off!'.format(amount, count, paid_off))
+    elif action in ('letters', 'letters_zip'):
+        checks = checks.select_related('account__company')
+        return letters_response(request, checks, action == 'letters_zip', pdf_compact(request))
+    elif action == 'delete':
+        if not request.user.profile.admin():
+            messages.warning(request, 'You do not have permission to delete checks.')
+        else:
+            ReportMonth.drop_checks(checks)
+            count = audit_bulk('delete', checks).delete()[1].get(Check._meta.label, 0)
+            logger.info('%s checks have been deleted', count)
+            messages.success(request, '{} checks have been deleted.'.format(count))
+    return None
+
+
+@login_required
+def check_bulk(request):
+    """Runs an action on the checks selected on a check index page."""
+    form = BulkActionForm(request.POST or None)
+    ids = selected_ids(request)
+    if not form.is_valid() or not ids:
+        messages.warning(request, 'Choose an action and at least one check.')
+        return bulk_redirect(request, 'check_index')
+    checks = check_scope(request.user).filter(pk__in=ids)
+    return bulk_check_action(request, checks, form) or bulk_redirect(request, 'check_index')
+
+
+def check_totals(objects, path):
+    """
+    Adds the totals of the checks under each account or company, as
+    subqueries in the same query that the index page paginates:
+    check_count, open_balance, and last_activity (the last change to the
+    object or any of its checks)
+    :param objects: The accounts or companies
+    :param path: The path from a check to them, 'account' or 'account__company'
+    :return: The objects with their totals
+    """
+    checks = Check.objects.filter(**{path: OuterRef('pk')}).order_by()
+
+    def total(aggregate, output_field):
+        rows = checks.values(path).annotate(total=aggregate).values('total')
+        return Coalesce(Subquery(rows, output_field=output_field), Value(0))
+
+    last_check = checks.order_by('-date_updated').values('date_updated')[:1]
+    return objects.annotate(
+        check_count=total(Count('pk'), IntegerField()),
+        open_balance=total(Sum(Check.amount_due_sql(), filter=Q(paid=False)), DecimalField()),
+        last_activity=Greatest('date_updated', Subquery(last_check, output_field=DateTimeField())),
+    )
+
+
 @login_required
 def account_index(request):
-    """The account index page. Displays accounts accessible to user"""
+    """The account index page. Displays accounts accessible to user, with the totals of their checks"""
     if request.user.profile.admin_not_simulating():
         # Admin sees all accounts
         accounts = Account.objects.all()
@@ -277,7 +733,7 @@ def account_index(request):
         # Other users see company accounts
         accounts = Account.objects.filter(company=request.user.profile.company)
         heading = 'Accounts for Company: {}'.format(request.user.profile.company)
-    accounts = process_params(request.user, accounts, request.GET, ['name__icontains', 'number__icontains', 'route__icontains', 'street__icontains'])
+    accounts = process_params(request.user, check_totals(accounts, 'account'), request.GET, ['name__icontains', 'number__icontains', 'route__icontains', 'street__icontains'])
     context = process_context(request.GET, {'accounts': accounts, 'heading': heading})
     return render(request, 'accounts/index.html', context)
 
@@ -309,7 +765,7 @@ def account_edit(request, account_id):
         form = AccountForm(request.POST, instance=account)
         if form.is_valid():
             form.save()
-            logger.info('Account "{}" successfully updated'.format(account.name))
+            logger.info('Account "%s" successfully updated', account.name)
             messages.success(request, 'Account "{}" successfully updated!'.format(account.name))
             return redirect('account_index')
     else:
@@ -322,12 +778,35 @@ def account_edit(request, account_id):
 def account_delete(request, account_id):
     """The account delete page. Only accessible to admins."""
     account = get_object_or_404(Account, pk=account_id)
-    account.delete()
-    logger.info('Account "{}" has been deleted.'.format(account.name))
-    messages.success(request, 'Account "{}" has been deleted.'.format(account.name))
+    start_deletion(request, account)
     return redirect('account_index')
 
 
+@login_required
+def account_bulk(request):
+    """
+    Runs an action on the accounts selected on the account index page.
+    Delete removes the accounts, and every other action runs on their checks.
+    """
+    form = BulkActionForm(request.POST or None)
+    ids = selected_ids(request)
+    if not form.is_valid() or not ids:
+        messages.warning(request, 'Choose an action and at least one account.')
+        return bulk_redirect(request, 'account_index')
+    accounts = account_scope(request.user).filter(pk__in=ids)
+    if form.cleaned_data['action'] == 'delete':
+        if not request.user.profile.admin():
+            messages.warning(request, 'You do not have permission to delete accounts.')
+        else:
+            ReportMonth.drop_checks(Check.objects.filter(account__in=accounts))
+            count = audit_bulk('delete', accounts).delete()[1].get(Account._meta.label, 0)
+            logger.info('%s accounts have been deleted', count)
+            messages.success(request, '{} accounts have been deleted.'.format(count))
+        return bulk_redirect(request, 'account_index')
+    checks = check_scope(request.user).filter(account__in=accounts)
+    return bulk_check_action(request, checks, form) or bulk_redirect(request, 'account_index')
+
+
 @login_required
 @supervisor_required
 def account_check_index(request, account_id):
@@ -343,6 +822,24 @@ def account_check_index(request, account_id):
     return render(request, 'checks/index.html', context)
 
 
+@login_required
+def account_typeahead(request):
+    """
+    Finds accounts by the start of their name, number, or routing number,
+    for the account search box. Takes the prefix as ?term=.
+    """
+    accounts = account_scope(request.user)
+    if request.user.profile.admin_not_simulating():
+        company_id = typeahead.ALL_COMPANIES
+    else:
+        company_id = request.user.profile.company_id
+    results = typeahead.search(accounts, company_id, request.GET.get('term', ''))
+
+    # The label and url are for the jQuery UI autocomplete on the accounts page
+    return JsonResponse([dict(x, label='{} ({})'.format(x['name'], x['number']),
+                              url=reverse('account_check_new', args=[x['id']])) for x in results], safe=False)
+
+
 @login_required
 def account_check_new(request, account_id):
     """Creates a check under an account."""
@@ -354,7 +851,7 @@ def account_check_new(request, account_id):
             check.user = request.user
             check.account = account
             check.save()
-            logger.info('Successfully added check #{}'.format(check.number))
+            logger.info('Successfully added check #%s', check.number)
             messages.success(request, 'Successfully added new check!')
             if request.POST.get('again'):  # Add another check for this account?
                 return redirect(account_check_new, account_id)
@@ -368,8 +865,8 @@ def account_check_new(request, account_id):
 @login_required
 @admin_required
 def company_index(request):
-    """The company index page. Only accessible to admins."""
-    companies = Company.objects.all()
+    """The company index page, with the totals of each company's checks. Only accessible to admins."""
+    companies = check_totals(Company.objects.all(), 'account__company')
     companies = process_params(request.user, companies, request.GET, ['name__icontains'])
     context = process_context(request.GET, {'companies': companies, 'heading': 'All Companies'})
     return render(request, 'companies/index.html', context)
@@ -392,7 +889,7 @@ def company_new(request):
         form = CompanyForm(request.POST)
         if form.is_valid():
             form.save()
-            logger.info('Successfully added company: {}'.format(form.cleaned_data['name']))
+            logger.info('Successfully added company: %s', form.cleaned_data['name'])
             messages.success(request, 'Successfully added company!')
             return redirect(company_index)
     else:
@@ -410,7 +907,7 @@ def company_edit(request, company_id):
         form = CompanyForm(request.POST, instance=company)
         if form.is_valid():
             form.save()
-            logger.info('Company "{}" successfully updated'.format(company))
+            logger.info('Company "%s" successfully updated', company)
             messages.success(request, 'Company "{}" successfully updated!'.format(company))
             return redirect('company_index')
     else:
@@ -423,9 +920,7 @@ def company_edit(request, company_id):
 def company_delete(request, company_id):
     """Deletes a company. Admin only."""
     company = get_object_or_404(Company, pk=company_id)
-    company.delete()
-    logger.info('Company {} has been deleted.'.format(company))
-    messages.success(request, 'Company {} has been deleted.'.format(company))
+    start_deletion(request, company)
     return redirect('company_index')
 
 
@@ -459,7 +954,7 @@ def register(request, company_id):
             user.save()
 
             login(request, user, backend='django.contrib.auth.backends.ModelBackend')
-            logger.info('Account {} created'.format(user.profile.full_name()))
+            logger.info('Account %s created', user.profile.full_name())
             messages.success(request, 'Account successfully created!')
             return redirect('index')
     else:
@@ -468,34 +963,70 @@ def register(request, company_id):
     return render(request, 'register.html', {'form': form, 'company': company})
 
 
+def letter_stamp(request):
+    """The version of a user's letters. Zip files are streamed, so they aren't stamped."""
+    if request.GET.get('output') == 'zip':
+        return None
+    return version_stamp(request, Check.objects.filter(user=request.user), account_scope(request.user),
+                         company_scope(request.user))
+
+
 @login_required
+@conditional(letter_stamp)
 def letter(request):
-    """Generates all letters for a user and returns the generated PDF"""
-    checks = Check.objects.filter(user=request.user)
+    """
+    Generates all letters for a user and returns the generated PDF.
+    With ?output=zip, streams a zip archive with one PDF per letter instead.
+    With ?compact=1, the PDFs are compacted before they are sent.
+    """
+    checks = Check.objects.filter(user=request.user).select_related('account__company')
+    return letters_response(request, checks, request.GET.get('output') == 'zip', pdf_compact(request))
+
+
+@login_required
+@supervisor_required
+def letter_batch_index(request):
+    """
+    The company-wide letter batches of the user's company, with their
+    progress. Posting starts a new batch, split by user or by account.
+    Supervisors and simulating admins only.
+    """
     company = request.user.profile.company
+    if company is None:
+        messages.warning(request, 'Simulate a company to generate its letters.')
+        return redirect('company_index')
+    if request.method == 'POST':
+        shard_by = request.POST.get('by') if request.POST.get('by') in ('user', 'account') else 'user'
+        batch = LetterBatch.start(company, request.user, shard_by, pdf_compact(request))
+        logger.info('Started %s with %s shards', batch, batch.total)
+        if batch.status == 'done':
+            messages.info(request, 'No letters to generate.')
+        else:
+            messages.success(request, 'Generating letters in the background.')
+        return redirect('letter_batch_index')
+
+    batches = LetterBatch.objects.filter(company=company).defer('pdf')
+    batches = process_params(request.user, batches, request.GET, ['status__icontains'])
+    running = any(batch.status in ('pending', 'running') for batch in batches)
+    context = process_context(request.GET, {'batches': batches, 'running': running,
+                                            'heading': 'Letters for Company: {}'.format(company)})
+    return render(request, 'letters/batches.html', context)
 
-    # Make sure there are letters to be generated
-    if not len([x.current_letter() for x in checks if x.current_letter() >= 1]):
-        messages.info(request, 'No letters to generate.')
-        return redirect('check_index')
 
-    template = get_template('letters/letters.html')
-    context = {'checks': checks, 'company': company, 'user': request.user}
-    html = template.render(context)
-    result = BytesIO()
-    pdf = pisa.pisaDocument(StringIO(html), dest=result)
-    if not pdf.err:
-        logger.info('Letters generated')
-        filename = 'Letters-{}.pdf'.format(time.strftime('%Y%m%d-%H%M'))
-        response = HttpResponse(result.getvalue(), content_type='application/pdf')
-        response['Content-Disposition'] = 'attachment; filename={}'.format(urlquote(filename))
-        return response
-    else:
-        messages.error(request, 'Error generating letters PDF.')
-        return redirect('check_index')
+@login_required
+@supervisor_required
+def letter_batch_download(request, batch_id):
+    """Downloads the merged PDF of a finished letter batch"""
+    batch = get_object_or_404(LetterBatch, pk=batch_id, company=request.user.profile.company, pdf__isnull=False)
+    filename = 'Letters-{}.pdf'.format(batch.date_created.strftime('%Y%m%d-%H%M'))
+    response = HttpResponse(bytes(batch.pdf), content_type='application/pdf')
+    response['Content-Disposition'] = 'attachment; filename={}'.format(urlquote(filename))
+    return response
 
 
 @login_required
+@conditional(lambda request, check_id: version_stamp(request, Check.objects.filter(pk=check_id),
+                                                    account_scope(request.user), company_scope(request.user)))
 def check_letter1(request, check_id):
     """Generates the first letter for a check"""
     check = get_object_or_404(Check, pk=check_id)
@@ -507,6 +1038,8 @@ def check_letter1(request, check_id):
 
 
 @login_required
+@conditional(lambda request, check_id: version_stamp(request, Check.objects.filter(pk=check_id),
+                                                    account_scope(request.user), company_scope(request.user)))
 def check_letter2(request, check_id):
     """Generates the second letter for a check"""
     check = get_object_or_404(Check, pk=check_id)
@@ -518,6 +1051,8 @@ def check_letter2(request, check_id):
 
 
 @login_required
+@conditional(lambda request, check_id: version_stamp(request, Check.objects.filter(pk=check_id),
+                                                    account_scope(request.user), company_scope(request.user)))
 def check_letter3(request, check_id):
     """Generates the third letter for a check"""
     check = get_object_or_404(Check, pk=check_id)
@@ -528,10 +1063,28 @@ def check_letter3(request, check_id):
     return pdf_from_html(request, html, check_edit, {'check_id': check_id})
 
 
+def user_workload(users):
+    """
+    Adds the workload of each user, counted in the same query as the users:
+    check_count, open_balance, and letters_due
+    :param users: The users
+    :return: The users, with their profiles and companies joined
+    """
+    return users.select_related('profile__company').annotate(
+        check_count=Count('check'),
+        open_balance=Coalesce(Sum(Check.amount_due_sql('check__'), filter=Q(check__paid=False)), Value(0),
+                              output_field=DecimalField()),
+        letters_due=Count('check', filter=Check.letter_due_sql('check__')),
+    )
+
+
 @login_required
 @supervisor_required
 def user_index(request):
-    """Displays all users accessible to user. Supervisor/admin only."""
+    """
+    Displays all users accessible to user, with how many checks they
+    entered, their open balance, and their letters due. Supervisor/admin only.
+    """
     if request.user.profile.admin_not_simulating():
         # Admin has access to all users
         users = User.objects.all()
@@ -540,7 +1093,7 @@ def user_index(request):
         # Supervisor has access to company users
         users = User.objects.filter(profile__company=request.user.profile.company)
         heading = 'Users for Company: {}'.format(request.user.profile.company)
-    users = process_params(request.user, users, request.GET, ['first_name__icontains', 'last_name__icontains', 'email__icontains', 'username__icontains'], '-date_joined')
+    users = process_params(request.user, user_workload(users), request.GET, ['first_name__icontains', 'last_name__icontains', 'email__icontains', 'username__icontains'], '-date_joined')
     context = process_context(request.GET, {'users': users, 'heading': heading}, '-date_joined')
     return render(request, 'users/index.html', context)
 
@@ -571,7 +1124,7 @@ def user_edit(request, user_id):
         if user_form.is_valid() and profile_form.is_valid():
             user_form.save()
             profile_form.save()
-            logger.info('User "{}" successfully updated'.format(user))
+            logger.info('User "%s" successfully updated', user)
             messages.success(request, 'User "{}" successfully updated!'.format(user))
             return redirect('user_index')
     else:
@@ -585,27 +1138,28 @@ def user_edit(request, user_id):
 def user_delete(request, user_id):
     """Deletes a user. Admin only."""
     user = get_object_or_404(User, pk=user_id)
-    user.delete()
-    logger.info('User "{}" has been deleted.'.format(user))
-    messages.success(request, 'User "{}" has been deleted.'.format(user))
+    start_deletion(request, user)
     return redirect('user_index')
 
 
 @login_required
+@admin_required
+def deletion_index(request):
+    """Shows the progress of background deletions. Admin only."""
+    jobs = process_params(request.user, DeletionJob.objects.all(), request.GET, ['name__icontains'])
+    running = any(job.status in ('pending', 'running') for job in jobs)
+    context = process_context(request.GET, {'jobs': jobs, 'running': running, 'heading': 'Deletions'})
+    return render(request, 'deletions/index.html', context)
+
+
+@login_required
+@conditional(lambda request: version_stamp(request, report_scope(request.user)[0], company_scope(request.user)))
 def report(request):
-    """Generates all reports accessible to a user."""
-    if request.user.profile.admin_not_simulating():
-        # Admin sees reports for all checks
-        checks = Check.objects.all()
-        heading = 'Reports for All Checks'
-    elif request.user.profile.supervisor_up():
-        # Supervisor sees reports for a company
-        checks = Check.objects.filter(user__profile__company=request.user.profile.company)
-        heading = 'Reports for Company: {}'.format(request.user.profile.company)
-    else:
-        # Regular user sees reports for his checks.
-        checks = Check.objects.filter(user=request.user)
-        heading = 'Reports for Your Checks'
+    """
+    Generates all reports accessible to a user. The page only holds the
+    date range; the charts load their data from report_chart afterwards.
+    """
+    checks, heading = report_scope(request.user)
 
     # Find out the start and end date
     end_date = datetime.datetime.now().date()
@@ -627,27 +1181,113 @@ def report(request):
         (paid, 'Checks Paid'),
         (not_paid, 'Checks Not Paid')
     ]
+    import leather
     chart = leather.Chart('Checks Processed by CheckIt')
     chart.add_bars(data)
     chart.to_svg('checkit/static/img/bars.svg')
 
-    # Generate the charts (django-chartit)
-    paid_count_chart = generate_chart(checks, start_date, end_date, 'paid_date', 'count',
-                                      Count('paid_date'), 'Checks Paid by Date', 'Paid Date')
-    paid_total_chart = generate_chart(checks, start_date, end_date, 'paid_date', 'total',
-                                      Sum('amount_paid'), 'Total Revenue by Date', 'Date')
-    charts = [paid_count_chart, paid_total_chart]
-    for i in range(3):
-        group = 'letter{}_date'.format(i + 1)
-        chart = generate_chart(checks, start_date, end_date, group, 'count',
-                               Count(group), 'Letter {} Generated by Date'.format(i + 1), 'Date')
-        charts.append(chart)
-
-    # Return all the charts to report view
-    context = {'charts': charts, 'form': form, 'heading': heading}
+    context = {'charts': list(REPORT_CHARTS), 'form': form, 'heading': heading,
+               'start_date': start_date, 'end_date': end_date}
     return render(request, 'report/report.html', context)
 
 
+@login_required
+@conditional(lambda request, name: version_stamp(request, report_scope(request.user)[0], ReportMonth.objects.all()))
+def report_chart(request, name):
+    """
+    The data for one chart on the reports page, as JSON.
+    :param name: The chart, one of REPORT_CHARTS
+    :return: The title, axis, dates, and values of the chart
+    """
+    if name not in REPORT_CHARTS:
+        return JsonResponse({'error': 'Unknown chart.'}, status=404)
+    form = ReportForm(request.GET)
+    if not form.is_valid():
+        return JsonResponse({'errors': form.errors}, status=400)
+
+    checks, heading = report_scope(request.user)
+    archived, rollups = check_scope(request.user, ArchivedCheck), check_scope(request.user, ReportRollup)
+    group, aggregate, title, axis = REPORT_CHARTS[name]
+    bucket, series = report_series(name, checks, archived, rollups,
+                                   form.cleaned_data['start_date'], form.cleaned_data['end_date'])
+    return JsonResponse({
+        'title': title,
+        'axis': '{} (by {})'.format(axis, bucket),
+        'bucket': bucket,
+        'categories': [date.isoformat() for date, value in series],
+        'values': [float(value) for date, value in series],
+    })
+
+
+# The ways the aging report can be grouped: the fields of each row, and the search filter
+AGING_GROUPS = {
+    'account': (['account_id', 'account__name', 'account__number'], 'account__name__icontains'),
+    'user': (['user_id', 'user__username', 'user__first_name', 'user__last_name'], 'user__username__icontains'),
+}
+
+
+def aging_totals(checks, today):
+    """
+    The aggregates of the aging report: the amount due on the unpaid checks,
+    split by how many days have passed since the check date. Checks without
+    a date count as current.
+    :param checks: The unpaid checks
+    :param today: The date the ages are counted to
+    :return: The aggregates, for annotate or aggregate
+    """
+    due = Check.amount_due_sql()
+    days = [today - datetime.timedelta(days=x) for x in (30, 60, 90)]
+    return {
+        'count': Count('pk'),
+        'current': Sum(due, filter=Q(date__gte=days[0]) | Q(date__isnull=True)),
+        'days_30': Sum(due, filter=Q(date__lt=days[0], date__gte=days[1])),
+        'days_60': Sum(due, filter=Q(date__lt=days[1], date__gte=days[2])),
+        'days_90': Sum(due, filter=Q(date__lt=days[2])),
+        'total': Sum(due),
+    }
+
+
+class Echo:
+    """A file-like object that hands back what is written to it, for streaming CSV"""
+
+    def write(self, value):
+        return value
+
+
+@login_required
+@supervisor_required
+@conditional(lambda request: version_stamp(request, check_scope(request.user), account_scope(request.user),
+                                           company_scope(request.user)))
+def aging(request):
+    """
+    The aging report. Shows the amount due on unpaid checks by account
+    (or by user with ?by=user), split into 0-30, 31-60, 61-90, and 90+ days
+    since the check date. Every row is computed in one SQL query.
+    With ?output=csv, all rows matching the search are streamed as a CSV file instead.
+    """
+    by = request.GET.get('by') if request.GET.get('by') in AGING_GROUPS else 'account'
+    fields, search = AGING_GROUPS[by]
+    checks = check_scope(request.user).filter(paid=False)
+    totals = aging_totals(checks, datetime.datetime.now().date())
+    rows = checks.values(*fields).annotate(**totals)
+
+    if request.GET.get('output') == 'csv':
+        columns = fields[1:] + list(totals)
+        writer = csv.writer(Echo())
+        lines = (writer.writerow([x[c] if x[c] is not None else '' for c in columns])
+                 for x in process_search(rows, request.GET, [search]).order_by(fields[1]).iterator())
+        response = StreamingHttpResponse(chain([writer.writerow(columns)], lines), content_type='text/csv')
+        response['Content-Disposition'] = 'attachment; filename="aging-by-{}.csv"'.format(by)
+        logger.info('Streaming aging report by %s', by)
+        return response
+
+    rows = process_params(request.user, rows, request.GET, [search], default_sort='-total')
+    context = process_context(request.GET, {'rows': rows, 'by': by, 'totals': checks.aggregate(**totals),
+                                            'heading': 'Aging Report by {}'.format(by.title())},
+                              default_sort='-total')
+    return render(request, 'report/aging.html', context)
+
+
 @login_required
 def profile(request):
     """The profile edit page for a user"""
@@ -658,7 +1298,7 @@ def profile(request):
         if user_form.is_valid() and profile_form.is_valid():
             user_form.save()
             profile_form.save()
-            logger.info('Profile "{}" successfully updated'.format(user))
+            logger.info('Profile "%s" successfully updated', user)
             messages.success(request, 'Profile successfully updated!')
             return redirect('index')
     else:
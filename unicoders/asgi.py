@@ -0,0 +1,72 @@
+"""
+ASGI config for unicoders project.
+
+It exposes the ASGI callable as a module-level variable named ``application``.
+Django requests run on thread pools behind the event loop. PDF and report
+requests (settings.HEAVY_VIEWS) get a small bounded pool of their own, so a
+burst of letters can't take every thread away from fast pages like the
+check index. Run it with
+
+    gunicorn unicoders.asgi:application -k uvicorn.workers.UvicornWorker
+"""
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from asgiref.wsgi import WsgiToAsgiInstance
+from django.core.wsgi import get_wsgi_application
+from django.urls import resolve, Resolver404
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'unicoders.settings')
+
+wsgi_application = get_wsgi_application()
+
+from django.conf import settings  # noqa: E402 (needs the settings module set first)
+
+# One pool for PDF/report views, one for everything else
+heavy_executor = ThreadPoolExecutor(max_workers=settings.HEAVY_WORKERS, thread_name_prefix='heavy')
+fast_executor = ThreadPoolExecutor(max_workers=settings.FAST_WORKERS, thread_name_prefix='fast')
+
+
+def heavy(path):
+    """Whether or not a request path goes to one of the heavy views"""
+    try:
+        return resolve(path).url_name in settings.HEAVY_VIEWS
+    except Resolver404:
+        return False
+
+
+class OffloadInstance(WsgiToAsgiInstance):
+    """
+    Runs one request of the WSGI application on the given thread pool
+    instead of the single shared thread asgiref uses by default.
+    """
+
+    def __init__(self, wsgi_application, executor):
+        super().__init__(wsgi_application)
+        self.executor = executor
+
+    async def run_wsgi_app(self, body):
+        run = WsgiToAsgiInstance.run_wsgi_app.__wrapped__
+        await sync_to_async(run, thread_sensitive=False, executor=self.executor)(self, body)
+
+    def start_response(self, status, response_headers, exc_info=None):
+        # Django writes Set-Cookie values with a leading space, which WSGI
+        # servers strip but h11 rejects, dropping the connection
+        return super().start_response(status, [(k, v.strip()) for k, v in response_headers], exc_info)
+
+
+async def application(scope, receive, send):
+    """The ASGI application. Picks a thread pool for each HTTP request."""
+    if scope['type'] == 'lifespan':
+        # Nothing to set up or tear down, just acknowledge the server
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+    executor = heavy_executor if heavy(scope['path']) else fast_executor
+    await OffloadInstance(wsgi_application, executor)(scope, receive, send)
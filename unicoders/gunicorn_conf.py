@@ -0,0 +1,19 @@
+"""
+Gunicorn config for unicoders project. Run the server with
+
+    gunicorn -c python:unicoders.gunicorn_conf unicoders.asgi:application
+
+The app is loaded once in the master process and warmed up there, so
+every worker forked from it starts with its urls and templates compiled.
+The bind address and worker count still come from $PORT and
+$WEB_CONCURRENCY.
+"""
+
+worker_class = 'uvicorn.workers.UvicornWorker'
+preload_app = True
+
+
+def when_ready(server):
+    """Runs in the master once the app is loaded, before any worker is forked"""
+    from unicoders.warmup import warm_up
+    server.log.info('Warmed up app in %.3fs', warm_up())
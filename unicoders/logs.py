@@ -0,0 +1,150 @@
+"""
+Logging that stays off the request thread. Records are handed to a queue
+and written as JSON lines by a background thread, so a slow stdout never
+holds up a request. Each record carries the id, method, and path of the
+request it was logged in, and how long that request had been running.
+
+Messages use lazy %-style arguments, e.g.
+
+    logger.info('Check #%s has been edited', check.number)
+
+so nothing is formatted for records below the logger's level.
+"""
+
+from logging.handlers import QueueHandler, QueueListener
+import atexit
+import copy
+import datetime
+import json
+import logging
+import os
+import queue
+import random
+import threading
+import time
+import zlib
+
+# The request being handled on this thread
+_context = threading.local()
+
+# Attributes of a record that are written to the JSON when they are set
+EXTRA_FIELDS = ['request_id', 'method', 'path', 'elapsed_ms', 'status', 'user']
+
+
+def start_request(request_id, method, path):
+    """Sets the request that records logged on this thread belong to"""
+    _context.request = {'request_id': request_id, 'method': method, 'path': path, 'start': time.monotonic()}
+
+
+def end_request():
+    """Clears the request once it has been handled"""
+    _context.request = None
+
+
+def current_request():
+    """The request being handled on this thread, or None"""
+    return getattr(_context, 'request', None)
+
+
+class RequestContextFilter(logging.Filter):
+    """Adds the request id, method, path, and elapsed time to every record"""
+
+    def filter(self, record):
+        request = current_request()
+        if request:
+            for key in ('request_id', 'method', 'path'):
+                if not hasattr(record, key):
+                    setattr(record, key, request[key])
+            record.elapsed_ms = round((time.monotonic() - request['start']) * 1000, 1)
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Keeps only a fraction of the INFO (and DEBUG) records. Warnings and
+    errors are always kept. Records are sampled by request, so a request
+    keeps either all of its records or none of them.
+    """
+
+    def __init__(self, rate=1.0):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        if self.rate >= 1 or record.levelno > logging.INFO:
+            return True
+        request_id = getattr(record, 'request_id', None)
+        if request_id:
+            return zlib.crc32(request_id.encode('utf-8')) % 10000 < self.rate * 10000
+        return random.random() < self.rate
+
+
+class JsonFormatter(logging.Formatter):
+    """Formats a record as one line of JSON"""
+
+    def format(self, record):
+        data = {
+            'time': datetime.datetime.fromtimestamp(record.created, datetime.timezone.utc).isoformat(),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        for key in EXTRA_FIELDS:
+            if getattr(record, key, None) is not None:
+                data[key] = getattr(record, key)
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            data['exception'] = record.exc_text
+        return json.dumps(data, default=str)
+
+
+class QueueStreamHandler(QueueHandler):
+    """
+    Puts records on a queue that a background thread writes to a stream.
+    The formatter set on this handler is used by the background thread.
+    Threads don't survive a fork, so a process forked after the handler
+    was made (a gunicorn worker of a preloaded app) starts its own thread
+    and queue the first time it logs.
+    """
+
+    def __init__(self, stream=None):
+        super().__init__(None)
+        self.target = logging.StreamHandler(stream)
+        self.pid = None
+        self.start()
+        atexit.register(self.stop)  # Writes out whatever is still queued
+
+    def start(self):
+        """Starts the background thread of this process, with its own queue"""
+        self.queue = queue.SimpleQueue()
+        self.listener = QueueListener(self.queue, self.target)
+        self.listener.start()
+        self.pid = os.getpid()
+
+    def stop(self):
+        """Writes out whatever is still queued and stops the background thread"""
+        if self.pid == os.getpid():
+            self.listener.stop()
+            self.pid = None
+
+    def enqueue(self, record):
+        # Called with the handler's lock held, so only one thread starts the listener
+        if self.pid != os.getpid():
+            self.start()
+        super().enqueue(record)
+
+    def setFormatter(self, fmt):
+        self.target.setFormatter(fmt)
+
+    def prepare(self, record):
+        """
+        Merges the arguments into the message on the request thread, since
+        they may be objects that aren't safe to use from another thread
+        """
+        record = copy.copy(record)
+        record.msg, record.args = record.getMessage(), None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
@@ -12,6 +12,7 @@ https://docs.djangoproject.com/en/2.1/ref/settings/
 
 import os
 import logging.config
+import dj_database_url
 import django_heroku
 
 # Build paths inside the project like this: os.path.join(BASE_DIR, ...)
@@ -41,17 +42,19 @@ INSTALLED_APPS = [
     'django.contrib.staticfiles',
     'checkit.apps.CheckitConfig',
     'sass_processor',
-    'chartit',
 ]
 
 MIDDLEWARE = [
+    'checkit.middleware.RequestLogMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'checkit.middleware.AuditMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'checkit.middleware.ReplicaMiddleware',
 ]
 
 ROOT_URLCONF = 'unicoders.urls'
@@ -80,6 +83,12 @@ STATICFILES_FINDERS = [
 
 WSGI_APPLICATION = 'unicoders.wsgi.application'
 
+# Thread pools for the ASGI entry point (unicoders/asgi.py). Requests to
+# the heavy views (PDFs and reports) share their own small pool.
+HEAVY_VIEWS = ['letter', 'check_letter1', 'check_letter2', 'check_letter3', 'report']
+HEAVY_WORKERS = int(os.environ.get('HEAVY_WORKERS', 2))
+FAST_WORKERS = int(os.environ.get('FAST_WORKERS', 8))
+
 
 # Database
 # https://docs.djangoproject.com/en/2.1/ref/settings/#databases
@@ -99,20 +108,32 @@ DATABASES = {
 }
 
 #Logging
+# The fraction of INFO records to keep, e.g. 0.1 to log one request in ten
+LOG_SAMPLE_RATE = float(os.environ.get('LOG_SAMPLE_RATE', 1))
 LOGGING_CONFIG = None
 logging.config.dictConfig({
     'version': 1,
     'disable_existing_loggers': False,
     'formatters': {
-        'console': {
-            # exact format is not important, this is the minimum information
-            'format': '%(asctime)s %(name)-12s %(levelname)-8s %(message)s',
+        'json': {
+            '()': 'unicoders.logs.JsonFormatter',
+        },
+    },
+    'filters': {
+        'request': {
+            '()': 'unicoders.logs.RequestContextFilter',
+        },
+        'sample': {
+            '()': 'unicoders.logs.SamplingFilter',
+            'rate': LOG_SAMPLE_RATE,
         },
     },
     'handlers': {
         'console': {
-            'class': 'logging.StreamHandler',
-            'formatter': 'console',
+            # written to stderr by a background thread, not the request thread
+            'class': 'unicoders.logs.QueueStreamHandler',
+            'formatter': 'json',
+            'filters': ['request', 'sample'],
         },
     },
     'loggers': {
@@ -159,5 +180,56 @@ SASS_PROCESSOR_ROOT = STATIC_URL[1:]
 
 LOGIN_REDIRECT_URL = '/'
 
+# Rows deleted per transaction when deleting companies, accounts, and users.
+# Anything bigger than one batch is left to manage.py process_deletions.
+DELETION_BATCH_SIZE = 500
+
+# Checks paid more than this many days ago are moved to the archive by manage.py archive_checks
+CHECK_ARCHIVE_DAYS = int(os.environ.get('CHECK_ARCHIVE_DAYS', 365))
+
+# The account typeahead keeps this many prefixes per company in each worker, for this many seconds
+TYPEAHEAD_CACHE_SIZE = 256
+TYPEAHEAD_CACHE_SECONDS = 60
+
+# How often the dashboard numbers are recomputed by manage.py refresh_kpis --loop
+KPI_REFRESH_SECONDS = int(os.environ.get('KPI_REFRESH_SECONDS', 300))
+
+# The rendered rows of the check index are kept in the 'rows' cache (see checkit/rows.py).
+# Each worker keeps its own by default; set ROW_CACHE_BACKEND and ROW_CACHE_LOCATION to share one.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'rows': {
+        'BACKEND': os.environ.get('ROW_CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('ROW_CACHE_LOCATION', 'check-rows'),
+        'OPTIONS': {'MAX_ENTRIES': int(os.environ.get('ROW_CACHE_SIZE', 10000))},
+    },
+}
+
+# Seconds a cached check row is kept, at most (a changed check, account, or company gets a new row right away)
+ROW_CACHE_SECONDS = int(os.environ.get('ROW_CACHE_SECONDS', 3600))
+
+# Where manage.py export_letters writes the mail-merge files for the print house
+LETTER_OUTBOX = os.environ.get('LETTER_OUTBOX', os.path.join(BASE_DIR, 'outbox'))
+
+# Whether letter PDFs are compacted by default (can be overridden with ?compact=0/1)
+COMPACT_PDF = False
+
 # Set up Heroku if it's running
-django_heroku.settings(locals())
\ No newline at end of file
+django_heroku.settings(locals())
+
+# Read replicas, from REPLICA_DATABASE_URLS (comma separated). GET requests
+# to the read-only views in REPLICA_VIEWS read from them, except for users
+# who posted a change in the last REPLICA_PIN_SECONDS (see checkit/routers.py).
+REPLICA_DATABASES = []
+for i, url in enumerate(x.strip() for x in os.environ.get('REPLICA_DATABASE_URLS', '').split(',') if x.strip()):
+    alias = 'replica{}'.format(i + 1)
+    DATABASES[alias] = dj_database_url.parse(url, conn_max_age=600)
+    DATABASES[alias]['TEST'] = {'MIRROR': 'default'}
+    REPLICA_DATABASES.append(alias)
+DATABASE_ROUTERS = ['checkit.routers.ReplicaRouter']
+REPLICA_VIEWS = ['check_index', 'account_index', 'account_check_index', 'company_index', 'user_index',
+                 'user_check_index', 'deletion_index', 'account_typeahead', 'report', 'report_chart', 'aging',
+                 'api_companies', 'api_accounts', 'api_checks', 'api_payments']
+REPLICA_PIN_SECONDS = 10
@@ -0,0 +1,64 @@
+"""
+Warms up a freshly loaded app before it serves any requests. The url
+patterns and all the templates are compiled ahead of time, so the first
+requests to a worker don't have to. Nothing here touches the database,
+so it is safe to run before gunicorn forks its workers.
+"""
+
+import logging
+import os
+import time
+
+from django.template import engines, TemplateDoesNotExist, TemplateSyntaxError
+from django.urls import get_resolver, URLResolver
+
+logger = logging.getLogger(__name__)
+
+
+def compile_urls(resolver=None):
+    """
+    Compiles the regular expression of every url pattern
+    :param resolver: The resolver to compile, the root resolver by default
+    :return: The number of patterns compiled
+    """
+    resolver = resolver or get_resolver()
+    resolver.reverse_dict  # Builds the lookup table used by reverse() and {% url %}
+    count = 0
+    for pattern in resolver.url_patterns:
+        pattern.pattern.regex
+        count += 1
+        if isinstance(pattern, URLResolver):
+            count += compile_urls(pattern)
+    return count
+
+
+def compile_templates():
+    """
+    Loads every template so it ends up in the cached template loader
+    :return: The number of templates compiled
+    """
+    count = 0
+    for engine in engines.all():
+        for directory in engine.template_dirs:
+            for root, dirs, files in os.walk(directory):
+                for file in files:
+                    name = os.path.relpath(os.path.join(root, file), directory).replace(os.sep, '/')
+                    try:
+                        engine.get_template(name)
+                        count += 1
+                    except (TemplateDoesNotExist, TemplateSyntaxError, UnicodeDecodeError):
+                        logger.debug('Skipped template %s during warm up', name)
+    return count
+
+
+def warm_up():
+    """
+    Compiles the urls and templates
+    :return: How long the warm up took, in seconds
+    """
+    start = time.perf_counter()
+    urls = compile_urls()
+    templates = compile_templates()
+    seconds = time.perf_counter() - start
+    logger.info('Compiled %d url patterns and %d templates in %.3fs', urls, templates, seconds)
+    return seconds